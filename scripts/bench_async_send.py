@@ -0,0 +1,114 @@
+"""
+Benchmark: confirm_send throughput against a local Graph stand-in that
+injects latency, comparing one-at-a-time sends with many sends in flight.
+Usage: uv run scripts/bench_async_send.py [sends] [latency_ms] [concurrency]
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import auth, drafts, graph_client, rate_limit  # noqa: E402
+from tools.email_flow import register as register_email_flow  # noqa: E402
+
+LATENCY_SECONDS = 0.1
+
+
+class SlowGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY_SECONDS)
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlowGraphServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class LocalMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+async def _fake_token():
+    return {"access_token": "bench-token"}
+
+
+async def _run(tools, sends, concurrency):
+    prepare = tools["prepare_email"]
+    confirm = tools["confirm_send"]
+    draft_ids = [
+        prepare(to=["bench@example.com"], subject="Bench", body=".")["draft_id"]
+        for _ in range(sends)
+    ]
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(draft_id):
+        async with gate:
+            result = await confirm(draft_id)
+            assert "sent successfully" in result, result
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(d) for d in draft_ids))
+    return time.perf_counter() - start
+
+
+def main():
+    global LATENCY_SECONDS
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    LATENCY_SECONDS = (int(sys.argv[2]) if len(sys.argv) > 2 else 100) / 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    server = SlowGraphServer(("127.0.0.1", 0), SlowGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    graph_client.GRAPH_API_URL = f"http://127.0.0.1:{server.server_port}/v1.0"
+    graph_client.GRAPH_MAX_CONNECTIONS = concurrency
+    graph_client.GRAPH_MAX_KEEPALIVE_CONNECTIONS = concurrency
+    auth.get_token_async = _fake_token
+    # Measure the send path, not the per-mailbox sending limits
+    rate_limit.limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=10**6, recipients_per_day=10**9
+    )
+
+    # Every draft is prepared up front in one session, above the default quota
+    drafts.store = drafts.DraftStore(
+        max_count=sends + sends // 10, session_max_count=sends + sends // 10
+    )
+
+    mcp = LocalMCP()
+    register_email_flow(mcp)  # type: ignore
+
+    async def bench():
+        serial = await _run(mcp.tools, sends // 10, 1)
+        parallel = await _run(mcp.tools, sends, concurrency)
+        await graph_client.aclose_async_client()
+        return serial, parallel
+
+    serial, parallel = asyncio.run(bench())
+    server.shutdown()
+
+    print(f"graph latency: {LATENCY_SECONDS * 1000:.0f} ms")
+    print(f"one in flight:     {sends // 10 / serial:8.1f} sends/s")
+    print(f"{concurrency:3d} in flight:     {sends / parallel:8.1f} sends/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: a mail-out of one message with the same attachment to many
+recipients (one send each), with the attachment cache disabled vs. enabled,
+against a local Graph stand-in.
+Usage: uv run scripts/bench_attachment_cache.py [sends] [attachment_kib]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+import httpx
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import attachment_cache, attachments, graph_client  # noqa: E402
+
+
+class CountingGraph(httpx.AsyncBaseTransport):
+    """Accepts sendMail, consuming the body as a stream like a real socket."""
+
+    async def handle_async_request(self, request):
+        async for _ in request.stream:
+            pass
+        return httpx.Response(202)
+
+
+def _run(path, sends, cache):
+    attachments.ATTACHMENT_DIR = os.path.dirname(path)
+    drafts = {
+        f"d{i}": {
+            "to": [f"user{i}@example.com"],
+            "subject": "Brochure",
+            "body": "Please find the brochure attached.",
+            "attachments": attachments.describe([path]),
+        }
+        for i in range(sends)
+    }
+    encoded = 0
+    original = attachments.iter_base64
+
+    def counting_iter_base64(item, *args, **kwargs):
+        nonlocal encoded
+        for chunk in original(item, *args, **kwargs):
+            encoded += len(chunk)
+            yield chunk
+
+    async def main():
+        graph_client._async_client = httpx.AsyncClient(transport=CountingGraph())
+        graph_client._async_client_loop = asyncio.get_running_loop()
+        try:
+            return await graph_client.send_mail_batch_async("bench-token", drafts)
+        finally:
+            await graph_client.aclose_async_client()
+
+    with (
+        patch.object(attachment_cache, "cache", cache),
+        patch.object(attachments, "iter_base64", counting_iter_base64),
+    ):
+        start = time.perf_counter()
+        outcomes = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+    assert all(error is None for error in outcomes.values())
+    return elapsed, encoded
+
+
+def main():
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    size_kib = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "brochure.pdf")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size_kib * 1024))
+
+        print(f"{sends} sends of one {size_kib} KiB attachment\n")
+        print(f"{'cache':<10}{'time s':>8}{'encoded MiB':>13}{'hit rate':>10}")
+        for name, max_bytes in (("disabled", 0), ("enabled", 64 * 1024 * 1024)):
+            cache = attachment_cache.AttachmentCache(
+                max_bytes=max_bytes, directory=os.path.join(tmp, "spill")
+            )
+            elapsed, encoded = _run(path, sends, cache)
+            stats = cache.stats()
+            print(
+                f"{name:<10}{elapsed:>8.2f}{encoded / 2**20:>13.1f}"
+                f"{stats['hit_rate']:>10.3f}"
+            )
+            if max_bytes:
+                saved = stats["bytes_saved"] / 2**20
+                print(f"\nbytes_saved: {saved:.1f} MiB, misses: {stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: peak RSS while uploading a large attachment to a local upload
+session stand-in, reading the whole file first vs. streaming chunks from disk.
+Usage: uv run scripts/bench_attachment_upload.py [size_mb]
+
+Each variant runs in its own process so peak RSS (ru_maxrss) is not shared.
+"""
+
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import attachments, graph_client  # noqa: E402
+
+UPLOAD_URL = "https://upload.example.test/session/1"
+
+
+class DiscardingUploadSession(httpx.AsyncBaseTransport):
+    """
+    Acknowledges every range and keeps only a byte count. Like a real
+    connection it consumes the request body as a stream (httpx.MockTransport
+    would buffer it).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.received = 0
+
+    async def handle_async_request(self, request):
+        async for part in request.stream:
+            self.received += len(part)
+        if self.received >= self.size:
+            return httpx.Response(201)
+        return httpx.Response(200, json={"nextExpectedRanges": [f"{self.received}-"]})
+
+
+async def _whole_file(item, chunk_size):
+    # The naive path: load the file, then slice it into ranges
+    with open(item["path"], "rb") as f:
+        data = f.read()
+    client = graph_client.get_async_client()
+    for offset in range(0, len(data), chunk_size):
+        chunk = data[offset : offset + chunk_size]
+        end = offset + len(chunk) - 1
+        await client.put(
+            UPLOAD_URL,
+            headers={"Content-Range": f"bytes {offset}-{end}/{len(data)}"},
+            content=chunk,
+        )
+
+
+async def _streamed(item, chunk_size):
+    await graph_client.upload_attachment_async(UPLOAD_URL, item, chunk_size)
+
+
+def _run(variant, path):
+    attachments.ATTACHMENT_DIR = os.path.dirname(path)
+    item = attachments.describe([path], inline_max_bytes=0)[0]
+    chunk_size = attachments.ATTACHMENT_UPLOAD_CHUNK_BYTES
+    server = DiscardingUploadSession(item["size"])
+
+    async def main():
+        graph_client._async_client = httpx.AsyncClient(transport=server)
+        graph_client._async_client_loop = asyncio.get_running_loop()
+        fn = _whole_file if variant == "whole-file" else _streamed
+        try:
+            await fn(item, chunk_size)
+        finally:
+            await graph_client.aclose_async_client()
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    assert server.received == item["size"]
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    print(f"{variant},{peak_rss},{elapsed}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--variant":
+        _run(sys.argv[2], sys.argv[3])
+        return
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    chunk_kib = attachments.ATTACHMENT_UPLOAD_CHUNK_BYTES // 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "attachment.bin")
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        print(f"{size_mb} MiB attachment, {chunk_kib} KiB chunks\n")
+        print(f"{'variant':<14}{'peak RSS MiB':>14}{'upload s':>10}")
+        for variant in ("whole-file", "streamed"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            name, rss, elapsed = out.strip().split(",")
+            print(f"{name:<14}{int(rss) / 2**20:>14.1f}{float(elapsed):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
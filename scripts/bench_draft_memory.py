@@ -0,0 +1,106 @@
+"""
+Benchmark: resident memory of 10k drafts that share a handful of bodies
+(one announcement sent to many recipient groups), with one copy of each body
+per draft vs. the content-addressed DraftStore.
+Usage: uv run scripts/bench_draft_memory.py [drafts] [distinct_bodies]
+
+Each variant runs in its own process so peak RSS (ru_maxrss) is not shared.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import drafts  # noqa: E402
+
+
+def _bodies(distinct):
+    paragraph = (
+        "Hello everyone, this is a reminder about the quarterly planning session. "
+        "Please review the attached agenda and come prepared with your updates. "
+    )
+    return [f"Announcement #{i}\n\n" + paragraph * 150 for i in range(distinct)]
+
+
+def _draft(i, bodies):
+    # A new str per draft, as if each arrived in its own prepare_email call
+    body = bodies[i % len(bodies)]
+    return {
+        "to": [f"group{i}@example.com"],
+        "cc": [],
+        "bcc": [],
+        "subject": "Quarterly planning",
+        "body": body.encode().decode(),
+        "content_type": "Text",
+    }
+
+
+def _run(variant, count, distinct):
+    bodies = _bodies(distinct)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if variant == "copies":
+        # The previous layout: every draft keeps its own body
+        store = {}
+        for i in range(count):
+            store[str(i)] = (time.time(), _draft(i, bodies))
+    else:
+        # Caps and quotas count logical size; lift them to hold every draft
+        store = drafts.DraftStore(
+            max_count=count,
+            session_max_count=count,
+            max_bytes=2**40,
+            session_max_bytes=2**40,
+        )
+        for i in range(count):
+            store.create_draft(_draft(i, bodies))
+    elapsed = time.perf_counter() - start
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    print(f"{variant},{heap},{peak_rss},{elapsed}")
+    if variant == "content-addressed":
+        print(store.stats()["bodies"], file=sys.stderr)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--variant":
+        _run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    body_kib = len(_bodies(1)[0].encode()) / 1024
+    print(f"{count} drafts, {distinct} distinct bodies of ~{body_kib:.0f} KiB\n")
+    print(f"{'variant':<20}{'heap MiB':>10}{'peak RSS MiB':>14}{'create s':>10}")
+    for variant in ("copies", "content-addressed"):
+        out = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--variant",
+                variant,
+                str(count),
+                str(distinct),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        name, heap, rss, elapsed = out.strip().split(",")
+        print(
+            f"{name:<20}{int(heap) / 2**20:>10.1f}{int(rss) / 2**20:>14.1f}"
+            f"{float(elapsed):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: per-send latency against a local fake Graph server,
+with the shared keep-alive client vs. a fresh connection per send.
+Usage: uv run scripts/bench_graph_pool.py [sends]
+
+The fake server speaks plain HTTP, so the difference shown here is only the
+TCP handshake; against graph.microsoft.com the TLS handshake widens the gap.
+"""
+
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import graph_client  # noqa: E402
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 3),
+    }
+
+
+def _run(sends):
+    draft = {"to": ["bench@example.com"], "subject": "Bench", "body": "x" * 500}
+    samples = []
+    for _ in range(sends):
+        start = time.perf_counter()
+        graph_client.send_mail("bench-token", draft)
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+
+def main():
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    graph_client.GRAPH_API_URL = f"http://127.0.0.1:{server.server_port}/v1.0"
+
+    pooled = _run(sends)
+    graph_client.close_client()
+
+    # One connection per send, like the previous module-level requests.post()
+    original = graph_client.get_client
+    graph_client.get_client = lambda: httpx.Client(
+        headers={"Connection": "close"}, **graph_client._client_options()
+    )
+    try:
+        unpooled = _run(sends)
+    finally:
+        graph_client.get_client = original
+        server.shutdown()
+
+    print(f"sends per mode: {sends}")
+    print(f"pooled:   {pooled}")
+    print(f"unpooled: {unpooled}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: memory of sendMail requests with inline attachments, building
+the payload in memory (read -> base64 str -> dict -> json=) vs. the streamed
+StreamedJsonBody, against a local Graph stand-in.
+Usage: uv run scripts/bench_inline_payload.py [attachment_kib] [concurrent_sends]
+
+Each variant runs in its own process so peak RSS (ru_maxrss) is not shared.
+"""
+
+import asyncio
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import attachments, graph_client  # noqa: E402
+
+
+class CountingGraph(httpx.AsyncBaseTransport):
+    """Accepts sendMail, consuming the body as a stream like a real socket."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_async_request(self, request):
+        async for part in request.stream:
+            self.received += len(part)
+        return httpx.Response(202)
+
+
+async def _buffered(token, draft):
+    # The previous path: every layer holds a full copy of the attachment
+    url, headers, payload = graph_client._build_send_mail_request(token, draft)
+    resources = []
+    for item in draft["attachments"]:
+        with open(item["path"], "rb") as f:
+            content = f.read()
+        resources.append(
+            {
+                "@odata.type": "#microsoft.graph.fileAttachment",
+                "name": item["name"],
+                "contentType": item["content_type"],
+                "contentBytes": base64.b64encode(content).decode("ascii"),
+            }
+        )
+    payload["message"]["attachments"] = resources
+    response = await graph_client.get_async_client().post(
+        url, headers=headers, json=payload
+    )
+    response.raise_for_status()
+
+
+async def _streamed(token, draft):
+    await graph_client.send_mail_async(token, draft)
+
+
+def _run(variant, path, sends):
+    attachments.ATTACHMENT_DIR = os.path.dirname(path)
+    draft = {
+        "to": ["bench@example.com"],
+        "subject": "Bench",
+        "body": ".",
+        "attachments": attachments.describe([path]),
+    }
+    graph = CountingGraph()
+    fn = _buffered if variant == "buffered" else _streamed
+
+    async def main():
+        graph_client._async_client = httpx.AsyncClient(transport=graph)
+        graph_client._async_client_loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(fn("bench-token", draft) for _ in range(sends)))
+        finally:
+            await graph_client.aclose_async_client()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    print(f"{variant},{heap_peak},{peak_rss},{elapsed},{graph.received}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--variant":
+        _run(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    size_kib = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    sends = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "brochure.pdf")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size_kib * 1024))
+
+        print(f"{sends} concurrent sends, one {size_kib} KiB inline attachment each\n")
+        print(
+            f"{'variant':<10}{'heap peak MiB':>15}{'per send MiB':>14}"
+            f"{'peak RSS MiB':>14}{'time s':>8}"
+        )
+        for variant in ("buffered", "streamed"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, path, str(sends)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            name, heap, rss, elapsed, _ = out.strip().split(",")
+            print(
+                f"{name:<10}{int(heap) / 2**20:>15.1f}"
+                f"{int(heap) / sends / 2**20:>14.2f}"
+                f"{int(rss) / 2**20:>14.1f}{float(elapsed):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
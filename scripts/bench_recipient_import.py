@@ -0,0 +1,97 @@
+"""
+Benchmark: importing a large CSV recipient list into a send plan, against
+the naive approach (read every row, keep a set of the addresses).
+Usage: uv run scripts/bench_recipient_import.py [rows]
+
+Each variant runs in its own process so peak RSS (ru_maxrss) is not shared.
+The list has ~5% duplicates and ~1% invalid addresses.
+"""
+
+import csv
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import mail_preview, recipient_import  # noqa: E402
+
+
+def _write_list(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "name"])
+        for i in range(rows):
+            if i % 100 == 7:
+                writer.writerow([f"broken-{i}", "x"])
+            elif i % 20 == 3:
+                writer.writerow([f" User{i - 1}@Example{(i - 1) % 50}.com", "dup"])
+            else:
+                writer.writerow([f"user{i}@example{i % 50}.com", f"User {i}"])
+
+
+def _naive(path):
+    # Everything in memory: all rows, then a set of the addresses
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    seen = set()
+    accepted = []
+    for row in rows:
+        address = (row.get("email") or "").strip()
+        if not address or not mail_preview._is_valid_email(address):
+            continue
+        if address.lower() in seen or not mail_preview._domain_allowed(address):
+            continue
+        seen.add(address.lower())
+        accepted.append(address)
+    return len(accepted)
+
+
+def _streamed(path):
+    recipient_import.RECIPIENT_IMPORT_DIR = os.path.dirname(path)
+    return recipient_import.build_send_plan(path, path + ".plan.jsonl")["accepted"]
+
+
+def _run(variant, path):
+    fn = _naive if variant == "naive" else _streamed
+    start = time.perf_counter()
+    accepted = fn(path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    print(f"{variant},{peak_rss},{elapsed},{accepted}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--variant":
+        _run(sys.argv[2], sys.argv[3])
+        return
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "recipients.csv")
+        _write_list(path, rows)
+        size_mib = os.path.getsize(path) / 2**20
+        print(f"{rows} rows, {size_mib:.1f} MiB CSV\n")
+        print(f"{'variant':<10}{'peak RSS MiB':>14}{'time s':>8}{'accepted':>10}")
+        for variant in ("naive", "streamed"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            name, rss, elapsed, accepted = out.strip().split(",")
+            print(
+                f"{name:<10}{int(rss) / 2**20:>14.1f}{float(elapsed):>8.2f}"
+                f"{int(accepted):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
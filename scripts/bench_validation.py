@@ -0,0 +1,85 @@
+"""
+Benchmark: recipient validation of large lists, comparing the previous
+multi-pass checks (normalize, then regex per check, then domain split) with
+the single-pass validation engine.
+Usage: uv run scripts/bench_validation.py [recipients] [rounds]
+"""
+
+import os
+import re
+import sys
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import config, validation  # noqa: E402
+from tools.mail_preview import _normalize_emails  # noqa: E402
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+ALLOWED = frozenset(f"partner{i}.com" for i in range(20))
+# Built once per config snapshot in the server, and so here
+POLICY = config.MailerConfig(allowed_domains=ALLOWED).allowlist_policy
+
+
+def _legacy(to, cc, bcc):
+    """The checks as preview_email and prepare_email used to run them."""
+
+    def valid(e):
+        return bool(_EMAIL_RE.match(e.strip()))
+
+    def allowed(e):
+        parts = e.split("@")
+        return len(parts) == 2 and parts[1].lower() in ALLOWED
+
+    all_rcpts = _normalize_emails(to) + _normalize_emails(cc) + _normalize_emails(bcc)
+    invalid = [e for e in all_rcpts if not valid(e)]
+    blocked = [e for e in all_rcpts if valid(e) and not allowed(e)]
+    # prepare_email then repeated the same checks with any()
+    any(not valid(e) for e in all_rcpts)
+    any(not allowed(e) for e in all_rcpts)
+    return invalid, blocked
+
+
+def _engine(to, cc, bcc):
+    result = validation.validate_message(
+        to,
+        "Subject",
+        "Body",
+        cc,
+        bcc,
+        policy=POLICY,
+        max_recipients=10**9,
+        max_body_chars=10**9,
+    )
+    return result.invalid, result.blocked
+
+
+def _recipients(n):
+    rcpts = [f" User{i}@Partner{i % 40}.com " for i in range(n)]
+    # A few invalid and duplicate entries, as real pasted lists have
+    rcpts += ["not-an-email", "user1@partner1.com", ""] * (n // 100)
+    return rcpts
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    to = _recipients(n)
+    cc = _recipients(n // 10)
+    assert _legacy(to, cc, []) == _engine(to, cc, [])
+
+    print(f"{len(to) + len(cc)} recipients, {rounds} rounds\n")
+    for name, fn in (("multi-pass", _legacy), ("single-pass", _engine)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn(to, cc, [])
+        per_call = (time.perf_counter() - start) / rounds
+        print(
+            f"{name:<12} {per_call * 1000:8.2f} ms/call"
+            f" {per_call / (len(to) + len(cc)) * 1e6:8.3f} us/recipient"
+        )
+
+
+if __name__ == "__main__":
+    main()
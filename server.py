@@ -1,15 +1,50 @@
+import asyncio
 import os
+import signal
+from contextlib import asynccontextmanager
 from fastmcp import FastMCP
 from dotenv import load_dotenv
 
+# The real environment, before .env fills in what it lacks; config reloads
+# layer .env under it the same way
+_environ = dict(os.environ)
 load_dotenv()
 
 from tools.mail_preview import register as register_mail_preview  # noqa: E402
 from tools.email_flow import register as register_email_flow  # noqa: E402
+from tools.recipient_import import register as register_recipient_import  # noqa: E402
 from tools.auth_status import register as register_auth_status  # noqa: E402
+from tools.graph_status import register as register_graph_status  # noqa: E402
 from tools.test_tools import register as register_test_tools  # noqa: E402
+from tools import auth, config, drafts, outbox  # noqa: E402
 
-mcp = FastMCP("My MCP Server")
+config.runtime.environ = _environ
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Starts background tasks (draft reaper, optional ones) for the lifetime of the server."""
+    loop = asyncio.get_running_loop()
+    # `kill -HUP <pid>` reloads the mailer config (not available on Windows)
+    hup = getattr(signal, "SIGHUP", None)
+    if hup is not None:
+        loop.add_signal_handler(hup, config.runtime.reload_from_signal)
+    tasks = [asyncio.create_task(drafts.store.run_reaper())]
+    if os.getenv("ENABLE_TOKEN_REFRESHER") == "1":
+        tasks.append(asyncio.create_task(auth.refresher.run()))
+    if outbox.OUTBOX_ENABLED:
+        tasks.append(asyncio.create_task(outbox.workers.run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if hup is not None:
+            loop.remove_signal_handler(hup)
+
+
+mcp = FastMCP("My MCP Server", lifespan=lifespan)
 
 
 if os.getenv("ENABLE_TEST_TOOLS") == "1":
@@ -17,7 +52,9 @@ if os.getenv("ENABLE_TEST_TOOLS") == "1":
 
 register_mail_preview(mcp)
 register_email_flow(mcp)
+register_recipient_import(mcp)
 register_auth_status(mcp)
+register_graph_status(mcp)
 
 if __name__ == "__main__":
     mcp.run(transport="http", port=8000)
@@ -14,3 +14,51 @@ from fastmcp import FastMCP
 def mcp():
     server = FastMCP("Test Server")
     return server
+
+
+# Retries sleep for real between attempts; keep the suite fast by default.
+# Tests that exercise the backoff itself build their own RetryPolicy.
+@pytest.fixture(autouse=True)
+def fast_retries():
+    from tools import retry
+
+    original = retry.default_policy
+    retry.default_policy = retry.RetryPolicy(base_delay=0, max_delay=0)
+    yield
+    retry.default_policy = original
+
+
+# Mailbox limits are real-time token buckets; most tests send far more than
+# 30 messages a minute. Tests of the limiter itself build their own.
+@pytest.fixture(autouse=True)
+def unlimited_mailbox():
+    from tools import rate_limit
+
+    original = rate_limit.limiter
+    rate_limit.limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=10**6, recipients_per_day=10**9
+    )
+    yield
+    rate_limit.limiter = original
+
+
+# The adaptive concurrency limit learns from every response; start each test
+# from a fresh controller so earlier tests can't shrink or grow it.
+@pytest.fixture(autouse=True)
+def fresh_concurrency_limiter():
+    from tools import concurrency
+
+    original = concurrency.limiter
+    concurrency.limiter = concurrency.AdaptiveLimiter()
+    yield
+    concurrency.limiter = original
+
+
+# Tests may swap in or reload a mailer config; put the original back.
+@pytest.fixture(autouse=True)
+def restore_mailer_config():
+    from tools import config
+
+    original = config.runtime.current()
+    yield
+    config.runtime.swap(original)
@@ -0,0 +1,177 @@
+import asyncio
+import base64
+import json
+import os
+import threading
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from tools import attachment_cache, attachments, graph_client
+
+
+def _file(tmp_path, name, size, content=None):
+    path = tmp_path / name
+    path.write_bytes(content if content is not None else os.urandom(size))
+    return str(path)
+
+
+def _item(path):
+    (item,) = attachments.describe([path])
+    return item
+
+
+@pytest.fixture(autouse=True)
+def attachment_dir(tmp_path):
+    with patch.object(attachments, "ATTACHMENT_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = attachment_cache.AttachmentCache(
+        max_bytes=1 << 20, disk_max_bytes=1 << 20, directory=str(tmp_path / "spill")
+    )
+    yield c
+    c.clear()
+
+
+def _encoded(cache, item):
+    return b"".join(cache.iter_encoded(item))
+
+
+def test_same_content_is_encoded_once(tmp_path, cache):
+    content = os.urandom(10_000)
+    first = _item(_file(tmp_path, "terms.pdf", 0, content))
+    # Same bytes under another name share the entry
+    copy = _item(_file(tmp_path, "copy.pdf", 0, content))
+    assert first["sha256"] == copy["sha256"]
+
+    assert base64.b64decode(_encoded(cache, first)) == content
+    assert _encoded(cache, copy) == _encoded(cache, first)
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 2)
+    assert stats["bytes_saved"] == 2 * len(content)
+    assert stats["hit_rate"] == round(2 / 3, 4)
+
+
+def test_lru_spills_to_disk_and_reads_back(tmp_path):
+    size = 30_000
+    cache = attachment_cache.AttachmentCache(
+        max_bytes=attachments.encoded_size(size),
+        disk_max_bytes=1 << 20,
+        directory=str(tmp_path / "spill"),
+    )
+    a = _item(_file(tmp_path, "a.bin", size))
+    b = _item(_file(tmp_path, "b.bin", size))
+    expected = _encoded(cache, a)
+    _encoded(cache, b)  # pushes a out of memory, onto disk
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["disk_entries"], stats["spills"]) == (1, 1, 1)
+
+    with patch.object(attachments, "iter_base64", side_effect=AssertionError):
+        assert _encoded(cache, a) == expected
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    size = 30_000
+    encoded = attachments.encoded_size(size)
+    cache = attachment_cache.AttachmentCache(
+        max_bytes=encoded, disk_max_bytes=encoded, directory=str(tmp_path / "spill")
+    )
+    items = [_item(_file(tmp_path, f"{i}.bin", size)) for i in range(3)]
+    for item in items:
+        _encoded(cache, item)
+    stats = cache.stats()
+    assert stats["disk_entries"] == 1 and stats["disk_bytes"] <= encoded
+    assert stats["evictions"] == 1
+    assert len(os.listdir(tmp_path / "spill")) == 1
+
+
+def test_lost_spill_file_is_re_encoded(tmp_path):
+    size = 30_000
+    cache = attachment_cache.AttachmentCache(
+        max_bytes=attachments.encoded_size(size),
+        directory=str(tmp_path / "spill"),
+    )
+    a = _item(_file(tmp_path, "a.bin", size))
+    expected = _encoded(cache, a)
+    _encoded(cache, _item(_file(tmp_path, "b.bin", size)))
+    for name in os.listdir(tmp_path / "spill"):
+        os.remove(tmp_path / "spill" / name)
+
+    assert _encoded(cache, a) == expected
+    assert cache.stats()["misses"] == 3
+
+
+def test_concurrent_misses_encode_once(tmp_path, cache):
+    item = _item(_file(tmp_path, "brochure.pdf", 200_000))
+    results = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        results.append(_encoded(cache, item))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results)) == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_oversized_and_changed_files(tmp_path):
+    cache = attachment_cache.AttachmentCache(max_bytes=100, directory=str(tmp_path))
+    item = _item(_file(tmp_path, "big.bin", 1000))
+    with open(item["path"], "rb") as f:
+        assert base64.b64decode(_encoded(cache, item)) == f.read()
+    assert cache.stats()["uncached"] == 1
+
+    with open(item["path"], "ab") as f:
+        f.write(b"x")
+    with pytest.raises(attachments.AttachmentError, match="changed"):
+        _encoded(attachment_cache.AttachmentCache(directory=str(tmp_path)), item)
+
+
+def test_bulk_sends_encode_the_attachment_once(tmp_path, cache):
+    path = _file(tmp_path, "brochure.pdf", 50_000)
+    drafts = {
+        f"d{i}": {
+            "to": [f"user{i}@example.com"],
+            "subject": "Brochure",
+            "body": ".",
+            "attachments": attachments.describe([path]),
+        }
+        for i in range(50)
+    }
+    received = []
+
+    def server(request):
+        received.append(json.loads(request.content))
+        return httpx.Response(202)
+
+    async def main():
+        graph_client._async_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(server)
+        )
+        graph_client._async_client_loop = asyncio.get_running_loop()
+        try:
+            return await graph_client.send_mail_batch_async("tkn", drafts)
+        finally:
+            await graph_client.aclose_async_client()
+
+    with patch.object(attachment_cache, "cache", cache):
+        outcomes = asyncio.run(main())
+
+    assert all(error is None for error in outcomes.values())
+    contents = {r["message"]["attachments"][0]["contentBytes"] for r in received}
+    assert len(received) == 50 and len(contents) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"]) == (1, 49)
+    assert stats["bytes_saved"] == 49 * 50_000
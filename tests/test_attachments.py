@@ -0,0 +1,368 @@
+import asyncio
+import base64
+import json
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from tools import attachments, drafts, email_flow, graph_client
+
+API = graph_client.GRAPH_API_URL
+UPLOAD_URL = "https://upload.example.test/session/1"
+CHUNK = attachments.UPLOAD_CHUNK_UNIT
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture(autouse=True)
+def attachment_dir(tmp_path):
+    with patch.object(attachments, "ATTACHMENT_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def flow_tools():
+    mcp_mock = MockMCP()
+    email_flow.register(mcp_mock)  # type: ignore
+    return mcp_mock.tools
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    drafts.store.clear()
+    yield
+    drafts.store.clear()
+
+
+class UploadSessionServer:
+    """
+    Local stand-in for the Graph draft-message + upload session endpoints.
+    `fail` maps a chunk offset to how its first PUT fails: "drop" (never
+    arrives) or "lost_reply" (stored, but the response is lost).
+    """
+
+    def __init__(self, fail=None):
+        self.fail = dict(fail or {})
+        self.received = bytearray()
+        self.size = None
+        self.puts = []
+        self.calls = []
+        self.inline = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.calls.append((request.method, url))
+        if request.method == "POST" and url == f"{API}/me/messages":
+            self.inline = json.loads(request.content).get("attachments", [])
+            return httpx.Response(201, json={"id": "msg-1"})
+        if url.endswith("/attachments/createUploadSession"):
+            item = json.loads(request.content)["AttachmentItem"]
+            self.size = item["size"]
+            return httpx.Response(201, json={"uploadUrl": UPLOAD_URL})
+        if url == UPLOAD_URL and request.method == "GET":
+            return httpx.Response(
+                200, json={"nextExpectedRanges": [f"{len(self.received)}-"]}
+            )
+        if url == UPLOAD_URL and request.method == "PUT":
+            assert "Authorization" not in request.headers
+            first, last, total = self._range(request.headers["Content-Range"])
+            self.puts.append((first, last))
+            assert first == len(self.received), "upload did not resume in order"
+            assert total == self.size
+            mode = self.fail.pop(first, None)
+            if mode == "drop":
+                raise httpx.WriteError("connection reset", request=request)
+            self.received += request.content
+            if mode == "lost_reply":
+                raise httpx.ReadError("connection reset", request=request)
+            if len(self.received) == total:
+                return httpx.Response(201)
+            return httpx.Response(
+                200, json={"nextExpectedRanges": [f"{len(self.received)}-"]}
+            )
+        if url.endswith("/msg-1/send"):
+            return httpx.Response(202)
+        if request.method == "DELETE":
+            return httpx.Response(204)
+        if url == f"{API}/me/sendMail":
+            body = json.loads(request.content)
+            self.inline = body["message"].get("attachments", [])
+            return httpx.Response(202)
+        return httpx.Response(404, json={"error": {"message": url}})
+
+    @staticmethod
+    def _range(header):
+        spans, total = header.split(" ")[1].split("/")
+        first, last = spans.split("-")
+        return int(first), int(last), int(total)
+
+
+def _run(server, coro_fn):
+    async def main():
+        graph_client._async_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(server)
+        )
+        graph_client._async_client_loop = asyncio.get_running_loop()
+        try:
+            return await coro_fn()
+        finally:
+            await graph_client.aclose_async_client()
+
+    return asyncio.run(main())
+
+
+def _file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_describe_splits_inline_and_upload(tmp_path):
+    small = _file(tmp_path, "terms.pdf", 1000)
+    big = _file(tmp_path, "video.bin", 5000)
+    items = attachments.describe([small, big], inline_max_bytes=4000)
+    assert [a["mode"] for a in items] == [attachments.INLINE, attachments.UPLOAD]
+    assert items[0]["content_type"] == "application/pdf"
+
+    with pytest.raises(attachments.AttachmentError):
+        attachments.describe([str(tmp_path / "missing.pdf")])
+    with pytest.raises(attachments.AttachmentError):
+        attachments.describe([big], max_bytes=100)
+
+
+def test_attachment_dir_is_enforced(tmp_path):
+    inside = _file(tmp_path, "ok.txt", 10)
+    with patch.object(attachments, "ATTACHMENT_DIR", str(tmp_path / "sub")):
+        with pytest.raises(attachments.AttachmentError, match="outside"):
+            attachments.describe([inside])
+    # Fails closed: no directory, no attachments
+    with patch.object(attachments, "ATTACHMENT_DIR", ""):
+        with pytest.raises(attachments.AttachmentError, match="not set"):
+            attachments.describe([inside])
+    # Relative paths are taken from the directory
+    assert attachments.describe(["ok.txt"])[0]["path"] == inside
+
+
+def test_secrets_and_databases_are_never_attached(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(drafts, "DRAFT_STORE_DB", str(tmp_path / "state.db"))
+    for name in (".env", "token_cache.bin", "state.db", "state.db-wal"):
+        path = _file(tmp_path, name, 10)
+        with pytest.raises(attachments.AttachmentError, match="protected"):
+            attachments.describe([path])
+    # A .env is refused by name even somewhere else under the directory
+    (tmp_path / "sub").mkdir()
+    with pytest.raises(attachments.AttachmentError, match="protected"):
+        attachments.describe([_file(tmp_path / "sub", ".env", 10)])
+
+
+def test_inline_attachment_goes_in_send_mail(tmp_path):
+    path = _file(tmp_path, "terms.pdf", 2048)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Terms",
+        "body": ".",
+        "attachments": attachments.describe([path]),
+    }
+    server = UploadSessionServer()
+    _run(server, lambda: graph_client.send_mail_async("tkn", draft))
+
+    assert [c[1] for c in server.calls] == [f"{API}/me/sendMail"]
+    (item,) = server.inline
+    assert item["name"] == "terms.pdf"
+    with open(path, "rb") as f:
+        assert base64.b64decode(item["contentBytes"]) == f.read()
+
+
+@pytest.mark.parametrize(
+    "fail",
+    [{}, {CHUNK: "drop"}, {2 * CHUNK: "lost_reply"}],
+    ids=["clean", "dropped_chunk", "lost_reply"],
+)
+def test_large_attachment_uses_upload_session(tmp_path, fail):
+    path = _file(tmp_path, "big.bin", 3 * CHUNK + 1234)
+    small = _file(tmp_path, "note.txt", 100)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Big",
+        "body": ".",
+        "attachments": attachments.describe([small, path], inline_max_bytes=1000),
+    }
+    server = UploadSessionServer(fail)
+
+    async def send():
+        with patch.object(attachments, "ATTACHMENT_UPLOAD_CHUNK_BYTES", CHUNK):
+            await graph_client._send_mail_with_uploads_async("tkn", draft)
+
+    _run(server, send)
+
+    with open(path, "rb") as f:
+        assert bytes(server.received) == f.read()
+    assert [a["name"] for a in server.inline] == ["note.txt"]
+    assert server.calls[-1] == ("POST", f"{API}/me/messages/msg-1/send")
+    # Each chunk is at most CHUNK bytes; a retried chunk restarts where Graph
+    # left off (the lost reply is not re-sent)
+    assert all(last - first + 1 <= CHUNK for first, last in server.puts)
+    expected = 4 + (1 if "drop" in fail.values() else 0)
+    assert len(server.puts) == expected
+
+
+def test_failed_upload_deletes_draft_message(tmp_path):
+    path = _file(tmp_path, "big.bin", 2 * CHUNK)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Big",
+        "body": ".",
+        "attachments": attachments.describe([path], inline_max_bytes=0),
+    }
+
+    def server(request):
+        if str(request.url) == f"{API}/me/messages":
+            return httpx.Response(201, json={"id": "msg-1"})
+        if request.method == "DELETE":
+            server.deleted = True
+            return httpx.Response(204)
+        return httpx.Response(400, json={"error": {"message": "bad session"}})
+
+    server.deleted = False
+    with pytest.raises(graph_client.GraphClientError):
+        _run(server, lambda: graph_client.send_mail_async("tkn", draft))
+    assert server.deleted
+
+
+def test_changed_file_is_refused_at_send(tmp_path):
+    path = _file(tmp_path, "terms.pdf", 100)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Terms",
+        "body": ".",
+        "attachments": attachments.describe([path]),
+    }
+    with open(path, "ab") as f:
+        f.write(b"more")
+    with pytest.raises(attachments.AttachmentError, match="changed"):
+        _run(UploadSessionServer(), lambda: graph_client.send_mail_async("t", draft))
+
+
+def test_prepare_and_confirm_with_attachments(flow_tools, tmp_path):
+    path = _file(tmp_path, "terms.pdf", 500)
+    res = flow_tools["prepare_email"](
+        to=["a@example.com"], subject="S", body="B", attachments=[path]
+    )
+    assert res["preview"]["attachments"] == [
+        {"name": "terms.pdf", "size": 500, "mode": "inline"}
+    ]
+    bad = flow_tools["prepare_email"](
+        to=["a@example.com"], subject="S", body="B", attachments=[path + ".nope"]
+    )
+    assert bad["error"].startswith("Invalid attachment")
+
+    server = UploadSessionServer()
+
+    async def fake_token():
+        return {"access_token": "tkn"}
+
+    async def confirm():
+        with patch("tools.auth.get_token_async", new=fake_token):
+            return await flow_tools["confirm_send"](res["draft_id"])
+
+    assert "sent successfully" in _run(server, confirm)
+    assert server.inline[0]["name"] == "terms.pdf"
+
+
+def test_batch_sends_drafts_with_attachments_individually(tmp_path):
+    path = _file(tmp_path, "terms.pdf", 100)
+    plain = {"to": ["a@example.com"], "subject": "S", "body": "."}
+    with_file = {**plain, "attachments": attachments.describe([path])}
+    seen = []
+
+    def server(request):
+        seen.append(str(request.url))
+        if str(request.url).endswith("$batch"):
+            requests = json.loads(request.content)["requests"]
+            return httpx.Response(
+                200,
+                json={"responses": [{"id": r["id"], "status": 202} for r in requests]},
+            )
+        return httpx.Response(202)
+
+    outcomes = _run(
+        server,
+        lambda: graph_client.send_mail_batch_async(
+            "tkn", {"plain": plain, "file": with_file}
+        ),
+    )
+    assert outcomes == {"plain": None, "file": None}
+    assert sorted(seen) == [f"{API}/$batch", f"{API}/me/sendMail"]
+
+
+@pytest.mark.parametrize(
+    "sizes", [[0], [1], [2, 3, 4], [attachments.ENCODE_CHUNK_BYTES * 2 + 1]]
+)
+def test_streamed_body_is_valid_json_of_known_length(tmp_path, sizes):
+    paths = [_file(tmp_path, f"f{i}.bin", size) for i, size in enumerate(sizes)]
+    draft = {
+        "to": ["a@example.com"],
+        "subject": 'Ñandú "quoted"',
+        "body": "línea\n",
+        "attachments": attachments.describe(paths),
+    }
+    body = graph_client._build_message_body(draft, draft["attachments"], envelope=True)
+    raw = b"".join(body)
+    assert len(raw) == body.length
+    # Iterating again starts over (retries resend the same body)
+    assert b"".join(body) == raw
+
+    payload = json.loads(raw)
+    assert payload["saveToSentItems"] == "true"
+    message = payload["message"]
+    assert message["subject"] == draft["subject"]
+    for path, item in zip(paths, message["attachments"]):
+        with open(path, "rb") as f:
+            assert base64.b64decode(item["contentBytes"]) == f.read()
+
+
+def test_streamed_send_is_retried_with_a_fresh_body(tmp_path):
+    path = _file(tmp_path, "terms.pdf", 100_000)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Terms",
+        "body": ".",
+        "attachments": attachments.describe([path]),
+    }
+    bodies = []
+
+    def server(request):
+        assert int(request.headers["Content-Length"]) == len(request.content)
+        bodies.append(json.loads(request.content))
+        if len(bodies) == 1:
+            return httpx.Response(503, json={"error": {"message": "busy"}})
+        return httpx.Response(202)
+
+    _run(server, lambda: graph_client.send_mail_async("tkn", draft))
+    assert len(bodies) == 2 and bodies[0] == bodies[1]
+
+
+def test_sync_send_mail_streams_inline_attachments(tmp_path):
+    path = _file(tmp_path, "terms.pdf", 5000)
+    draft = {
+        "to": ["a@example.com"],
+        "subject": "Terms",
+        "body": ".",
+        "attachments": attachments.describe([path]),
+    }
+    server = UploadSessionServer()
+    client = httpx.Client(transport=httpx.MockTransport(server))
+    with patch.object(graph_client, "get_client", return_value=client):
+        graph_client.send_mail("tkn", draft)
+    with open(path, "rb") as f:
+        assert base64.b64decode(server.inline[0]["contentBytes"]) == f.read()
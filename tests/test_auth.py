@@ -0,0 +1,237 @@
+import asyncio
+import atexit
+import threading
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+
+from tools import auth
+
+
+class FakeMsalApp:
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.silent_calls = 0
+
+    def get_accounts(self):
+        return [{"username": "user@example.com"}]
+
+    def acquire_token_silent(self, scopes, account=None, **kwargs):
+        self.silent_calls += 1
+        return {
+            "access_token": f"token-{self.silent_calls}",
+            "expires_in": self.expires_in,
+        }
+
+
+def test_token_served_from_memory():
+    fake = FakeMsalApp()
+    manager = auth.TokenManager(margin_seconds=60)
+
+    with patch("tools.auth.get_msal_app", return_value=fake) as mock_app:
+        first = manager.get_token()
+        for _ in range(10):
+            assert manager.get_token() is first
+
+        mock_app.assert_called_once()
+
+    assert fake.silent_calls == 1
+    assert manager.stats()["hits"] == 10
+    assert manager.stats()["misses"] == 1
+
+
+def test_token_near_expiry_goes_back_to_msal():
+    # Token life (30s) is below the margin (60s): every call is a miss
+    fake = FakeMsalApp(expires_in=30)
+    manager = auth.TokenManager(margin_seconds=60)
+
+    with patch("tools.auth.get_msal_app", return_value=fake):
+        assert manager.get_token()["access_token"] == "token-1"
+        assert manager.get_token()["access_token"] == "token-2"
+
+    assert manager.stats()["hits"] == 0
+    assert manager.stats()["misses"] == 2
+
+
+def test_expires_on_takes_precedence():
+    result = {"expires_in": 10, "expires_on": "2000000000"}
+    assert auth._token_expires_at(result, time.time()) == 2000000000.0
+
+
+def test_no_accounts_not_cached():
+    fake = FakeMsalApp()
+    fake.get_accounts = lambda: []  # type: ignore
+    manager = auth.TokenManager()
+
+    with patch("tools.auth.get_msal_app", return_value=fake):
+        assert manager.get_token() is None
+        assert manager.get_token() is None
+
+    assert manager.stats()["misses"] == 2
+
+
+def test_persister_writes_atomically_once(tmp_path):
+    path = tmp_path / "cache.bin"
+    persister = auth.TokenCachePersister(path=str(path), delay_seconds=60)
+
+    cache = persister.cache
+    assert persister.flush() is False  # nothing changed yet
+
+    cache.add({"scope": ["User.Read"], "client_id": "cid", "response": {}})
+    assert persister.flush() is True
+    assert persister.flush() is False
+    assert path.exists()
+    assert not list(tmp_path.glob(".token_cache.*"))
+
+    reloaded = auth.TokenCachePersister(path=str(path)).cache
+    assert reloaded.serialize() == cache.serialize()
+
+
+def test_cache_change_schedules_background_write(tmp_path):
+    path = tmp_path / "cache.bin"
+    persister = auth.TokenCachePersister(path=str(path), delay_seconds=0.05)
+
+    persister.cache.add({"scope": ["User.Read"], "client_id": "cid", "response": {}})
+    deadline = time.time() + 2
+    while not path.exists() and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert path.exists()
+    assert persister.writes == 1
+
+
+def test_memory_flat_across_many_get_token_calls(tmp_path):
+    persister = auth.TokenCachePersister(path=str(tmp_path / "cache.bin"))
+    manager = auth.TokenManager(margin_seconds=60)
+    # Token life below the margin: every call goes all the way to MSAL
+    fake = FakeMsalApp(expires_in=30)
+
+    with (
+        patch.object(auth, "persister", persister),
+        patch("msal.PublicClientApplication", new=lambda *args, **kwargs: fake),
+    ):
+        callbacks_before = atexit._ncallbacks()
+        manager.get_token()
+        auth.get_msal_app()
+
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        for _ in range(100_000):
+            manager.get_token()
+            auth.get_msal_app()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Loading the cache registers exactly one exit hook, no matter how many calls
+        assert atexit._ncallbacks() == callbacks_before + 1
+
+    assert fake.silent_calls == 100_001
+    assert current - baseline < 64 * 1024
+
+
+class SlowTokenEndpoint(FakeMsalApp):
+    """Stand-in MSAL app whose silent refresh takes a while, like a real round trip."""
+
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+        self._count_lock = threading.Lock()
+
+    def acquire_token_silent(self, scopes, account=None, **kwargs):
+        with self._count_lock:
+            self.silent_calls += 1
+            n = self.silent_calls
+        time.sleep(self.delay)
+        return {"access_token": f"token-{n}", "expires_in": self.expires_in}
+
+
+def test_concurrent_thread_refreshes_are_coalesced():
+    endpoint = SlowTokenEndpoint()
+    manager = auth.TokenManager(margin_seconds=60)
+    start = threading.Barrier(200)
+    results = []
+
+    def sender():
+        start.wait()
+        results.append(manager.get_token())
+
+    with patch("tools.auth.get_msal_app", return_value=endpoint):
+        threads = [threading.Thread(target=sender) for _ in range(200)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert endpoint.silent_calls == 1
+    assert len(results) == 200
+    assert all(r["access_token"] == "token-1" for r in results)
+
+
+def test_concurrent_async_refreshes_are_coalesced():
+    endpoint = SlowTokenEndpoint()
+    manager = auth.TokenManager(margin_seconds=60)
+
+    async def send_all():
+        return await asyncio.gather(*(manager.get_token_async() for _ in range(200)))
+
+    with patch("tools.auth.get_msal_app", return_value=endpoint):
+        results = asyncio.run(send_all())
+
+    assert endpoint.silent_calls == 1
+    assert all(r["access_token"] == "token-1" for r in results)
+    assert manager.stats()["misses"] == 1
+    assert manager.stats()["coalesced"] == 199
+
+
+def test_failed_refresh_propagates_and_resets():
+    endpoint = SlowTokenEndpoint(delay=0)
+    manager = auth.TokenManager()
+
+    with patch("tools.auth.get_msal_app", return_value=endpoint):
+        with patch.object(endpoint, "get_accounts", side_effect=RuntimeError("boom")):
+            with pytest.raises(RuntimeError):
+                manager.get_token()
+        # The failed refresh does not stay in flight
+        assert manager.get_token()["access_token"] == "token-1"
+
+
+def test_refresher_schedules_ahead_of_expiry():
+    manager = auth.TokenManager()
+    refresher = auth.TokenRefresher(manager, ahead_seconds=300, jitter_seconds=30)
+
+    with patch("tools.auth.get_msal_app", return_value=FakeMsalApp(expires_in=3600)):
+        manager.get_token()
+
+    delay = refresher.next_delay()
+    assert 3600 - 300 - 30 - 1 <= delay <= 3600 - 300
+
+
+def test_refresher_forces_renewal_and_reports():
+    fake = FakeMsalApp()
+    manager = auth.TokenManager()
+    refresher = auth.TokenRefresher(manager)
+
+    with patch("tools.auth.get_msal_app", return_value=fake):
+        manager.get_token()
+        assert asyncio.run(refresher.refresh_once()) is True
+        # The fresh token is replaced without any sender asking for it
+        assert manager.get_token()["access_token"] == "token-2"
+
+    stats = refresher.stats()
+    assert stats["refreshes"] == 1
+    assert stats["failures"] == 0
+    assert stats["last_latency_ms"] is not None
+
+
+def test_refresher_counts_failures():
+    fake = FakeMsalApp()
+    fake.get_accounts = list  # type: ignore
+    refresher = auth.TokenRefresher(auth.TokenManager())
+
+    with patch("tools.auth.get_msal_app", return_value=fake):
+        assert asyncio.run(refresher.refresh_once()) is False
+
+    assert refresher.stats()["failures"] == 1
+    assert refresher.stats()["last_error"]
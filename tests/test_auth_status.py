@@ -39,3 +39,10 @@ def test_authenticated(status_tool):
         assert result["status"] == "Authenticated"
         assert result["user"] == "Test User"
         assert "Mail.Send" in result["scopes"]
+
+
+def test_status_reports_token_metrics(status_tool):
+    with patch("tools.auth.get_token", return_value=None):
+        result = status_tool()
+        assert "hits" in result["token_cache"]
+        assert "failures" in result["refresher"]
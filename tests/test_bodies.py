@@ -0,0 +1,73 @@
+import pytest
+
+from tools import bodies, drafts
+
+ANNOUNCEMENT = "Dear team,\n\n" + "The office will be closed on Friday. " * 200
+
+
+def _draft(group, body=ANNOUNCEMENT):
+    # A fresh str per draft, as it would arrive from separate tool calls
+    return {
+        "to": [f"{group}@example.com"],
+        "subject": "Closure",
+        "body": "".join(list(body)),
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield drafts.DraftStore(session_max_count=10_000, max_count=10_000)
+    else:
+        s = drafts.SqliteDraftStore(
+            str(tmp_path / "drafts.sqlite3"),
+            session_max_count=10_000,
+            max_count=10_000,
+        )
+        yield s
+        s.close()
+
+
+def test_encode_compresses_large_bodies_only():
+    codec, blob = bodies.encode("short", threshold=1024)
+    assert codec == bodies.RAW and blob == b"short"
+
+    codec, blob = bodies.encode(ANNOUNCEMENT, threshold=1024)
+    assert codec in (bodies.ZLIB, bodies.ZSTD)
+    assert len(blob) < len(ANNOUNCEMENT) // 10
+    assert bodies.decode(codec, blob) == ANNOUNCEMENT
+
+
+def test_identical_bodies_are_stored_once(store):
+    ids = [store.create_draft(_draft(f"group{i}")) for i in range(200)]
+    store.create_draft(_draft("other", body="A different, short body"))
+
+    stats = store.stats()["bodies"]
+    assert stats["distinct"] == 2
+    assert stats["stored_bytes"] < len(ANNOUNCEMENT)
+    assert store.get_draft(ids[7]) == _draft("group7")
+    assert store.claim(ids[8])[1]["body"] == ANNOUNCEMENT
+
+
+def test_body_is_freed_with_its_last_draft(store):
+    ids = [store.create_draft(_draft(f"group{i}")) for i in range(3)]
+    for did in ids[:2]:
+        store.delete_draft(did)
+    store.sweep()
+    assert store.stats()["bodies"]["distinct"] == 1
+    assert store.get_draft(ids[2])["body"] == ANNOUNCEMENT
+
+    store.burn(ids[2])
+    store.sweep()
+    assert store.stats()["bodies"]["distinct"] == 0
+
+
+def test_memory_store_refcounts_bodies():
+    store = drafts.DraftStore()
+    a = store.create_draft(_draft("a"))
+    store.create_draft(_draft("b"))
+    assert store.bodies.stats()["references"] == 2
+
+    store.delete_draft(a)
+    assert store.bodies.stats()["references"] == 1
+    assert store.bodies.stats()["logical_bytes"] == len(ANNOUNCEMENT)
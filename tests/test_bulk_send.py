@@ -0,0 +1,160 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from tools import drafts, email_flow
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture
+def flow_tools():
+    mcp_mock = MockMCP()
+    email_flow.register(mcp_mock)  # type: ignore
+    return mcp_mock.tools
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    drafts.store.clear()
+    yield
+    drafts.store.clear()
+
+
+class FakeBatchGraph:
+    """Local $batch stand-in: answers each sub-request by its subject."""
+
+    def __init__(self):
+        self.batch_calls = 0
+        self.batch_sizes = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith("/$batch")
+        self.batch_calls += 1
+        sub_requests = json.loads(request.content)["requests"]
+        self.batch_sizes.append(len(sub_requests))
+
+        responses = []
+        for sub in sub_requests:
+            subject = sub["body"]["message"]["subject"]
+            if subject == "throttle":
+                status, body = 429, {"error": {"message": "Slow down"}}
+            elif subject == "bad":
+                status, body = 400, {"error": {"message": "Bad recipient"}}
+            else:
+                status, body = 202, None
+            responses.append({"id": sub["id"], "status": status, "body": body})
+        return httpx.Response(200, json={"responses": responses})
+
+
+def _confirm_many(confirm_many, graph, draft_ids):
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(graph))
+        with (
+            patch("tools.graph_client.get_async_client", return_value=client),
+            patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        ):
+            result = await confirm_many(draft_ids)
+        await client.aclose()
+        return result
+
+    return asyncio.run(run())
+
+
+def test_confirm_send_many_packs_batches(flow_tools):
+    prepare = flow_tools["prepare_email"]
+    ids = [
+        prepare(to=[f"u{i}@example.com"], subject="ok", body=".")["draft_id"]
+        for i in range(45)
+    ]
+    graph = FakeBatchGraph()
+
+    result = _confirm_many(flow_tools["confirm_send_many"], graph, ids)
+
+    assert result["sent"] == 45
+    assert result["failed"] == 0
+    assert sorted(graph.batch_sizes) == [5, 20, 20]
+    assert [r["draft_id"] for r in result["results"]] == ids
+    assert all(drafts.store.get_draft(did) is None for did in ids)
+
+
+def test_confirm_send_many_per_item_outcomes(flow_tools):
+    prepare = flow_tools["prepare_email"]
+    ok_id = prepare(to=["a@example.com"], subject="ok", body=".")["draft_id"]
+    throttled_id = prepare(to=["b@example.com"], subject="throttle", body=".")[
+        "draft_id"
+    ]
+    bad_id = prepare(to=["c@example.com"], subject="bad", body=".")["draft_id"]
+
+    result = _confirm_many(
+        flow_tools["confirm_send_many"],
+        FakeBatchGraph(),
+        [ok_id, throttled_id, bad_id, "missing"],
+    )
+    by_id = {r["draft_id"]: r for r in result["results"]}
+
+    assert by_id[ok_id]["status"] == "sent"
+    assert "Rate limit exceeded" in by_id[throttled_id]["message"]
+    assert "Bad recipient" in by_id[bad_id]["message"]
+    assert "not found" in by_id["missing"]["message"]
+    assert result["sent"] == 1
+    assert result["failed"] == 3
+
+    # Only the accepted draft is burned
+    assert drafts.store.get_draft(ok_id) is None
+    assert drafts.store.get_draft(throttled_id) is not None
+    assert drafts.store.get_draft(bad_id) is not None
+
+
+def test_confirm_send_many_batch_failure_keeps_drafts(flow_tools):
+    prepare = flow_tools["prepare_email"]
+    did = prepare(to=["a@example.com"], subject="ok", body=".")["draft_id"]
+
+    result = _confirm_many(
+        flow_tools["confirm_send_many"],
+        lambda request: httpx.Response(503, text="Service Unavailable"),
+        [did],
+    )
+
+    assert result["results"][0]["status"] == "error"
+    assert "Microsoft Graph Server Error" in result["results"][0]["message"]
+    assert drafts.store.get_draft(did) is not None
+
+
+def test_confirm_send_many_retries_throttled_items(flow_tools):
+    prepare = flow_tools["prepare_email"]
+    did = prepare(to=["a@example.com"], subject="ok", body=".")["draft_id"]
+    graph = FakeBatchGraph()
+
+    def throttle_once(request):
+        if graph.batch_calls == 0:
+            graph.batch_calls += 1
+            sub = json.loads(request.content)["requests"][0]
+            return httpx.Response(
+                200,
+                json={
+                    "responses": [
+                        {
+                            "id": sub["id"],
+                            "status": 429,
+                            "headers": {"Retry-After": "0"},
+                        }
+                    ]
+                },
+            )
+        return graph(request)
+
+    result = _confirm_many(flow_tools["confirm_send_many"], throttle_once, [did])
+
+    assert result["sent"] == 1
+    assert graph.batch_calls == 2
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+
+from tools import concurrency, graph_client
+
+DRAFT = {"to": ["a@example.com"], "subject": "S", "body": "B"}
+
+
+def test_additive_increase_and_multiplicative_decrease():
+    limiter = concurrency.AdaptiveLimiter(initial_limit=10, max_limit=100)
+
+    for _ in range(11):
+        limiter.record(0.01, overloaded=False)
+    assert limiter.limit == 11  # about +1 per limit-sized round of successes
+
+    limiter.record(0.01, overloaded=True)
+    assert limiter.limit == 5
+
+    # Within the cooldown a second overload does not cut again
+    limiter.record(0.01, overloaded=True)
+    assert limiter.limit == 5
+    assert limiter.snapshot()["decreases"] == 1
+
+
+def test_latency_spike_triggers_decrease():
+    limiter = concurrency.AdaptiveLimiter(initial_limit=40, max_limit=40)
+    for _ in range(50):
+        limiter.record(0.01, overloaded=False)
+    for _ in range(5):
+        limiter.record(0.2, overloaded=False)
+
+    assert limiter.limit == 20
+    snapshot = limiter.snapshot()
+    assert snapshot["latency_ms"]["p50"] == 10.0
+    assert snapshot["latency_ms"]["p99"] == 200.0
+
+
+class ThrottlingGraph:
+    """Local Graph stand-in that answers 429 above a fixed in-flight capacity."""
+
+    def __init__(self, capacity, latency=0.01):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+        self.accepted = 0
+        self.throttled = 0
+
+    async def __call__(self, request):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.in_flight > self.capacity:
+                self.throttled += 1
+                return httpx.Response(429, headers={"Retry-After": "0"})
+            self.accepted += 1
+            return httpx.Response(202)
+        finally:
+            self.in_flight -= 1
+
+
+def _simulate(graph, limiter, sends):
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(graph))
+        with (
+            patch("tools.graph_client.get_async_client", return_value=client),
+            patch.object(concurrency, "limiter", limiter),
+        ):
+            results = await asyncio.gather(
+                *(graph_client.send_mail_async("tkn", DRAFT) for _ in range(sends)),
+                return_exceptions=True,
+            )
+        await client.aclose()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_simulation_converges_below_throttling_capacity():
+    graph = ThrottlingGraph(capacity=10)
+    limiter = concurrency.AdaptiveLimiter(
+        initial_limit=32, max_limit=64, cooldown_seconds=0.02
+    )
+
+    results = _simulate(graph, limiter, 600)
+
+    assert limiter.snapshot()["decreases"] >= 1
+    assert graph.peak <= 32
+    # Settles around the capacity instead of hammering Graph
+    assert limiter.limit <= 20
+    assert graph.throttled < 0.2 * (graph.accepted + graph.throttled)
+    assert sum(1 for r in results if r is None) == graph.accepted
+
+
+def test_simulation_grows_limit_when_healthy():
+    graph = ThrottlingGraph(capacity=1000)
+    limiter = concurrency.AdaptiveLimiter(initial_limit=4, max_limit=64)
+
+    _simulate(graph, limiter, 300)
+
+    assert graph.throttled == 0
+    assert limiter.limit > 4
+    assert graph.peak <= limiter.limit
+
+
+def test_sync_send_mail_shares_the_limit():
+    concurrency.limiter = concurrency.AdaptiveLimiter(initial_limit=2, max_limit=2)
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def post(self, url, **kwargs):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return httpx.Response(429, headers={"Retry-After": "0"})
+
+    def send():
+        try:
+            graph_client.send_mail("tkn", DRAFT)
+        except graph_client.GraphThrottlingError:
+            pass
+
+    with patch("httpx.Client.post", new=post):
+        threads = [threading.Thread(target=send) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert peak == 2
+    snapshot = concurrency.limiter.snapshot()
+    # 429s fed back into the controller
+    assert snapshot["decreases"] >= 1 and snapshot["in_flight"] == 0
@@ -0,0 +1,117 @@
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+
+from tools import config, mail_preview
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func_or_name=None):
+        if callable(func_or_name):
+            self.tools[func_or_name.__name__] = func_or_name
+            return func_or_name
+
+        def decorator(func):
+            self.tools[func.__name__] = func
+            return func
+
+        return decorator
+
+
+@pytest.fixture
+def preview_tool():
+    mcp = MockMCP()
+    mail_preview.register(mcp)
+    return mcp.tools["preview_email"]
+
+
+def test_from_env_parses_typed_fields():
+    cfg = config.MailerConfig.from_env(
+        {
+            "ALLOWED_RECIPIENT_DOMAINS": " Corp.com, ,partner.org",
+            "MAX_RECIPIENTS": "3",
+        }
+    )
+    assert cfg.allowed_domains == {"corp.com", "partner.org"}
+    assert (cfg.max_recipients, cfg.max_body_chars) == (3, 5000)
+    assert cfg.allowlist_policy.allows("corp.com")
+    assert not cfg.allowlist_policy.allows("other.com")
+
+
+@pytest.mark.parametrize(
+    "env",
+    [{"MAX_RECIPIENTS": "ten"}, {"MAX_BODY_CHARS": "0"}, {"MAX_RECIPIENTS": "-1"}],
+)
+def test_from_env_rejects_bad_values(env):
+    with pytest.raises(config.ConfigError):
+        config.MailerConfig.from_env(env)
+
+
+def test_reload_swaps_snapshot_and_keeps_old_on_error(tmp_path):
+    dotenv = tmp_path / ".env"
+    dotenv.write_text("MAX_RECIPIENTS=2\n", encoding="utf-8")
+    runtime = config.RuntimeConfig(str(dotenv), environ={})
+    before = runtime.current()
+    new = runtime.reload()
+    assert runtime.current() is new
+    assert new.version == before.version + 1
+    assert new.max_recipients == 2
+
+    dotenv.write_text("MAX_RECIPIENTS=lots\n", encoding="utf-8")
+    with pytest.raises(config.ConfigError):
+        runtime.reload()
+    assert runtime.current() is new
+    assert runtime.status()["last_error"]
+
+
+@patch.dict(os.environ, {"MAX_BODY_CHARS": "99"}, clear=True)
+def test_reload_layers_dotenv_under_the_startup_environment(tmp_path):
+    dotenv = tmp_path / ".env"
+    dotenv.write_text(
+        "MAX_RECIPIENTS=7\nMAX_BODY_CHARS=100\nALLOWED_RECIPIENT_DOMAINS=corp.com\n",
+        encoding="utf-8",
+    )
+    runtime = config.RuntimeConfig(str(dotenv), environ={"MAX_RECIPIENTS": "3"})
+    cfg = runtime.reload()
+    # Environment variables win over .env, as at startup
+    assert (cfg.max_recipients, cfg.max_body_chars) == (3, 100)
+    assert cfg.allowed_domains == {"corp.com"}
+
+    # A key removed from .env falls back to its default, not a stale value
+    dotenv.write_text("MAX_BODY_CHARS=200\n", encoding="utf-8")
+    cfg = runtime.reload()
+    assert (cfg.max_body_chars, cfg.allowed_domains) == (200, frozenset())
+    assert os.environ == {"MAX_BODY_CHARS": "99"}
+
+
+def test_preview_uses_one_snapshot_per_call(preview_tool):
+    config.runtime.swap(config.MailerConfig(max_recipients=1))
+    result = preview_tool(to=["a@x.com", "b@x.com"], subject="S", body="B")
+    assert result["policy"]["max_recipients"] == 1
+    assert any(i["type"] == "too_many_recipients" for i in result["issues"])
+
+    config.runtime.swap(config.MailerConfig(max_recipients=5))
+    result = preview_tool(to=["a@x.com", "b@x.com"], subject="S", body="B")
+    assert result["ok"] is True
+
+
+def test_in_flight_call_keeps_its_snapshot():
+    async def call():
+        cfg = config.current()
+        await asyncio.sleep(0)
+        return mail_preview.validate_message(["a@x.com", "b@x.com"], "S", "B", cfg=cfg)
+
+    async def main():
+        config.runtime.swap(config.MailerConfig(max_recipients=1))
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0)
+        config.runtime.swap(config.MailerConfig(max_recipients=5))
+        return await task
+
+    result = asyncio.run(main())
+    assert result.issue("too_many_recipients")["max"] == 1
@@ -0,0 +1,127 @@
+import json
+import os
+from unittest.mock import patch
+
+from tools import config, domain_policy, mail_preview, validation
+from tools.domain_policy import ALLOW, DENY, DomainPolicy, PolicyFile, Rule
+
+
+def _policy(**document):
+    return domain_policy.parse_policy(document)
+
+
+def test_pattern_forms():
+    policy = _policy(allow=["corp.com", "*.partner.org", ".vendor.net"])
+    assert policy.allows("corp.com")
+    assert not policy.allows("eu.corp.com")
+
+    assert policy.allows("eu.partner.org")
+    assert policy.allows("a.b.partner.org")
+    assert not policy.allows("partner.org")
+
+    assert policy.allows("vendor.net")
+    assert policy.allows("mail.vendor.net")
+    assert not policy.allows("notvendor.net")
+    assert policy.allows("CORP.COM")
+
+
+def test_most_specific_rule_wins_and_deny_breaks_ties():
+    policy = _policy(
+        allow=[".corp.com", "ok.legacy.corp.com"],
+        deny=["*.legacy.corp.com", "corp.com"],
+    )
+    assert not policy.allows("corp.com")
+    assert policy.allows("eu.corp.com")
+    assert not policy.allows("old.legacy.corp.com")
+    assert policy.allows("ok.legacy.corp.com")
+
+    same = DomainPolicy([Rule("x.com", ALLOW), Rule("x.com", DENY)])
+    assert not same.allows("x.com")
+
+
+def test_default_follows_allow_rules_unless_given():
+    assert _policy(deny=["evil.com"]).allows("anything.com")
+    assert not _policy(allow=["corp.com"]).allows("anything.com")
+    assert not _policy(default="deny", deny=["evil.com"]).allows("anything.com")
+
+
+def test_invalid_documents_raise():
+    for document in (
+        {"allow": ["corp.*.com"]},
+        {"default": "maybe"},
+        {"rules": [{"domain": "corp.com", "action": "block"}]},
+    ):
+        try:
+            domain_policy.parse_policy(document)
+        except domain_policy.PolicyError:
+            continue
+        raise AssertionError(f"accepted {document}")
+
+
+def test_per_domain_recipient_limit():
+    policy = _policy(
+        allow=["corp.com"],
+        rules=[{"domain": ".partner.org", "action": "allow", "max_recipients": 2}],
+    )
+    result = validation.validate_message(
+        ["a@corp.com", "b@partner.org", "c@eu.partner.org"],
+        "Subject",
+        "Body",
+        cc=["d@partner.org"],
+        policy=policy,
+        max_recipients=100,
+        max_body_chars=100,
+    )
+    issue = result.issue("domain_recipient_limit")
+    assert issue["domain"] == ".partner.org"
+    assert (issue["max"], issue["count"]) == (2, 3)
+    assert not result.blocked
+
+
+def _write(path, document):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+
+
+def test_policy_file_reloads_on_change(tmp_path):
+    path = tmp_path / "policy.json"
+    _write(path, {"allow": ["corp.com"]})
+    watched = PolicyFile(str(path), check_seconds=0)
+    first = watched.current()
+    assert first.allows("corp.com")
+    assert watched.current() is first
+
+    _write(path, {"allow": [".corp.com", "new.org"]})
+    os.utime(path, ns=(0, 10**18))
+    second = watched.current()
+    assert second is not first
+    assert second.allows("eu.corp.com") and second.allows("new.org")
+    assert watched.status()["reloads"] == 2
+
+
+def test_broken_policy_file_keeps_previous_policy(tmp_path):
+    path = tmp_path / "policy.json"
+    _write(path, {"allow": ["corp.com"]})
+    watched = PolicyFile(str(path), check_seconds=0)
+    good = watched.current()
+
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, ns=(0, 10**18))
+    assert watched.current() is good
+    assert watched.status()["errors"] == 1
+
+    missing = PolicyFile(str(tmp_path / "missing.json"), check_seconds=0)
+    assert not missing.current().allows("corp.com")
+
+
+def test_mail_preview_uses_the_policy_file(tmp_path):
+    path = tmp_path / "policy.json"
+    _write(path, {"allow": [".corp.com"]})
+    watched = PolicyFile(str(path), check_seconds=0)
+    config.runtime.swap(config.MailerConfig())
+    with patch.object(domain_policy, "policy_file", watched):
+        result = mail_preview.validate_message(
+            ["a@eu.corp.com", "b@other.com"], "Subject", "Body"
+        )
+        assert result.blocked == ["b@other.com"]
+        assert not mail_preview._domain_allowed("b@other.com")
@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from tools import drafts
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield drafts.DraftStore(expiry_seconds=10)
+    else:
+        s = drafts.SqliteDraftStore(str(tmp_path / "drafts.sqlite3"), expiry_seconds=10)
+        yield s
+        s.close()
+
+
+def _age(store, draft_id, seconds):
+    """Backdates a draft so TTL can be tested without sleeping."""
+    if isinstance(store, drafts.SqliteDraftStore):
+        store._conn.execute(
+            "UPDATE drafts SET created_at = created_at - ? WHERE id = ?",
+            (seconds, draft_id),
+        )
+    else:
+        entry = store._store[draft_id]
+        store._store[draft_id] = (entry[0] - seconds,) + entry[1:]
+
+
+def test_backends_share_ttl_semantics(store):
+    expired = store.create_draft({"subject": "old"})
+    swept = store.create_draft({"subject": "older"})
+    live = store.create_draft({"subject": "new", "to": ["a@example.com"]})
+    _age(store, expired, 11)
+    _age(store, swept, 11)
+
+    assert store.get_draft(live) == {"subject": "new", "to": ["a@example.com"]}
+    assert store.get_draft(expired) is None
+    assert store.sweep() == 1
+    assert store.get_draft(swept) is None
+    assert len(store) == 1
+
+    store.delete_draft(live)
+    stats = store.stats()
+    assert stats["backend"] == store.backend
+    assert stats["size"] == 0
+    assert stats["expirations"] == 2
+    assert stats["deleted"] == 1
+
+
+def test_backends_share_caps_and_quotas(store):
+    store.max_count = 2
+    store.session_max_count = 2
+    first = store.create_draft({"n": 1}, session="a")
+    store.create_draft({"n": 2}, session="b")
+    store.create_draft({"n": 3}, session="c")
+    assert store.get_draft(first) is None
+    assert store.stats()["evictions"] == 1
+
+    store.create_draft({"n": 4}, session="c")
+    with pytest.raises(drafts.DraftQuotaExceeded):
+        store.create_draft({"n": 5}, session="c")
+    assert store.session_usage("c")["count"] == 2
+
+
+def test_make_store_selects_backend():
+    assert isinstance(drafts.make_store("memory"), drafts.DraftStore)
+    assert isinstance(drafts.make_store("sqlite"), drafts.SqliteDraftStore)
+    with pytest.raises(ValueError):
+        drafts.make_store("redis")
+
+
+def test_backend_missing_methods_fails_at_construction():
+    class Partial(drafts.DraftBackend):
+        def create_draft(self, data, session=None):
+            return "d"
+
+    with pytest.raises(TypeError, match="renew_claim"):
+        Partial()
+
+
+def _server_worker(db_path, role, payload):
+    """One server process sharing the draft database (runs in a child process)."""
+    from unittest.mock import patch
+
+    from tools import email_flow
+
+    drafts.store = drafts.SqliteDraftStore(db_path)
+    mcp = MockMCP()
+    email_flow.register(mcp)
+
+    if role == "prepare":
+        return [
+            mcp.tools["prepare_email"](
+                to=[f"user{i}@example.com"], subject=f"S{i}", body="."
+            )["draft_id"]
+            for i in range(payload)
+        ]
+
+    async def token():
+        return {"access_token": "t"}
+
+    async def send(token, data):
+        return None
+
+    with (
+        patch("tools.auth.get_token_async", new=token),
+        patch("tools.graph_client.send_mail_async", new=send),
+    ):
+        return [asyncio.run(mcp.tools["confirm_send"](did)) for did in payload]
+
+
+def test_drafts_confirmed_across_worker_processes(tmp_path):
+    db_path = str(tmp_path / "drafts.sqlite3")
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(2) as pool:
+        prepared = pool.starmap(
+            _server_worker, [(db_path, "prepare", 5), (db_path, "prepare", 5)]
+        )
+    # A fresh pool: every confirm runs in a process that never saw the drafts
+    with ctx.Pool(2) as pool:
+        confirmed = pool.starmap(
+            _server_worker,
+            [(db_path, "confirm", prepared[1]), (db_path, "confirm", prepared[0])],
+        )
+
+    results = confirmed[0] + confirmed[1]
+    assert len(results) == 10
+    assert all(r.startswith("Email sent successfully") for r in results)
+
+    store = drafts.SqliteDraftStore(db_path)
+    assert len(store) == 0
+    store.close()
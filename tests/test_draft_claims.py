@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from unittest.mock import patch
+
+import pytest
+
+from tools import drafts, email_flow, graph_client
+
+DRAFT = {"to": ["a@example.com"], "cc": [], "bcc": [], "subject": "S", "body": "B"}
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        s = drafts.DraftStore()
+    else:
+        s = drafts.SqliteDraftStore(str(tmp_path / "drafts.sqlite3"))
+    with patch.object(drafts, "store", s):
+        yield s
+    if request.param == "sqlite":
+        s.close()
+
+
+def _hammer(n_threads, fn):
+    """Runs fn() on n_threads threads released at the same instant."""
+    barrier = threading.Barrier(n_threads)
+    results = []
+    lock = threading.Lock()
+
+    def run():
+        barrier.wait()
+        result = fn()
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=run) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_exactly_one_claimer_under_contention(store):
+    did = store.create_draft(DRAFT)
+
+    results = _hammer(32, lambda: store.claim(did)[0])
+
+    counts = Counter(results)
+    assert counts[drafts.CLAIMED] == 1
+    assert counts[drafts.IN_PROGRESS] == 31
+
+
+def test_release_allows_retry_and_burn_reports_already_sent(store):
+    did = store.create_draft(DRAFT)
+
+    assert store.claim(did) == (drafts.CLAIMED, DRAFT)
+    store.release(did)
+    assert store.claim(did)[0] == drafts.CLAIMED
+    store.burn(did)
+
+    assert store.claim(did) == (drafts.ALREADY_SENT, None)
+    assert store.get_draft(did) is None
+    assert store.claim("missing") == (drafts.NOT_FOUND, None)
+
+
+def test_abandoned_claim_lapses(store):
+    store.claim_seconds = 0.05
+    did = store.create_draft(DRAFT)
+    assert store.claim(did)[0] == drafts.CLAIMED
+    assert store.claim(did)[0] == drafts.IN_PROGRESS
+    time.sleep(0.06)
+    assert store.claim(did)[0] == drafts.CLAIMED
+
+
+def test_concurrent_confirm_send_sends_once(store):
+    mcp = MockMCP()
+    email_flow.register(mcp)
+    confirm = mcp.tools["confirm_send"]
+    did = store.create_draft(DRAFT)
+    sends = []
+
+    async def slow_send(token, data):
+        sends.append(data["subject"])
+        await asyncio.sleep(0.05)
+
+    async def token():
+        return {"access_token": "t"}
+
+    with (
+        patch("tools.auth.get_token_async", new=token),
+        patch("tools.graph_client.send_mail_async", new=slow_send),
+    ):
+        results = _hammer(16, lambda: asyncio.run(confirm(did)))
+
+    assert sends == ["S"]
+    assert sum("sent successfully" in r for r in results) == 1
+    assert all(
+        "sent successfully" in r or "being sent" in r or "already sent" in r
+        for r in results
+    )
+    assert "already sent" in asyncio.run(confirm(did))
+
+
+def test_slow_send_keeps_its_claim(store):
+    store.claim_seconds = 0.2
+    mcp = MockMCP()
+    email_flow.register(mcp)
+    confirm = mcp.tools["confirm_send"]
+    did = store.create_draft(DRAFT)
+    sends = []
+
+    async def slow_send(token, data):
+        sends.append(data["subject"])
+        await asyncio.sleep(0.5)
+
+    async def token():
+        return {"access_token": "t"}
+
+    async def scenario():
+        first = asyncio.create_task(confirm(did))
+        # Past the original claim deadline: the send is still running
+        await asyncio.sleep(0.35)
+        second = await confirm(did)
+        return await first, second
+
+    with (
+        patch("tools.auth.get_token_async", new=token),
+        patch("tools.graph_client.send_mail_async", new=slow_send),
+    ):
+        first, second = asyncio.run(scenario())
+
+    assert "sent successfully" in first
+    assert "being sent" in second
+    assert sends == ["S"]
+
+
+def test_renew_claim_only_extends_held_claims(store):
+    did = store.create_draft(DRAFT)
+    assert not store.renew_claim(did)
+    store.claim(did)
+    assert store.renew_claim(did)
+    store.burn(did)
+    assert not store.renew_claim(did)
+
+
+def test_failed_send_releases_the_draft(store):
+    mcp = MockMCP()
+    email_flow.register(mcp)
+    confirm = mcp.tools["confirm_send"]
+    did = store.create_draft(DRAFT)
+
+    async def token():
+        return {"access_token": "t"}
+
+    async def failing_send(token, data):
+        raise graph_client.GraphServerError("boom", status=500)
+
+    with patch("tools.auth.get_token_async", new=token):
+        with patch("tools.graph_client.send_mail_async", new=failing_send):
+            assert "Server Error" in asyncio.run(confirm(did))
+        with patch("tools.graph_client.send_mail_async", return_value=None):
+            assert "sent successfully" in asyncio.run(confirm(did))
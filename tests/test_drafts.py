@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from tools import drafts
+
+
+def test_sweep_pops_only_expired_drafts_in_order():
+    store = drafts.DraftStore(expiry_seconds=10)
+    now = time.time()
+    old = [store.create_draft({"n": i}) for i in range(3)]
+    for i, did in enumerate(old):
+        store._store[did] = (now - 20 + i,) + store._store[did][1:]
+    fresh = store.create_draft({"n": "fresh"})
+
+    assert store.sweep(now) == 3
+    assert store.get_draft(fresh) == {"n": "fresh"}
+    assert all(store.get_draft(did) is None for did in old)
+
+    stats = store.stats()
+    assert stats["size"] == 1
+    assert stats["expirations"] == 3
+    assert stats["evictions"] == 0
+
+
+def test_sweep_stops_at_first_live_draft():
+    store = drafts.DraftStore(
+        expiry_seconds=10, max_count=20_000, session_max_count=20_000
+    )
+    for i in range(10_000):
+        store.create_draft({"n": i})
+
+    # Nothing is expired: a sweep inspects only the head of the index
+    start = time.perf_counter()
+    for _ in range(1_000):
+        assert store.sweep() == 0
+    assert time.perf_counter() - start < 0.5
+    assert len(store) == 10_000
+
+
+def test_lazy_expiry_and_delete_are_counted():
+    store = drafts.DraftStore(expiry_seconds=10)
+    expired = store.create_draft({})
+    store._store[expired] = (time.time() - 60,) + store._store[expired][1:]
+    kept = store.create_draft({})
+
+    assert store.get_draft(expired) is None
+    store.delete_draft(kept)
+    store.delete_draft(kept)
+
+    stats = store.stats()
+    assert stats["expirations"] == 1
+    assert stats["deleted"] == 1
+    assert stats["size"] == 0
+
+
+def test_reaper_task_sweeps_in_background():
+    store = drafts.DraftStore(expiry_seconds=0)
+    for i in range(5):
+        store.create_draft({"n": i})
+
+    async def main():
+        task = asyncio.create_task(store.run_reaper(interval_seconds=0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(main())
+
+    assert len(store) == 0
+    assert store.stats()["sweeps"] >= 1
+
+
+def test_bytes_are_tracked_per_draft_and_session():
+    store = drafts.DraftStore()
+    a = store.create_draft({"body": "x" * 1000}, session="s1")
+    store.create_draft({"body": "y" * 500}, session="s2")
+    assert store.session_usage("s1")["bytes"] > 1000
+    assert store.stats()["bytes"] == sum(e[2] for e in store._store.values())
+
+    store.delete_draft(a)
+    assert store.session_usage("s1") == {"count": 0, "bytes": 0}
+    assert store.stats()["sessions"] == 1
+
+
+def test_store_caps_evict_oldest_first():
+    store = drafts.DraftStore(max_count=3, session_max_count=10)
+    ids = [store.create_draft({"n": i}, session=f"s{i}") for i in range(5)]
+
+    assert [store.get_draft(did) for did in ids[:2]] == [None, None]
+    assert all(store.get_draft(did) for did in ids[2:])
+    assert store.stats()["evictions"] == 2
+    assert store.session_usage("s0")["count"] == 0
+
+    size = drafts.draft_size({"body": "z" * 1000})
+    store = drafts.DraftStore(max_bytes=size * 2, session_max_bytes=size * 10)
+    first = store.create_draft({"body": "z" * 1000}, session="a")
+    store.create_draft({"body": "z" * 1000}, session="b")
+    store.create_draft({"body": "z" * 1000}, session="c")
+    assert store.get_draft(first) is None
+    assert store.stats()["bytes"] <= size * 2
+
+
+def test_session_quotas_reject_instead_of_evicting():
+    store = drafts.DraftStore(session_max_count=2, session_max_bytes=4096)
+    store.create_draft({"n": 1}, session="greedy")
+    store.create_draft({"n": 2}, session="greedy")
+    with pytest.raises(drafts.DraftQuotaExceeded):
+        store.create_draft({"n": 3}, session="greedy")
+    # Other sessions are unaffected
+    store.create_draft({"n": 1}, session="polite")
+
+    with pytest.raises(drafts.DraftQuotaExceeded):
+        store.create_draft({"body": "x" * 5000}, session="polite")
+    assert store.stats()["rejected"] == 2
+    assert len(store) == 3
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import time
 from unittest.mock import patch
@@ -23,9 +24,9 @@ def flow_tools():
 @pytest.fixture(autouse=True)
 def clean_store():
     # Clear draft store before each test
-    drafts.store._store.clear()
+    drafts.store.clear()
     yield
-    drafts.store._store.clear()
+    drafts.store.clear()
 
 
 def test_prepare_success(flow_tools):
@@ -50,9 +51,11 @@ def test_confirm_flow(flow_tools):
     did = res["draft_id"]
 
     # 2. Confirm (with strict mocks)
-    with patch("tools.auth.get_token", return_value={"access_token": "mock-token"}):
-        with patch("tools.graph_client.send_mail") as mock_send:
-            confirm_res = confirm(did)
+    with patch(
+        "tools.auth.get_token_async", return_value={"access_token": "mock-token"}
+    ):
+        with patch("tools.graph_client.send_mail_async") as mock_send:
+            confirm_res = asyncio.run(confirm(did))
             mock_send.assert_called_once()
 
     assert "sent successfully" in confirm_res
@@ -61,8 +64,8 @@ def test_confirm_flow(flow_tools):
     assert drafts.store.get_draft(did) is None
 
     # 4. Confirm again (should fail)
-    retry = confirm(did)
-    assert "not found" in retry
+    retry = asyncio.run(confirm(did))
+    assert "already sent" in retry
 
 
 def test_expiration_logic(flow_tools):
@@ -82,7 +85,7 @@ def test_expiration_logic(flow_tools):
     # Current code: get_draft -> Check None -> Return Error.
     # So auth is NOT called.
     confirm = flow_tools["confirm_send"]
-    out = confirm(did)
+    out = asyncio.run(confirm(did))
     assert "not found or expired" in out
 
 
@@ -92,3 +95,13 @@ def test_prepare_validation_fail(flow_tools):
     res = prepare(to=["bad-email"], subject="X", body=".")
     assert "error" in res
     assert "Invalid email" in res["error"]
+
+
+def test_prepare_session_quota(flow_tools, monkeypatch):
+    monkeypatch.setattr(drafts.store, "session_max_count", 1)
+    prepare = flow_tools["prepare_email"]
+
+    assert "draft_id" in prepare(to=["a@example.com"], subject="1", body=".")
+    res = prepare(to=["a@example.com"], subject="2", body=".")
+    assert "error" in res
+    assert "quota" in res["error"]
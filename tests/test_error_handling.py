@@ -1,5 +1,6 @@
+import asyncio
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from tools import email_flow, drafts
 
 
@@ -21,9 +22,9 @@ def flow_tools():
 
 @pytest.fixture(autouse=True)
 def clean_store():
-    drafts.store._store.clear()
+    drafts.store.clear()
     yield
-    drafts.store._store.clear()
+    drafts.store.clear()
 
 
 def test_auth_error(flow_tools):
@@ -32,15 +33,15 @@ def test_auth_error(flow_tools):
     res = prepare(to=["user@example.com"], subject="AuthFail", body=".")
     did = res["draft_id"]
 
-    with patch("tools.auth.get_token", return_value={"access_token": "fake"}):
-        with patch("requests.post") as mock_post:
-            mock_post.return_value.ok = False
+    with patch("tools.auth.get_token_async", return_value={"access_token": "fake"}):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
+            mock_post.return_value.is_success = False
             mock_post.return_value.status_code = 401
             mock_post.return_value.json.return_value = {
                 "error": {"message": "Token expired"}
             }
 
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
             assert "Authentication failed" in msg
             assert "Token invalid or expired" in msg
 
@@ -51,15 +52,15 @@ def test_throttling_error(flow_tools):
     res = prepare(to=["user@example.com"], subject="Throttled", body=".")
     did = res["draft_id"]
 
-    with patch("tools.auth.get_token", return_value={"access_token": "fake"}):
-        with patch("requests.post") as mock_post:
-            mock_post.return_value.ok = False
+    with patch("tools.auth.get_token_async", return_value={"access_token": "fake"}):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
+            mock_post.return_value.is_success = False
             mock_post.return_value.status_code = 429
             mock_post.return_value.json.return_value = {
                 "error": {"message": "Too many requests"}
             }
 
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
             assert "Rate limit exceeded" in msg
 
 
@@ -69,15 +70,15 @@ def test_client_error(flow_tools):
     res = prepare(to=["user@example.com"], subject="BadReq", body=".")
     did = res["draft_id"]
 
-    with patch("tools.auth.get_token", return_value={"access_token": "fake"}):
-        with patch("requests.post") as mock_post:
-            mock_post.return_value.ok = False
+    with patch("tools.auth.get_token_async", return_value={"access_token": "fake"}):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
+            mock_post.return_value.is_success = False
             mock_post.return_value.status_code = 400
             mock_post.return_value.json.return_value = {
                 "error": {"message": "Bad Request Argument"}
             }
 
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
             assert "Invalid request" in msg
             assert "Bad Request Argument" in msg
 
@@ -88,12 +89,12 @@ def test_server_error(flow_tools):
     res = prepare(to=["user@example.com"], subject="ServerFail", body=".")
     did = res["draft_id"]
 
-    with patch("tools.auth.get_token", return_value={"access_token": "fake"}):
-        with patch("requests.post") as mock_post:
-            mock_post.return_value.ok = False
+    with patch("tools.auth.get_token_async", return_value={"access_token": "fake"}):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
+            mock_post.return_value.is_success = False
             mock_post.return_value.status_code = 503
             mock_post.return_value.text = "Service Unavailable"
             mock_post.return_value.json.side_effect = ValueError("No JSON")
 
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
             assert "Microsoft Graph Server Error" in msg
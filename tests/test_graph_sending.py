@@ -1,5 +1,6 @@
+import asyncio
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from tools import email_flow, drafts
 
 
@@ -21,9 +22,9 @@ def flow_tools():
 
 @pytest.fixture(autouse=True)
 def clean_store():
-    drafts.store._store.clear()
+    drafts.store.clear()
     yield
-    drafts.store._store.clear()
+    drafts.store.clear()
 
 
 def test_confirm_send_success(flow_tools):
@@ -37,14 +38,14 @@ def test_confirm_send_success(flow_tools):
     # 2. Mock Auth and Graph
     fake_token = {"access_token": "fake-jwt"}
 
-    with patch("tools.auth.get_token", return_value=fake_token):
-        with patch("requests.post") as mock_post:
+    with patch("tools.auth.get_token_async", return_value=fake_token):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
             # Simulate Success 202 Accepted
-            mock_post.return_value.ok = True
+            mock_post.return_value.is_success = True
             mock_post.return_value.status_code = 202
 
             # Confirm
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
 
             assert "sent successfully" in msg
 
@@ -65,16 +66,16 @@ def test_confirm_send_failure_keeps_draft(flow_tools):
     res = prepare(to=["fail@example.com"], subject="Fail", body=".")
     did = res["draft_id"]
 
-    with patch("tools.auth.get_token", return_value={"access_token": "tkn"}):
-        with patch("requests.post") as mock_post:
+    with patch("tools.auth.get_token_async", return_value={"access_token": "tkn"}):
+        with patch("httpx.AsyncClient.post", return_value=MagicMock()) as mock_post:
             # Simulate Error 500
-            mock_post.return_value.ok = False
+            mock_post.return_value.is_success = False
             mock_post.return_value.status_code = 500
             mock_post.return_value.text = "Internal Server Error"
             # Ensure json() returns dict or raises to trigger the text fallback
             mock_post.return_value.json.side_effect = ValueError("No JSON")
 
-            msg = confirm(did)
+            msg = asyncio.run(confirm(did))
 
             # Should return error message
             # Should return error message
@@ -82,3 +83,63 @@ def test_confirm_send_failure_keeps_draft(flow_tools):
 
     # 4. Verify Draft STILL EXISTS (for retry)
     assert drafts.store.get_draft(did) is not None
+
+
+def test_graph_client_is_shared_and_pooled():
+    from tools import graph_client
+
+    graph_client.close_client()
+    try:
+        client = graph_client.get_client()
+        assert graph_client.get_client() is client
+        assert client.timeout.connect == graph_client.GRAPH_CONNECT_TIMEOUT
+        assert client.timeout.read == graph_client.GRAPH_READ_TIMEOUT
+    finally:
+        graph_client.close_client()
+
+
+def test_network_error_maps_to_graph_error():
+    import httpx
+    from tools import graph_client
+
+    draft = {"to": ["a@example.com"], "subject": "S", "body": "B"}
+    with patch("httpx.Client.post", side_effect=httpx.ConnectError("refused")):
+        with pytest.raises(graph_client.GraphError, match="Network error"):
+            graph_client.send_mail("tkn", draft)
+
+
+def test_async_sends_overlap():
+    import httpx
+    import time
+    from tools import concurrency, graph_client
+
+    in_flight = 0
+    peak = 0
+
+    async def slow_graph(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return httpx.Response(202)
+
+    draft = {"to": ["a@example.com"], "subject": "S", "body": "B"}
+
+    async def send_many():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(slow_graph))
+        wide_open = concurrency.AdaptiveLimiter(initial_limit=100, max_limit=100)
+        with (
+            patch("tools.graph_client.get_async_client", return_value=client),
+            patch.object(concurrency, "limiter", wide_open),
+        ):
+            await asyncio.gather(
+                *(graph_client.send_mail_async("tkn", draft) for _ in range(100))
+            )
+        await client.aclose()
+
+    start = time.perf_counter()
+    asyncio.run(send_many())
+
+    assert peak == 100
+    assert time.perf_counter() - start < 2
@@ -0,0 +1,264 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from tools import config, drafts, email_flow, mail_merge, templates
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture
+def flow_tools():
+    mcp_mock = MockMCP()
+    email_flow.register(mcp_mock)  # type: ignore
+    return mcp_mock.tools
+
+
+@pytest.fixture(autouse=True)
+def merge_dir(tmp_path):
+    with patch.object(mail_merge, "MAIL_MERGE_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    drafts.store.clear()
+    yield
+    drafts.store.clear()
+
+
+class MergeGraph:
+    """$batch stand-in recording each rendered message; rejects subject "bad"."""
+
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        responses = []
+        for sub in json.loads(request.content)["requests"]:
+            message = sub["body"]["message"]
+            self.messages.append(message)
+            if message["subject"].startswith("bad"):
+                status, body = 400, {"error": {"message": "Bad recipient"}}
+            else:
+                status, body = 202, None
+            responses.append({"id": sub["id"], "status": status, "body": body})
+        return httpx.Response(200, json={"responses": responses})
+
+
+def _confirm(tool, graph, batch_id):
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(graph))
+        with (
+            patch("tools.graph_client.get_async_client", return_value=client),
+            patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        ):
+            result = await tool(batch_id)
+        await client.aclose()
+        return result
+
+    return asyncio.run(run())
+
+
+def test_template_compiles_once_and_renders_rows():
+    t = templates.Template("Hola {{ name }}, cuenta {{account}} ({{ name }})")
+    assert t.fields == ["name", "account"]
+    assert t.render({"name": "Ana", "account": 42}) == "Hola Ana, cuenta 42 (Ana)"
+    assert t.render({"name": None, "account": ""}) == "Hola , cuenta  ()"
+    with pytest.raises(templates.TemplateError, match="account"):
+        t.render({"name": "Ana"})
+
+    html = templates.Template("<p>{{ name }}</p>", escape_html=True)
+    assert html.render({"name": "<b>&"}) == "<p>&lt;b&gt;&amp;</p>"
+    assert templates.Template("no fields").render({}) == "no fields"
+
+
+def test_prepare_from_csv_streams_and_rejects_rows(flow_tools, tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_text(
+        "email,name,account\n"
+        "ana@example.com,Ana,1001\n"
+        "not-an-email,Bob,1002\n"
+        "ANA@example.com,Ana again,1003\n"
+        ",Nobody,1004\n"
+        "carl@example.com,Carl,1005\n",
+        encoding="utf-8",
+    )
+    result = flow_tools["prepare_mail_merge"](
+        subject="Cuenta {{ account }}",
+        body="Hola {{ name }}",
+        rows_file=str(path),
+    )
+
+    assert result["accepted"] == 2
+    assert result["rejected"] == 3
+    assert [(r["row"], r["error"]) for r in result["rejects"]] == [
+        (3, "Invalid email format detected"),
+        (4, "Duplicate recipient"),
+        (5, "Missing recipient field 'email'"),
+    ]
+    assert result["preview"] == {
+        "to": "ana@example.com",
+        "subject": "Cuenta 1001",
+        "body": "Hola Ana",
+    }
+    # The whole batch is one draft holding only the fields the template uses
+    data = drafts.store.get_draft(result["batch_id"])
+    assert data["kind"] == mail_merge.MERGE
+    assert data["rows"] == [
+        [2, "ana@example.com", {"account": "1001", "name": "Ana"}],
+        [6, "carl@example.com", {"account": "1005", "name": "Carl"}],
+    ]
+
+
+def test_prepare_from_jsonl_and_inline_rows(flow_tools, tmp_path):
+    path = tmp_path / "people.jsonl"
+    path.write_text(
+        '{"to": "ana@example.com", "name": "Ana"}\n'
+        "\n"
+        "{broken\n"
+        '{"to": "bob@example.com"}\n',
+        encoding="utf-8",
+    )
+    prepare = flow_tools["prepare_mail_merge"]
+    result = prepare(
+        subject="Hi", body="{{ name }}", rows_file=str(path), recipient_field="to"
+    )
+    assert result["accepted"] == 1
+    assert result["rejects"][0]["row"] == 3
+    assert result["rejects"][0]["error"].startswith("Invalid JSON")
+    assert result["rejects"][1] == {
+        "row": 4,
+        "to": "bob@example.com",
+        "error": "Missing field 'name'",
+    }
+
+    inline = prepare(subject="Hi", body="{{ name }}", rows=[{"email": "a@b.com"}])
+    assert "error" in inline and inline["rejected"] == 1
+
+    assert "exactly one" in prepare(subject="Hi", body=".")["error"]
+    xlsx = prepare(subject="Hi", body=".", rows_file=str(tmp_path / "a.xlsx"))
+    assert "Unknown row file format" in xlsx["error"]
+    missing = prepare(subject="Hi", body=".", rows_file=str(tmp_path / "a.csv"))
+    assert "a.csv" in missing["error"]
+
+
+def test_rows_file_must_be_utf8_and_under_merge_dir(flow_tools, tmp_path):
+    prepare = flow_tools["prepare_mail_merge"]
+    latin1 = tmp_path / "latin1.csv"
+    latin1.write_bytes("email,name\nana@example.com,José\n".encode("latin-1"))
+    result = prepare(subject="Hi", body="{{ name }}", rows_file=str(latin1))
+    assert "not UTF-8" in result["error"]
+
+    # A bad byte far into the file fails the whole batch, not just later rows
+    late = tmp_path / "late.csv"
+    rows = "".join(f"u{i}@example.com,U{i}\n" for i in range(2000))
+    late.write_bytes(f"email,name\n{rows}zoe@example.com,Zoë\n".encode("latin-1"))
+    result = prepare(subject="Hi", body="{{ name }}", rows_file=str(late))
+    assert "not UTF-8" in result["error"] and "accepted" not in result
+
+    outside = prepare(subject="Hi", body=".", rows_file="/etc/hostname")
+    assert "outside MAIL_MERGE_DIR" in outside["error"]
+    with patch.object(mail_merge, "MAIL_MERGE_DIR", ""):
+        result = prepare(subject="Hi", body=".", rows_file=str(latin1))
+    assert "MAIL_MERGE_DIR is not set" in result["error"]
+
+
+def test_prepare_applies_domain_policy(flow_tools):
+    config.runtime.swap(
+        config.MailerConfig.from_env({"ALLOWED_RECIPIENT_DOMAINS": "company.com"})
+    )
+    result = flow_tools["prepare_mail_merge"](
+        subject="Hi",
+        body=".",
+        rows=[{"email": "a@company.com"}, {"email": "b@evil.com"}],
+    )
+    assert result["accepted"] == 1
+    assert result["rejects"] == [
+        {"row": 2, "to": "b@evil.com", "error": "Domain not allowed by policy"}
+    ]
+
+
+def test_prepare_caps_rows(flow_tools):
+    rows = [{"email": f"u{i}@example.com"} for i in range(4)]
+    with patch.object(mail_merge, "MAIL_MERGE_MAX_ROWS", 3):
+        result = flow_tools["prepare_mail_merge"](subject="Hi", body=".", rows=rows)
+    assert result == {"error": "Too many rows (max 3)"}
+    assert len(drafts.store) == 0
+
+
+def test_confirm_sends_each_row_and_retries_failures(flow_tools):
+    rows = [
+        {"email": "ana@example.com", "kind": "ok"},
+        {"email": "bob@example.com", "kind": "bad"},
+        {"email": "eve@example.com", "kind": "ok"},
+    ]
+    batch_id = flow_tools["prepare_mail_merge"](
+        subject="{{ kind }} news",
+        body="<p>{{ email }}</p>",
+        content_type="HTML",
+        rows=rows,
+    )["batch_id"]
+
+    graph = MergeGraph()
+    result = _confirm(flow_tools["confirm_mail_merge"], graph, batch_id)
+
+    assert (result["sent"], result["failed"]) == (2, 1)
+    assert result["failures"][0]["to"] == "bob@example.com"
+    assert "Bad recipient" in result["failures"][0]["message"]
+    sent_to = [m["toRecipients"][0]["emailAddress"]["address"] for m in graph.messages]
+    assert sorted(sent_to) == ["ana@example.com", "bob@example.com", "eve@example.com"]
+    assert graph.messages[0]["body"] == {
+        "contentType": "HTML",
+        "content": "<p>ana@example.com</p>",
+    }
+
+    # The batch is spent; only the failed row can be sent again
+    again = _confirm(flow_tools["confirm_mail_merge"], MergeGraph(), batch_id)
+    assert "already sent" in again["error"]
+    retry = drafts.store.get_draft(result["retry_batch_id"])
+    assert [r[1] for r in retry["rows"]] == ["bob@example.com"]
+
+
+def test_batch_is_kept_when_nothing_was_sent(flow_tools):
+    batch_id = flow_tools["prepare_mail_merge"](
+        subject="Hi", body=".", rows=[{"email": "a@example.com"}]
+    )["batch_id"]
+
+    result = _confirm(
+        flow_tools["confirm_mail_merge"],
+        lambda request: httpx.Response(503, text="Service Unavailable"),
+        batch_id,
+    )
+    assert result["sent"] == 0 and "retry_batch_id" not in result
+    assert drafts.store.get_draft(batch_id) is not None
+
+
+def test_merge_batches_and_drafts_are_not_interchangeable(flow_tools):
+    batch_id = flow_tools["prepare_mail_merge"](
+        subject="Hi", body=".", rows=[{"email": "a@example.com"}]
+    )["batch_id"]
+    draft_id = flow_tools["prepare_email"](
+        to=["a@example.com"], subject="Hi", body="."
+    )["draft_id"]
+
+    assert "confirm_mail_merge" in asyncio.run(flow_tools["confirm_send"](batch_id))
+    many = asyncio.run(flow_tools["confirm_send_many"]([batch_id]))
+    assert "confirm_mail_merge" in many["results"][0]["message"]
+    assert (
+        "confirm_send"
+        in asyncio.run(flow_tools["confirm_mail_merge"](draft_id))["error"]
+    )
+    # Refused claims are released, not left locked
+    assert drafts.store.claim(batch_id)[0] == drafts.CLAIMED
+    assert drafts.store.claim(draft_id)[0] == drafts.CLAIMED
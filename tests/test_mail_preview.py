@@ -1,6 +1,4 @@
-import os
 import pytest
-from unittest.mock import patch
 
 # Import the code to test
 # Since 'tools' is a package, we can import it directly if pytest is run from root
@@ -68,32 +66,22 @@ def test_preview_body_too_large(preview_tool):
     assert any(i["type"] == "body_too_large" for i in result["issues"])
 
 
-@patch.dict(
-    os.environ, {"ALLOWED_RECIPIENT_DOMAINS": "company.com, trusted.org"}, clear=True
-)
 def test_preview_blocked_domain(preview_tool):
-    # Since the module reads env vars at IMPORT time, we might need to reload it
-    # OR refactor the module to read env vars at runtime.
-    # For now, let's assume the module logic reads global variables that we can patch?
-    # NO, the module does: _ALLOWED_DOMAINS = ... at module level.
-    # So patching os.environ here won't affect already imported module constants.
-
-    # We will manually patch the constant in the module for this test.
-    from tools import mail_preview
-
-    original_domains = mail_preview._ALLOWED_DOMAINS
-    mail_preview._ALLOWED_DOMAINS = {"company.com"}
-    try:
-        result = preview_tool(
-            to=["hacker@evil.com", "valid@company.com"], subject="Hack", body="."
+    from tools import config
+
+    config.runtime.swap(
+        config.MailerConfig.from_env(
+            {"ALLOWED_RECIPIENT_DOMAINS": "company.com, trusted.org"}
         )
-        assert result["ok"] is False
-        issues = result["issues"]
-        blocked_issue = next(i for i in issues if i["type"] == "blocked_domain")
-        assert "hacker@evil.com" in blocked_issue["items"]
-        assert "valid@company.com" not in blocked_issue["items"]
-    finally:
-        mail_preview._ALLOWED_DOMAINS = original_domains
+    )
+    result = preview_tool(
+        to=["hacker@evil.com", "valid@company.com"], subject="Hack", body="."
+    )
+    assert result["ok"] is False
+    issues = result["issues"]
+    blocked_issue = next(i for i in issues if i["type"] == "blocked_domain")
+    assert "hacker@evil.com" in blocked_issue["items"]
+    assert "valid@company.com" not in blocked_issue["items"]
 
 
 def test_normalize_emails(preview_tool):
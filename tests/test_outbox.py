@@ -0,0 +1,180 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from tools import drafts, email_flow, graph_client, outbox, rate_limit
+
+DRAFT = {"to": ["a@example.com"], "cc": [], "bcc": [], "subject": "S", "body": "B"}
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture
+def box(tmp_path):
+    b = outbox.Outbox(path=str(tmp_path / "outbox.sqlite3"), max_attempts=3)
+    yield b
+    b.close()
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    drafts.store.clear()
+    yield
+    drafts.store.clear()
+
+
+def test_enqueue_is_durable_and_uses_wal(tmp_path, box):
+    job_id = box.enqueue("draft-1", DRAFT)
+    box.close()
+
+    reopened = outbox.Outbox(path=box.path)
+    assert reopened.get(job_id)["status"] == outbox.QUEUED
+    mode = reopened._conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    reopened.close()
+
+
+def test_lease_is_exclusive_until_it_expires(box):
+    box.lease_seconds = 0.05
+    job_id = box.enqueue("draft-1", DRAFT)
+
+    job = box.lease()
+    assert job["id"] == job_id
+    assert job["data"]["subject"] == "S"
+    assert box.lease() is None
+
+    # Worker "crashed": the expired lease makes the job available again
+    time.sleep(0.06)
+    again = box.lease()
+    assert again["id"] == job_id
+    assert again["attempts"] == 2
+
+
+def test_slow_send_keeps_its_lease(box):
+    box.lease_seconds = 0.2
+    job_id = box.enqueue("draft-1", DRAFT)
+    job = box.lease()
+    pool = outbox.OutboxWorkerPool(box)
+    sends = []
+
+    async def slow_send(token, data):
+        sends.append(data)
+        await asyncio.sleep(0.5)
+
+    async def scenario():
+        task = asyncio.create_task(pool.process(job))
+        # Well past the original lease: the heartbeat keeps the job held
+        await asyncio.sleep(0.35)
+        stolen = await asyncio.to_thread(box.lease)
+        return await task, stolen
+
+    with (
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async", side_effect=slow_send),
+    ):
+        status, stolen = asyncio.run(scenario())
+    assert (status, stolen) == (outbox.SENT, None)
+    assert len(sends) == 1
+    assert box.get(job_id)["status"] == outbox.SENT
+
+
+def test_stale_lease_cannot_overwrite_new_holder(box):
+    box.lease_seconds = 0.05
+    job_id = box.enqueue("draft-1", DRAFT)
+    stale = box.lease()
+    time.sleep(0.06)
+    current = box.lease()
+
+    assert not box.renew(job_id, stale["lease_token"])
+    assert not box.complete(job_id, lease=stale["lease_token"])
+    assert box.fail(job_id, "late", 0, lease=stale["lease_token"]) is None
+    assert box.get(job_id)["status"] == outbox.SENDING
+    assert box.complete(job_id, lease=current["lease_token"])
+    assert box.get(job_id)["status"] == outbox.SENT
+
+
+def test_failures_retry_then_dead_letter(box):
+    job_id = box.enqueue("draft-1", DRAFT)
+    for _ in range(2):
+        box.lease()
+        assert box.fail(job_id, "busy", retry_in=0) == outbox.QUEUED
+    box.lease()
+    assert box.fail(job_id, "busy", retry_in=0) == outbox.DEAD
+    assert box.get(job_id)["last_error"] == "busy"
+    assert box.stats() == {outbox.DEAD: 1}
+
+
+def test_non_retryable_error_dead_letters_immediately(box):
+    job_id = box.enqueue("draft-1", DRAFT)
+    job = box.lease()
+    pool = outbox.OutboxWorkerPool(box)
+    bad = graph_client.GraphClientError("Bad recipient", status=400)
+
+    with (
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async", side_effect=bad),
+    ):
+        assert asyncio.run(pool.process(job)) == outbox.DEAD
+    assert "Bad recipient" in box.get(job_id)["last_error"]
+
+
+def test_throttled_job_is_requeued_after_retry_after(box):
+    job_id = box.enqueue("draft-1", DRAFT)
+    job = box.lease()
+    pool = outbox.OutboxWorkerPool(box)
+    throttled = graph_client.GraphThrottlingError("slow", status=429, retry_after=30)
+
+    with (
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async", side_effect=throttled),
+    ):
+        assert asyncio.run(pool.process(job)) == outbox.QUEUED
+    assert box.get(job_id)["available_at"] >= time.time() + 25
+    assert box.lease() is None
+    # The mailbox is charged when the retry actually sends, not now
+    assert rate_limit.limiter.status()["refunded"] == 1
+
+
+def test_confirm_send_enqueues_and_workers_deliver(box):
+    mcp = MockMCP()
+    email_flow.register(mcp)  # type: ignore
+    did = mcp.tools["prepare_email"](to=["a@example.com"], subject="S", body=".")[
+        "draft_id"
+    ]
+    pool = outbox.OutboxWorkerPool(box, workers=2)
+
+    async def scenario():
+        msg = await mcp.tools["confirm_send"](did)
+        job_id = msg.split("Job id: ")[1].split(".")[0]
+        assert (await mcp.tools["get_send_status"](job_id))["status"] == "queued"
+
+        runner = asyncio.create_task(pool.run())
+        for _ in range(100):
+            if (await mcp.tools["get_send_status"](job_id))["status"] == "sent":
+                break
+            await asyncio.sleep(0.02)
+        runner.cancel()
+        return job_id
+
+    with (
+        patch.object(outbox, "OUTBOX_ENABLED", True),
+        patch.object(outbox, "OUTBOX_POLL_SECONDS", 0.01),
+        patch.object(outbox, "outbox", box),
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async") as mock_send,
+    ):
+        job_id = asyncio.run(scenario())
+
+    mock_send.assert_called_once()
+    assert box.get(job_id)["status"] == "sent"
+    # The draft moved into the outbox, so it cannot be confirmed twice
+    assert drafts.store.get_draft(did) is None
@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from tools import concurrency, outbox
+
+DRAFT = {"to": ["a@example.com"], "cc": [], "bcc": [], "subject": "S", "body": "B"}
+
+
+def test_weighted_lanes_share_turns_by_weight():
+    lanes = concurrency.WeightedLanes({"interactive": 4, "bulk": 1})
+    picks = [lanes.pick(["interactive", "bulk"]) for _ in range(50)]
+    assert picks.count("interactive") == 40
+    assert picks.count("bulk") == 10
+
+
+def test_idle_lane_does_not_bank_credit():
+    lanes = concurrency.WeightedLanes({"interactive": 4, "bulk": 1})
+    for _ in range(100):
+        assert lanes.pick(["bulk"]) == "bulk"
+    # Interactive arriving late competes at its weight, it does not monopolise
+    picks = [lanes.pick(["interactive", "bulk"]) for _ in range(10)]
+    assert picks.count("bulk") in (1, 2)
+
+
+def test_interactive_overtakes_bulk_backlog():
+    limiter = concurrency.AdaptiveLimiter(initial_limit=1, max_limit=1)
+    order = []
+
+    async def send(lane, name):
+        async with limiter.slot(lane):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def main():
+        bulk = [asyncio.create_task(send("bulk", f"b{i}")) for i in range(20)]
+        await asyncio.sleep(0)
+        urgent = asyncio.create_task(send("interactive", "urgent"))
+        await asyncio.gather(*bulk, urgent)
+
+    asyncio.run(main())
+
+    # Behind 20 queued bulk sends, the interactive one is served within a few
+    assert order.index("urgent") <= 3
+    lanes = limiter.snapshot()["lanes"]
+    assert lanes["bulk"]["wait_ms"]["count"] == 20
+    assert lanes["interactive"]["wait_ms"]["count"] == 1
+    assert lanes["interactive"]["waiting"] == 0
+    assert sum(lanes["bulk"]["wait_ms"]["histogram"].values()) == 20
+
+
+def test_outbox_leases_weighted_across_lanes(tmp_path):
+    box = outbox.Outbox(path=str(tmp_path / "outbox.sqlite3"))
+    box._lanes = concurrency.WeightedLanes({"interactive": 4, "bulk": 1})
+    for i in range(20):
+        box.enqueue(f"bulk-{i}", DRAFT, lane="bulk")
+    urgent = box.enqueue("urgent", DRAFT, lane="interactive")
+
+    first = box.lease()
+    assert first["id"] == urgent
+    assert first["lane"] == "interactive"
+
+    stats = box.lane_stats()
+    assert stats["bulk"]["queued"] == 20
+    assert stats["interactive"]["queued"] == 0
+    assert stats["interactive"]["wait_ms"]["count"] >= 1
+    box.close()
+
+
+def test_outbox_migrates_databases_without_lane_column(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    db = sqlite3.connect(path)
+    db.executescript(
+        outbox._SCHEMA.replace("    lane TEXT NOT NULL DEFAULT 'interactive',\n", "")
+    )
+    db.execute(
+        "INSERT INTO jobs (id, draft_id, payload, status, available_at,"
+        " created_at, updated_at) VALUES ('j1', 'd1', '{}', 'queued', 0, 0, 0)"
+    )
+    db.commit()
+    db.close()
+
+    box = outbox.Outbox(path=path)
+    job = box.lease()
+    assert job["id"] == "j1"
+    assert job["lane"] == "interactive"
+    box.close()
+
+
+@pytest.mark.parametrize("lane", ["interactive", "bulk"])
+def test_worker_tags_graph_requests_with_job_lane(tmp_path, lane, monkeypatch):
+    box = outbox.Outbox(path=str(tmp_path / "outbox.sqlite3"))
+    box.enqueue("d1", DRAFT, lane=lane)
+    seen = []
+
+    async def fake_token():
+        return {"access_token": "t"}
+
+    async def fake_send(token, data):
+        seen.append(concurrency.current_lane.get())
+
+    monkeypatch.setattr(outbox.auth, "get_token_async", fake_token)
+    monkeypatch.setattr(outbox.graph_client, "send_mail_async", fake_send)
+
+    pool = outbox.OutboxWorkerPool(box, workers=1)
+    assert asyncio.run(pool.process(box.lease())) == outbox.SENT
+    assert seen == [lane]
+    box.close()
@@ -0,0 +1,169 @@
+import asyncio
+import math
+from unittest.mock import patch
+
+import pytest
+
+from tools import drafts, email_flow, graph_client, rate_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture(autouse=True)
+def clean_store():
+    drafts.store.clear()
+    yield
+    drafts.store.clear()
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = rate_limit.TokenBucket(capacity=2, refill_per_second=1, clock=clock)
+
+    assert bucket.wait_time(2) == 0
+    bucket.take(2)
+    assert bucket.wait_time(1) == 1.0
+    clock.now += 0.5
+    assert bucket.wait_time(1) == 0.5
+    assert math.isinf(bucket.wait_time(3))
+
+
+def test_messages_per_minute_queues_then_rejects():
+    clock = FakeClock()
+    limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=2, recipients_per_day=100, max_wait_seconds=30, clock=clock
+    )
+
+    assert limiter.reserve("me", 1) == 0
+    assert limiter.reserve("me", 1) == 0
+    # Third message waits for one token: 60s / 2 = 30s
+    assert limiter.reserve("me", 1) == pytest.approx(30)
+    # Fourth would queue behind it for 60s: rejected with an accurate time
+    with pytest.raises(rate_limit.RateLimitExceeded) as exc:
+        limiter.reserve("me", 1)
+    assert exc.value.available_at_iso != "never"
+
+    # Other mailboxes have their own buckets
+    assert limiter.reserve("other@example.com", 1) == 0
+
+    status = limiter.status()
+    assert status["accepted"] == 3
+    assert status["delayed"] == 1
+    assert status["rejected"] == 1
+    assert status["mailboxes"]["me"]["messages_per_minute"]["queued"] == 1
+
+
+def test_recipients_per_day_rejects_oversized_send():
+    limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=30, recipients_per_day=5, clock=FakeClock()
+    )
+    with pytest.raises(rate_limit.RateLimitExceeded) as exc:
+        limiter.reserve("me", 6)
+    assert exc.value.available_at_iso == "never"
+
+
+def test_confirm_send_rejected_before_reaching_graph():
+    mcp = MockMCP()
+    email_flow.register(mcp)  # type: ignore
+    did = mcp.tools["prepare_email"](to=["a@example.com"], subject="S", body=".")[
+        "draft_id"
+    ]
+    exhausted = rate_limit.MailboxRateLimiter(
+        messages_per_minute=1, max_wait_seconds=0, clock=FakeClock()
+    )
+    exhausted.reserve("me", 1)
+
+    with (
+        patch.object(rate_limit, "limiter", exhausted),
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async") as mock_send,
+    ):
+        msg = asyncio.run(mcp.tools["confirm_send"](did))
+
+    mock_send.assert_not_called()
+    assert "Available at" in msg
+    assert drafts.store.get_draft(did) is not None
+
+
+def test_refund_gives_capacity_back_up_to_the_limit():
+    clock = FakeClock()
+    limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=2, recipients_per_day=10, max_wait_seconds=0, clock=clock
+    )
+    limiter.reserve("me", 4)
+    limiter.reserve("me", 4)
+    limiter.refund("me", 4)
+    assert limiter.reserve("me", 4) == 0
+
+    limiter.refund("me", 4)
+    limiter.refund("me", 4)
+    limiter.refund("me", 4)
+    buckets = limiter.status()["mailboxes"]["me"]
+    assert buckets["messages_per_minute"]["available"] == 2
+    assert buckets["recipients_per_day"]["available"] == 10
+    # Nothing was reserved for an unknown mailbox
+    limiter.refund("other@example.com", 1)
+    assert "other@example.com" not in limiter.status()["mailboxes"]
+    assert limiter.status()["refunded"] == 4
+
+
+def test_cancelled_wait_is_refunded():
+    limiter = rate_limit.MailboxRateLimiter(
+        messages_per_minute=1, max_wait_seconds=120, clock=FakeClock()
+    )
+    limiter.reserve("me", 1)
+
+    async def main():
+        task = asyncio.create_task(limiter.acquire("me", 1))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter.status()["mailboxes"]["me"]["messages_per_minute"]["queued"] == 0
+
+
+def test_failed_sends_do_not_use_up_the_limit():
+    mcp = MockMCP()
+    email_flow.register(mcp)  # type: ignore
+    prepare = mcp.tools["prepare_email"]
+    ids = [
+        prepare(to=[f"u{i}@example.com"], subject="S", body=".")["draft_id"]
+        for i in range(3)
+    ]
+    one_a_minute = rate_limit.MailboxRateLimiter(
+        messages_per_minute=1, max_wait_seconds=0, clock=FakeClock()
+    )
+    failure = graph_client.GraphServerError("boom", 503)
+
+    with (
+        patch.object(rate_limit, "limiter", one_a_minute),
+        patch("tools.auth.get_token_async", return_value={"access_token": "t"}),
+        patch("tools.graph_client.send_mail_async", side_effect=[failure, None]),
+        patch(
+            "tools.graph_client.send_mail_batch_async",
+            return_value={ids[1]: failure},
+        ),
+    ):
+        assert "Server Error" in asyncio.run(mcp.tools["confirm_send"](ids[0]))
+        # The failed batch send is refunded too
+        result = asyncio.run(mcp.tools["confirm_send_many"]([ids[1]]))
+        assert result["failed"] == 1
+        # ...so the one message a minute is still there for the retry
+        assert "successfully" in asyncio.run(mcp.tools["confirm_send"](ids[0]))
@@ -0,0 +1,194 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from tools import config, domain_policy, recipient_import
+
+
+class MockMCP:
+    def __init__(self):
+        self.tools = {}
+
+    def tool(self, func):
+        self.tools[func.__name__] = func
+        return func
+
+
+@pytest.fixture(autouse=True)
+def import_dir(tmp_path):
+    with patch.object(recipient_import, "RECIPIENT_IMPORT_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def import_tool():
+    mcp_mock = MockMCP()
+    recipient_import.register(mcp_mock)  # type: ignore
+    return mcp_mock.tools["import_recipients"]
+
+
+def _plan(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _cfg(**env):
+    return config.MailerConfig.from_env({k: str(v) for k, v in env.items()})
+
+
+def test_compact_hash_set_grows_without_losing_keys():
+    seen = recipient_import.CompactHashSet(capacity=4)
+    keys = [f"user{i}@example.com" for i in range(10_000)]
+    assert all(seen.add(k) for k in keys)
+    assert not any(seen.add(k) for k in keys)
+    assert len(seen) == 10_000
+    # Half-full at most: 8 bytes per slot, 16-32 bytes per key
+    assert 16 * len(seen) <= seen.nbytes <= 32 * len(seen)
+
+
+def test_csv_is_normalized_deduplicated_and_chunked(tmp_path):
+    path = tmp_path / "list.csv"
+    path.write_text(
+        "name,email\n"
+        "Ana, ana@example.com \n"
+        "Ana again,ANA@Example.com\n"
+        "Bob,not-an-email\n"
+        "Nobody,\n"
+        "Short\n" + "".join(f"U{i},u{i}@example.com\n" for i in range(6)),
+        encoding="utf-8",
+    )
+    summary = recipient_import.build_send_plan(str(path), cfg=_cfg(MAX_RECIPIENTS=3))
+
+    assert summary["plan_path"] == str(tmp_path / "list.plan.jsonl")
+    assert (summary["rows"], summary["accepted"]) == (11, 7)
+    assert summary["duplicates"] == 1
+    assert summary["rejected_by_reason"] == {
+        "unreadable": 0,
+        "missing": 2,
+        "invalid_email": 1,
+        "blocked_domain": 0,
+    }
+    assert [(r["row"], r["reason"]) for r in summary["rejects"]] == [
+        (4, "invalid_email"),
+        (5, "missing"),
+        (6, "missing"),
+    ]
+    plan = _plan(summary["plan_path"])
+    assert [c["count"] for c in plan] == [3, 3, 1]
+    assert plan[0]["recipients"] == [
+        "ana@example.com",
+        "u0@example.com",
+        "u1@example.com",
+    ]
+    assert summary["chunks"] == 3 and summary["chunk_size"] == 3
+
+
+def test_jsonl_with_smaller_chunks_and_bad_lines(tmp_path):
+    path = tmp_path / "list.jsonl"
+    lines = [json.dumps({"mail": f"u{i}@example.com"}) for i in range(5)]
+    lines.insert(2, "{broken")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    summary = recipient_import.build_send_plan(
+        str(path),
+        plan_path=str(tmp_path / "plan.jsonl"),
+        field="mail",
+        chunk_size=2,
+        cfg=_cfg(MAX_RECIPIENTS=10),
+    )
+    assert summary["accepted"] == 5
+    assert summary["rejects"][0]["reason"] == "unreadable"
+    assert summary["rejects"][0]["error"].startswith("Invalid JSON")
+    assert [c["count"] for c in _plan(tmp_path / "plan.jsonl")] == [2, 2, 1]
+
+
+def test_domain_policy_blocks_and_caps_chunks(tmp_path):
+    path = tmp_path / "list.csv"
+    path.write_text(
+        "email\n"
+        + "".join(f"p{i}@partner.org\n" for i in range(5))
+        + "".join(f"c{i}@corp.com\n" for i in range(3))
+        + "x@evil.com\n",
+        encoding="utf-8",
+    )
+    policy = domain_policy.parse_policy(
+        {
+            "default": "deny",
+            "allow": ["corp.com"],
+            "rules": [{"domain": "partner.org", "max_recipients": 2}],
+        }
+    )
+    with patch.object(domain_policy, "current", return_value=policy):
+        summary = recipient_import.build_send_plan(
+            str(path), cfg=_cfg(MAX_RECIPIENTS=4)
+        )
+
+    assert summary["rejected_by_reason"]["blocked_domain"] == 1
+    plan = _plan(summary["plan_path"])
+    # partner.org recipients never share a chunk beyond their own cap
+    for chunk in plan:
+        partner = [r for r in chunk["recipients"] if r.endswith("@partner.org")]
+        assert len(partner) <= 2 and chunk["count"] <= 4
+    assert sum(c["count"] for c in plan) == 8
+
+
+def test_tool_reports_unusable_files(import_tool, tmp_path):
+    path = tmp_path / "list.csv"
+    path.write_text("name\nAna\n", encoding="utf-8")
+
+    result = asyncio.run(import_tool(str(path)))
+    assert "no 'email' column" in result["error"]
+    assert not (tmp_path / "list.plan.jsonl").exists()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    result = asyncio.run(import_tool(str(tmp_path / "missing.jsonl")))
+    assert "missing.jsonl" in result["error"]
+
+    path.write_bytes("email\nJosé@example.com\n".encode("latin-1"))
+    result = asyncio.run(import_tool(str(path)))
+    assert "not UTF-8" in result["error"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+    path.write_text("email\na@example.com\n", encoding="utf-8")
+    result = asyncio.run(import_tool(str(path)))
+    assert result["accepted"] == 1 and result["chunks"] == 1
+
+
+def test_paths_are_confined_to_import_dir(import_tool, tmp_path):
+    path = tmp_path / "list.csv"
+    path.write_text("email\na@example.com\n", encoding="utf-8")
+
+    result = asyncio.run(import_tool(str(path), plan_path="/tmp/elsewhere.jsonl"))
+    assert "outside RECIPIENT_IMPORT_DIR" in result["error"]
+    result = asyncio.run(import_tool("../list.csv"))
+    assert "outside RECIPIENT_IMPORT_DIR" in result["error"]
+
+    # Relative paths are taken from the directory
+    result = asyncio.run(import_tool("list.csv", plan_path="out.jsonl"))
+    assert result["plan_path"] == str(tmp_path / "out.jsonl")
+
+    with patch.object(recipient_import, "RECIPIENT_IMPORT_DIR", ""):
+        result = asyncio.run(import_tool(str(path)))
+    assert "RECIPIENT_IMPORT_DIR is not set" in result["error"]
+
+
+def test_only_a_previous_plan_is_replaced(import_tool, tmp_path):
+    path = tmp_path / "list.csv"
+    path.write_text("email\na@example.com\n", encoding="utf-8")
+    precious = tmp_path / "notes.txt"
+    precious.write_text("keep me\n", encoding="utf-8")
+
+    result = asyncio.run(import_tool(str(path), plan_path=str(precious)))
+    assert "not a send plan" in result["error"]
+    assert precious.read_text(encoding="utf-8") == "keep me\n"
+    result = asyncio.run(import_tool(str(path), plan_path=str(path)))
+    assert "not a send plan" in result["error"]
+
+    first = asyncio.run(import_tool(str(path)))
+    path.write_text("email\na@example.com\nb@example.com\n", encoding="utf-8")
+    second = asyncio.run(import_tool(str(path)))
+    assert second["plan_path"] == first["plan_path"]
+    assert _plan(second["plan_path"])[0]["count"] == 2
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,98 @@
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from tools import graph_client, retry
+
+DRAFT = {"to": ["a@example.com"], "subject": "S", "body": "B"}
+
+
+def _send_with(handler, policy=None):
+    calls = []
+
+    def recording(request):
+        calls.append(request)
+        return handler(len(calls))
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(recording))
+        try:
+            with patch("tools.graph_client.get_async_client", return_value=client):
+                if policy is not None:
+                    with patch.object(retry, "default_policy", policy):
+                        await graph_client.send_mail_async("tkn", DRAFT)
+                else:
+                    await graph_client.send_mail_async("tkn", DRAFT)
+        finally:
+            await client.aclose()
+
+    return calls, run
+
+
+def test_throttled_send_is_retried_after_retry_after():
+    def handler(n):
+        if n == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(202)
+
+    calls, run = _send_with(handler)
+    before = retry.metrics.snapshot()
+    asyncio.run(run())
+    after = retry.metrics.snapshot()
+
+    assert len(calls) == 2
+    assert after["retries_by_reason"].get("429", 0) == (
+        before["retries_by_reason"].get("429", 0) + 1
+    )
+    assert after["retry_after_honoured"] == before["retry_after_honoured"] + 1
+
+
+def test_ambiguous_server_error_is_not_resent():
+    # A 504 may have been delivered: resending sendMail could double send
+    calls, run = _send_with(lambda n: httpx.Response(504))
+    with pytest.raises(graph_client.GraphServerError):
+        asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_unavailable_is_retried_until_attempts_run_out():
+    policy = retry.RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+    calls, run = _send_with(lambda n: httpx.Response(503), policy)
+    with pytest.raises(graph_client.GraphServerError):
+        asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_deadline_budget_stops_long_retry_after():
+    policy = retry.RetryPolicy(deadline_seconds=5)
+    calls, run = _send_with(
+        lambda n: httpx.Response(429, headers={"Retry-After": "120"}), policy
+    )
+    with pytest.raises(graph_client.GraphThrottlingError):
+        asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_connect_error_is_retried_but_read_timeout_is_not():
+    connect_failed = graph_client._network_error(httpx.ConnectError("refused"))
+    read_timeout = graph_client._network_error(httpx.ReadTimeout("slow"))
+
+    assert retry.retry_reason(connect_failed, idempotent=False) == "network"
+    assert retry.retry_reason(read_timeout, idempotent=False) is None
+    assert retry.retry_reason(read_timeout, idempotent=True) == "network"
+
+
+def test_backoff_uses_full_jitter_within_cap():
+    policy = retry.RetryPolicy(max_attempts=10, base_delay=1, max_delay=4)
+    error = graph_client.GraphServerError("unavailable", status=503)
+    for attempt in range(1, 8):
+        delay = policy.next_delay(error, attempt, elapsed=0, idempotent=False)
+        assert 0 <= delay <= min(4, 2 ** (attempt - 1))
+
+
+def test_parse_retry_after_http_date():
+    assert graph_client._parse_retry_after("7") == 7.0
+    assert graph_client._parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert graph_client._parse_retry_after(None) is None
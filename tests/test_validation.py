@@ -0,0 +1,85 @@
+import time
+
+from tools import config, mail_preview, validation
+
+
+def _validate(to, cc=None, bcc=None, allowed=(), max_recipients=10_000):
+    return validation.validate_message(
+        to,
+        "Subject",
+        "Body",
+        cc,
+        bcc,
+        policy=config.MailerConfig(allowed_domains=allowed).allowlist_policy,
+        max_recipients=max_recipients,
+        max_body_chars=5000,
+    )
+
+
+def test_single_pass_normalizes_and_classifies():
+    result = _validate(
+        to=[" A@Corp.com ", "a@corp.com", "", "bad-address", "x@evil.com"],
+        cc=["a@corp.com"],
+        allowed={"corp.com"},
+    )
+    assert result.to == ["A@Corp.com", "bad-address", "x@evil.com"]
+    # De-duplication is per field, as before
+    assert result.cc == ["a@corp.com"]
+    assert result.invalid == ["bad-address"]
+    assert result.blocked == ["x@evil.com"]
+    assert [i["type"] for i in result.issues] == ["invalid_email", "blocked_domain"]
+    assert result.issue("blocked_domain")["allowed_domains"] == ["corp.com"]
+
+
+def test_issue_order_and_limits():
+    result = validation.validate_message(
+        [],
+        " ",
+        "x" * 11,
+        cc=["a@example.com", "b@example.com"],
+        policy=config.MailerConfig().allowlist_policy,
+        max_recipients=1,
+        max_body_chars=10,
+    )
+    assert [i["type"] for i in result.issues] == [
+        "missing_to",
+        "too_many_recipients",
+        "body_too_large",
+        "empty_subject",
+    ]
+    assert result.issue("too_many_recipients")["count"] == 2
+
+
+def test_domain_decisions_are_cached_per_config_snapshot():
+    cfg = config.MailerConfig(allowed_domains={"corp.com"})
+    policy = cfg.allowlist_policy
+    for i in range(100):
+        validation.validate_message(
+            [f"user{i}@corp.com"],
+            "Subject",
+            "Body",
+            policy=policy,
+            max_recipients=10,
+            max_body_chars=100,
+        )
+    assert list(policy._cache) == ["corp.com"]
+
+
+def test_large_lists_validate_in_linear_time():
+    def timed(n):
+        rcpts = [f"user{i}@domain{i % 50}.com" for i in range(n)]
+        start = time.perf_counter()
+        result = _validate(rcpts, allowed={f"domain{i}.com" for i in range(25)})
+        elapsed = time.perf_counter() - start
+        assert len(result.blocked) == n // 2
+        return elapsed
+
+    small, large = timed(5_000), timed(50_000)
+    # 10x the recipients should cost about 10x, nowhere near 100x
+    assert large < small * 30
+
+
+def test_mail_preview_helpers_use_the_engine():
+    assert mail_preview._is_valid_email(" a@b.co ")
+    assert not mail_preview._is_valid_email("a@b")
+    assert mail_preview._normalize_emails([" A@b.co", "a@B.co", ""]) == ["A@b.co"]
@@ -0,0 +1,222 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tools import attachments
+
+# --- config (leída al importar el módulo) ---
+# Encoded (base64) attachment bytes kept in memory; 0 disables the cache
+ATTACHMENT_CACHE_MAX_BYTES = int(
+    os.getenv("ATTACHMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+# Entries pushed out of memory are spilled here, up to this size; 0 disables
+ATTACHMENT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("ATTACHMENT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))
+)
+# Spill directory; a private temporary directory when unset
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", "")
+
+
+class AttachmentCache:
+    """
+    Base64-encoded attachment content keyed by content hash, so the same file
+    attached to many drafts (or one draft sent to many recipients) is read
+    and encoded once.
+
+    Memory is an LRU bounded by `max_bytes`. Entries it pushes out are
+    spilled to disk (another LRU, bounded by `disk_max_bytes`) and read back
+    on the next use instead of being re-encoded. Concurrent misses for one
+    key wait for a single encoder.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = ATTACHMENT_CACHE_MAX_BYTES,
+        disk_max_bytes: int = ATTACHMENT_CACHE_DISK_MAX_BYTES,
+        directory: str = ATTACHMENT_CACHE_DIR,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._directory = directory
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._encoding: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.disk_bytes = 0
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.bytes_saved = 0
+        self.spills = 0
+        self.evictions = 0
+
+    def iter_encoded(self, item: Dict[str, Any]) -> Iterator[bytes]:
+        """The base64 content of an inline attachment, cached when possible."""
+        key = item.get("sha256")
+        if key is None or attachments.encoded_size(item["size"]) > self.max_bytes:
+            with self._lock:
+                self.uncached += 1
+            yield from attachments.iter_base64(item)
+            return
+        attachments.check_unchanged(item)
+        yield self.get_or_encode(key, item)
+
+    def get_or_encode(self, key: str, item: Dict[str, Any]) -> bytes:
+        data = self._memory_hit(key, item)
+        if data is not None:
+            return data
+        with self._lock:
+            gate = self._encoding.setdefault(key, threading.Lock())
+        with gate:
+            # Whoever held the gate may have filled the entry meanwhile
+            data = self._memory_hit(key, item)
+            if data is not None:
+                return data
+            data = self._read_spilled(key, attachments.encoded_size(item["size"]))
+            with self._lock:
+                if data is not None:
+                    self.disk_hits += 1
+                    self.bytes_saved += item["size"]
+                else:
+                    self.misses += 1
+            if data is None:
+                data = b"".join(attachments.iter_base64(item))
+            self._insert(key, data)
+            with self._lock:
+                self._encoding.pop(key, None)
+        return data
+
+    def _memory_hit(self, key: str, item: Dict[str, Any]) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.bytes_saved += item["size"]
+            return data
+
+    def _insert(self, key: str, data: bytes) -> None:
+        evicted: List[Tuple[str, bytes]] = []
+        with self._lock:
+            if key not in self._memory:
+                self._memory[key] = data
+                self.bytes += len(data)
+            while self.bytes > self.max_bytes and len(self._memory) > 1:
+                old_key, old = self._memory.popitem(last=False)
+                self.bytes -= len(old)
+                evicted.append((old_key, old))
+        for old_key, old in evicted:
+            self._spill(old_key, old)
+
+    # --- disk tier ---
+
+    def _spill_path(self, key: str) -> str:
+        if not self._directory:
+            self._directory = tempfile.mkdtemp(prefix="mcp-mail-attachments-")
+        else:
+            os.makedirs(self._directory, exist_ok=True)
+        return os.path.join(self._directory, f"{key}.b64")
+
+    def _spill(self, key: str, data: bytes) -> None:
+        with self._lock:
+            if key in self._disk:
+                # Spilled before and promoted since: the file is still there
+                self._disk.move_to_end(key)
+                return
+            if len(data) > self.disk_max_bytes:
+                self.evictions += 1
+                return
+        path = self._spill_path(key)
+        try:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"Attachment cache spill failed: {e}")
+            with self._lock:
+                self.evictions += 1
+            return
+        dropped: List[str] = []
+        with self._lock:
+            self._disk[key] = len(data)
+            self.disk_bytes += len(data)
+            self.spills += 1
+            while self.disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self.disk_bytes -= size
+                self.evictions += 1
+                dropped.append(old_key)
+        for old_key in dropped:
+            self._unlink(old_key)
+
+    def _read_spilled(self, key: str, expected_size: int) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(os.path.join(self._directory, f"{key}.b64"), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        if len(data) != expected_size:
+            # Spill file lost or truncated: forget it and re-encode
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self.disk_bytes -= size
+            return None
+        return data
+
+    def _unlink(self, key: str) -> None:
+        try:
+            os.remove(os.path.join(self._directory, f"{key}.b64"))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._disk)
+            self._memory.clear()
+            self._disk.clear()
+            self._encoding.clear()
+            self.bytes = 0
+            self.disk_bytes = 0
+            self._reset_counters()
+        for key in keys:
+            self._unlink(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self.disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "uncached": self.uncached,
+                "hit_rate": (
+                    round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+                ),
+                "bytes_saved": self.bytes_saved,
+                "spills": self.spills,
+                "evictions": self.evictions,
+            }
+
+
+# Global singleton instance
+cache = AttachmentCache()
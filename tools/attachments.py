@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from tools import local_files
+
+# --- config (leída al importar el módulo) ---
+# Attachments are inlined in sendMail while their combined size stays under
+# this; larger ones go through a Graph upload session (Graph caps requests at 4 MB)
+ATTACHMENT_INLINE_MAX_BYTES = int(
+    os.getenv("ATTACHMENT_INLINE_MAX_BYTES", str(3 * 1024 * 1024))
+)
+# Largest single attachment Graph accepts through an upload session
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(150 * 1024 * 1024)))
+# Attachments must be files under this directory; none are accepted while it
+# is empty
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "")
+
+# Upload session chunks must be multiples of 320 KiB
+UPLOAD_CHUNK_UNIT = 320 * 1024
+ATTACHMENT_UPLOAD_CHUNK_BYTES = max(
+    UPLOAD_CHUNK_UNIT,
+    int(os.getenv("ATTACHMENT_UPLOAD_CHUNK_BYTES", str(10 * UPLOAD_CHUNK_UNIT)))
+    // UPLOAD_CHUNK_UNIT
+    * UPLOAD_CHUNK_UNIT,
+)
+
+INLINE, UPLOAD = "inline", "upload"
+
+# Inline attachments are read and base64-encoded this much at a time; a
+# multiple of 3 so the encoded chunks concatenate without padding in between
+ENCODE_CHUNK_BYTES = 3 * 64 * 1024
+
+# (path, size, mtime_ns) -> sha256, so re-attaching an unchanged file in
+# many drafts hashes it once
+_HASH_MEMO_SIZE = 1024
+_hash_memo: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_hash_memo_lock = threading.Lock()
+
+
+class AttachmentError(ValueError):
+    """An attachment is missing, too large, outside ATTACHMENT_DIR, protected or changed."""
+
+
+def _resolve(path: str) -> str:
+    try:
+        return local_files.confine(path, ATTACHMENT_DIR, "ATTACHMENT_DIR")
+    except local_files.LocalPathError as e:
+        raise AttachmentError(str(e)) from None
+
+
+def content_hash(path: str, size: int, mtime_ns: int) -> str:
+    """SHA-256 of a file's content, memoized while size and mtime match."""
+    key = (path, size, mtime_ns)
+    digest = _hash_memo.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        with _hash_memo_lock:
+            _hash_memo[key] = digest
+            if len(_hash_memo) > _HASH_MEMO_SIZE:
+                _hash_memo.popitem(last=False)
+    return digest
+
+
+def describe(
+    paths: List[str],
+    inline_max_bytes: int = ATTACHMENT_INLINE_MAX_BYTES,
+    max_bytes: int = ATTACHMENT_MAX_BYTES,
+) -> List[Dict[str, Any]]:
+    """
+    Checks local files and returns their draft metadata (never their content).
+
+    Each entry records size and mtime so a file edited after prepare_email is
+    refused at send time, and whether it is sent inline or uploaded. Inline
+    files also get their content hash, the key of the encoded-content cache.
+    """
+    items: List[Dict[str, Any]] = []
+    inline_total = 0
+    for path in paths:
+        resolved = _resolve(path)
+        try:
+            st = os.stat(resolved)
+        except OSError as e:
+            raise AttachmentError(f"{path}: {e.strerror or e}") from None
+        if not os.path.isfile(resolved):
+            raise AttachmentError(f"{path} is not a regular file")
+        if not os.access(resolved, os.R_OK):
+            raise AttachmentError(f"{path} is not readable")
+        if st.st_size > max_bytes:
+            raise AttachmentError(f"{path} is {st.st_size} bytes (max {max_bytes})")
+        if inline_total + st.st_size <= inline_max_bytes:
+            mode = INLINE
+            inline_total += st.st_size
+        else:
+            mode = UPLOAD
+        item = {
+            "path": resolved,
+            "name": os.path.basename(resolved),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "content_type": mimetypes.guess_type(resolved)[0]
+            or "application/octet-stream",
+            "mode": mode,
+        }
+        if mode == INLINE:
+            item["sha256"] = content_hash(resolved, st.st_size, st.st_mtime_ns)
+        items.append(item)
+    return items
+
+
+def check_unchanged(item: Dict[str, Any]) -> None:
+    """Raises AttachmentError if the file differs from what was prepared."""
+    try:
+        st = os.stat(item["path"])
+    except OSError as e:
+        raise AttachmentError(f"{item['name']}: {e.strerror or e}") from None
+    if (st.st_size, st.st_mtime_ns) != (item["size"], item["mtime_ns"]):
+        raise AttachmentError(f"{item['name']} changed since the draft was prepared")
+
+
+def split(items: Optional[List[Dict[str, Any]]]):
+    """(inline, upload) attachment lists of a draft."""
+    items = items or []
+    return (
+        [a for a in items if a["mode"] == INLINE],
+        [a for a in items if a["mode"] == UPLOAD],
+    )
+
+
+def encoded_size(size: int) -> int:
+    """Length of the base64 encoding of `size` bytes."""
+    return 4 * ((size + 2) // 3)
+
+
+def file_attachment_head(item: Dict[str, Any]) -> bytes:
+    """
+    JSON of a Graph fileAttachment up to the opening quote of contentBytes;
+    the encoded content and a closing '"}' follow.
+    """
+    head = json.dumps(
+        {
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": item["name"],
+            "contentType": item["content_type"],
+        }
+    )
+    return head[:-1].encode() + b', "contentBytes": "'
+
+
+def iter_base64(
+    item: Dict[str, Any], chunk_size: int = ENCODE_CHUNK_BYTES
+) -> Iterator[bytes]:
+    """Yields the file's base64 encoding chunk by chunk, reading as it goes."""
+    check_unchanged(item)
+    remaining = item["size"]
+    with open(item["path"], "rb") as f:
+        while remaining:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                raise AttachmentError(f"{item['name']} changed while being sent")
+            remaining -= len(chunk)
+            yield base64.b64encode(chunk)
+
+
+def upload_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """The AttachmentItem body for createUploadSession."""
+    return {
+        "AttachmentItem": {
+            "attachmentType": "file",
+            "name": item["name"],
+            "size": item["size"],
+            "contentType": item["content_type"],
+        }
+    }
+
+
+def read_chunk(f: BinaryIO, offset: int, size: int) -> bytes:
+    """Reads one upload chunk; only this chunk is ever held in memory."""
+    f.seek(offset)
+    return f.read(size)
@@ -1,6 +1,14 @@
 import os
+import asyncio
 import atexit
 import logging
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
 import msal  # type: ignore
 
 # Configuration
@@ -12,51 +20,358 @@ AUTHORITY = (
 SCOPES = ["User.Read", "Mail.Send", "Mail.ReadWrite"]
 CACHE_FILE = "token_cache.bin"
 
+# Seconds of remaining life below which the in-memory token is considered stale
+TOKEN_EXPIRY_MARGIN_SECONDS = int(os.getenv("TOKEN_EXPIRY_MARGIN_SECONDS", "120"))
+
+# Debounce window for writing token cache changes back to disk
+TOKEN_CACHE_FLUSH_DELAY_SECONDS = float(
+    os.getenv("TOKEN_CACHE_FLUSH_DELAY_SECONDS", "2")
+)
+
+# Background refresher: renew this many seconds (plus jitter) before expiry.
+# Keep it above TOKEN_EXPIRY_MARGIN_SECONDS so senders never see a stale token.
+TOKEN_REFRESH_AHEAD_SECONDS = int(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", "300"))
+TOKEN_REFRESH_JITTER_SECONDS = int(os.getenv("TOKEN_REFRESH_JITTER_SECONDS", "30"))
+TOKEN_REFRESH_RETRY_SECONDS = int(os.getenv("TOKEN_REFRESH_RETRY_SECONDS", "30"))
+
+
+class _PersistedTokenCache(msal.SerializableTokenCache):
+    """SerializableTokenCache that notifies its owner whenever it changes."""
+
+    def __init__(self, on_change) -> None:
+        super().__init__()
+        self._on_change = on_change
+
+    def add(self, event, **kwargs):
+        super().add(event, **kwargs)
+        self._on_change()
+
+    def modify(self, credential_type, old_entry, new_key_value_pairs=None):
+        super().modify(credential_type, old_entry, new_key_value_pairs)
+        self._on_change()
+
+
+def _write_atomic(path: str, data: str) -> None:
+    """Writes to a temp file in the same directory and renames it over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".token_cache.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class TokenCachePersister:
+    """
+    Owns the process token cache and writes it behind the caller.
+
+    The cache is loaded from disk once. Changes schedule a single debounced
+    background write, and pending state is flushed exactly once at exit.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_FILE,
+        delay_seconds: float = TOKEN_CACHE_FLUSH_DELAY_SECONDS,
+    ) -> None:
+        self.path = path
+        self.delay_seconds = delay_seconds
+        self.writes = 0
+        self._cache: Optional[_PersistedTokenCache] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> _PersistedTokenCache:
+        with self._lock:
+            if self._cache is None:
+                cache = _PersistedTokenCache(self.notify_changed)
+                if os.path.exists(self.path):
+                    with open(self.path, "r") as f:
+                        cache.deserialize(f.read())
+                self._cache = cache
+                atexit.register(self.flush)
+            return self._cache
+
+    def notify_changed(self) -> None:
+        """Schedules a write unless one is already pending."""
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
 
-def _load_cache():
-    cache = msal.SerializableTokenCache()
-    if os.path.exists(CACHE_FILE):
-        cache.deserialize(open(CACHE_FILE, "r").read())
-    return cache
+    def flush(self) -> bool:
+        """Writes the cache to disk if it changed. Returns True if a write happened."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            cache = self._cache
+            if cache is None or not cache.has_state_changed:
+                return False
+            _write_atomic(self.path, cache.serialize())
+            self.writes += 1
+            return True
 
 
-def _save_cache(cache):
-    if cache.has_state_changed:
-        with open(CACHE_FILE, "w") as f:
-            f.write(cache.serialize())
+# Global singleton instance
+persister = TokenCachePersister()
 
 
 def get_msal_app(cache=None):
     if cache is None:
-        cache = _load_cache()
-        # Auto-save when script exits (if state changed)
-        atexit.register(lambda: _save_cache(cache))
+        cache = persister.cache
 
     return msal.PublicClientApplication(
         CLIENT_ID, authority=AUTHORITY, token_cache=cache
     )
 
 
-def get_token() -> dict | None:
+def _token_expires_at(result: Dict[str, Any], now: float) -> float:
+    """Absolute expiry (epoch seconds) of an MSAL token result."""
+    if result.get("expires_on"):
+        return float(result["expires_on"])
+    return now + float(result.get("expires_in", 0))
+
+
+class TokenManager:
     """
-    Attempts to get a valid token silently from cache.
-    Returns the token dict (containing 'access_token') or None if login required.
+    Process-wide access token holder.
+
+    Keeps a single MSAL app and the last access token in memory, and only
+    goes back to MSAL (and the on-disk cache) when the token is about to expire.
+    Concurrent refreshes are coalesced: one caller runs it, the rest wait on
+    its result, whether they are threads or asyncio tasks.
     """
-    app = get_msal_app()
-    accounts = app.get_accounts()
 
-    if not accounts:
-        return None
+    def __init__(self, margin_seconds: int = TOKEN_EXPIRY_MARGIN_SECONDS) -> None:
+        self.margin_seconds = margin_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._app = None
+        self._token: Optional[Dict[str, Any]] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[Future] = None
+        self._lock = threading.Lock()
 
-    # Attempt silent acquisition
-    result = app.acquire_token_silent(SCOPES, account=accounts[0])
+    def _get_app(self):
+        if self._app is None:
+            self._app = get_msal_app()
+        return self._app
 
-    if not result:
+    def _fresh_token(self) -> Optional[Dict[str, Any]]:
+        token = self._token
+        if token is not None and self._expires_at - time.time() > self.margin_seconds:
+            return token
         return None
 
-    if "error" in result:
-        # e.g. interaction_required
-        logging.warning(f"Token error: {result.get('error_description')}")
-        return None
+    def _join_refresh(self, force: bool = False) -> Tuple[Future, bool]:
+        """Returns the in-flight refresh future and whether the caller must run it."""
+        with self._lock:
+            token = None if force else self._fresh_token()
+            if token is not None:
+                # Another caller refreshed while we were waiting for the lock
+                self.hits += 1
+                done: Future = Future()
+                done.set_result(token)
+                return done, False
+            if self._inflight is not None:
+                self.coalesced += 1
+                return self._inflight, False
+            self.misses += 1
+            self._inflight = Future()
+            return self._inflight, True
+
+    def _run_refresh(self, future: Future, force: bool = False) -> None:
+        try:
+            result = self._acquire(force_refresh=force)
+        except BaseException as e:
+            with self._lock:
+                self._inflight = None
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._inflight = None
+        future.set_result(result)
+
+    def get_token(self) -> Optional[Dict[str, Any]]:
+        token = self._fresh_token()
+        if token is not None:
+            self.hits += 1
+            return token
+
+        future, leader = self._join_refresh()
+        if leader:
+            self._run_refresh(future)
+        return future.result()
+
+    async def get_token_async(self) -> Optional[Dict[str, Any]]:
+        token = self._fresh_token()
+        if token is not None:
+            self.hits += 1
+            return token
+
+        future, leader = self._join_refresh()
+        if leader:
+            # MSAL is blocking (HTTP + cache lock): keep it off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._run_refresh, future)
+        return await asyncio.wrap_future(future)
+
+    def refresh(self) -> Optional[Dict[str, Any]]:
+        """Renews the token through MSAL even if the in-memory one is still fresh."""
+        future, leader = self._join_refresh(force=True)
+        if leader:
+            self._run_refresh(future, force=True)
+        return future.result()
+
+    def expires_in(self) -> Optional[float]:
+        """Seconds of life left on the in-memory token, or None if there is none."""
+        if self._token is None:
+            return None
+        return self._expires_at - time.time()
+
+    def _acquire(self, force_refresh: bool = False) -> Optional[Dict[str, Any]]:
+        app = self._get_app()
+        accounts = app.get_accounts()
+
+        if not accounts:
+            return None
+
+        # Attempt silent acquisition
+        result = app.acquire_token_silent(
+            SCOPES, account=accounts[0], force_refresh=force_refresh
+        )
+
+        if not result:
+            return None
+
+        if "error" in result:
+            # e.g. interaction_required
+            logging.warning(f"Token error: {result.get('error_description')}")
+            return None
+
+        self._token = result
+        self._expires_at = _token_expires_at(result, time.time())
+        return result
+
+    def invalidate(self) -> None:
+        """Drops the in-memory token so the next call goes back to MSAL."""
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        remaining = self.expires_in()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "margin_seconds": self.margin_seconds,
+            "expires_in_seconds": int(remaining) if remaining is not None else None,
+        }
+
+
+class TokenRefresher:
+    """
+    Background task that renews the access token ahead of its expiry,
+    so the send path never waits on token acquisition.
+    """
+
+    def __init__(
+        self,
+        manager: TokenManager,
+        ahead_seconds: int = TOKEN_REFRESH_AHEAD_SECONDS,
+        jitter_seconds: int = TOKEN_REFRESH_JITTER_SECONDS,
+        retry_seconds: int = TOKEN_REFRESH_RETRY_SECONDS,
+    ) -> None:
+        self.manager = manager
+        self.ahead_seconds = ahead_seconds
+        self.jitter_seconds = jitter_seconds
+        self.retry_seconds = retry_seconds
+        self.running = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_latency_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_refresh_at: Optional[float] = None
+
+    def next_delay(self) -> float:
+        """Seconds to sleep before the next renewal attempt."""
+        remaining = self.manager.expires_in()
+        if remaining is None:
+            return float(self.retry_seconds)
+        jitter = random.uniform(0, self.jitter_seconds)
+        return max(remaining - self.ahead_seconds - jitter, 1.0)
+
+    async def refresh_once(self) -> bool:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(self.manager.refresh)
+        except Exception as e:
+            result = None
+            self.last_error = str(e)
+        else:
+            if result is None:
+                self.last_error = "Silent refresh returned no token"
+        self.last_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        if result is None:
+            self.failures += 1
+            logging.warning(f"Background token refresh failed: {self.last_error}")
+            return False
+
+        self.refreshes += 1
+        self.last_error = None
+        self.last_refresh_at = time.time()
+        return True
+
+    async def run(self) -> None:
+        self.running = True
+        try:
+            while True:
+                # With no token yet, renew right away so the first send is warm
+                if self.manager.expires_in() is not None:
+                    await asyncio.sleep(self.next_delay())
+                if not await self.refresh_once():
+                    await asyncio.sleep(self.retry_seconds)
+        finally:
+            self.running = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_latency_ms": self.last_latency_ms,
+            "last_error": self.last_error,
+            "last_refresh_at": self.last_refresh_at,
+        }
+
+
+# Global singleton instance
+token_manager = TokenManager()
+refresher = TokenRefresher(token_manager)
+
+
+def get_token() -> dict | None:
+    """
+    Attempts to get a valid token silently from cache.
+    Returns the token dict (containing 'access_token') or None if login required.
+    """
+    return token_manager.get_token()
+
 
-    return result
+async def get_token_async() -> dict | None:
+    """Async variant of get_token(); never blocks the event loop on MSAL."""
+    return await token_manager.get_token_async()
@@ -16,6 +16,8 @@ def register(mcp: FastMCP) -> None:
                 "status": "Not Authenticated",
                 "message": "Server needs authentication. Operator must run 'uv run python auth_bootstrap.py'.",
                 "valid": False,
+                "token_cache": auth.token_manager.stats(),
+                "refresher": auth.refresher.stats(),
             }
 
         claims = token_data.get("id_token_claims", {})
@@ -26,4 +28,6 @@ def register(mcp: FastMCP) -> None:
             "user": user,
             "valid": True,
             "scopes": token_data.get("scope", "").split(),
+            "token_cache": auth.token_manager.stats(),
+            "refresher": auth.refresher.stats(),
         }
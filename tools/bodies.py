@@ -0,0 +1,111 @@
+import hashlib
+import os
+import zlib
+from typing import Any, Dict, List, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is used when zstandard is not installed
+    zstandard = None
+
+# --- config (leída al importar el módulo) ---
+# Bodies at least this large (UTF-8 bytes) are stored compressed
+DRAFT_BODY_COMPRESS_THRESHOLD = int(os.getenv("DRAFT_BODY_COMPRESS_THRESHOLD", "1024"))
+
+RAW, ZLIB, ZSTD = "raw", "zlib", "zstd"
+
+
+def body_key(text: str) -> str:
+    """Content address of a body: SHA-256 of its UTF-8 bytes."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def encode(
+    text: str, threshold: int = DRAFT_BODY_COMPRESS_THRESHOLD
+) -> Tuple[str, bytes]:
+    """Returns (codec, blob); compressed only when it is worth it."""
+    raw = text.encode("utf-8", "surrogatepass")
+    if len(raw) < threshold:
+        return RAW, raw
+    if zstandard is not None:
+        codec, blob = ZSTD, zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        codec, blob = ZLIB, zlib.compress(raw, 6)
+    if len(blob) >= len(raw):
+        return RAW, raw
+    return codec, blob
+
+
+def decode(codec: str, blob: bytes) -> str:
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError(
+                "Body was stored with zstd but zstandard is not installed"
+            )
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec == ZLIB:
+        raw = zlib.decompress(blob)
+    else:
+        raw = blob
+    return raw.decode("utf-8", "surrogatepass")
+
+
+class BodyStore:
+    """
+    Reference-counted, content-addressed bodies (in memory).
+
+    Drafts that share a body share one (possibly compressed) copy, so memory
+    grows with distinct content rather than with the number of drafts.
+    Not locked: the owning DraftStore calls it under its own lock.
+    """
+
+    def __init__(self, compress_threshold: int = DRAFT_BODY_COMPRESS_THRESHOLD) -> None:
+        self.compress_threshold = compress_threshold
+        # Dict[key, [refs, codec, blob, raw_size]]
+        self._bodies: Dict[str, List[Any]] = {}
+        self.bytes = 0
+        self.raw_bytes = 0
+        self.refs = 0
+
+    def put(self, text: str) -> str:
+        key = body_key(text)
+        entry = self._bodies.get(key)
+        if entry is None:
+            codec, blob = encode(text, self.compress_threshold)
+            raw_size = len(text.encode("utf-8", "surrogatepass"))
+            entry = self._bodies[key] = [0, codec, blob, raw_size]
+            self.bytes += len(blob)
+        entry[0] += 1
+        self.raw_bytes += entry[3]
+        self.refs += 1
+        return key
+
+    def get(self, key: str) -> str:
+        _, codec, blob, _ = self._bodies[key]
+        return decode(codec, blob)
+
+    def release(self, key: str) -> None:
+        entry = self._bodies.get(key)
+        if entry is None:
+            return
+        entry[0] -= 1
+        self.raw_bytes -= entry[3]
+        self.refs -= 1
+        if entry[0] == 0:
+            del self._bodies[key]
+            self.bytes -= len(entry[2])
+
+    def clear(self) -> None:
+        self._bodies.clear()
+        self.bytes = 0
+        self.raw_bytes = 0
+        self.refs = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "distinct": len(self._bodies),
+            "references": self.refs,
+            "stored_bytes": self.bytes,
+            "logical_bytes": self.raw_bytes,
+            "codec": ZSTD if zstandard is not None else ZLIB,
+        }
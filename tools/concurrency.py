@@ -0,0 +1,352 @@
+import asyncio
+import bisect
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
+
+# --- config (leída al importar el módulo) ---
+GRAPH_AIMD_INITIAL_LIMIT = int(os.getenv("GRAPH_AIMD_INITIAL_LIMIT", "8"))
+GRAPH_AIMD_MIN_LIMIT = int(os.getenv("GRAPH_AIMD_MIN_LIMIT", "1"))
+GRAPH_AIMD_MAX_LIMIT = int(os.getenv("GRAPH_AIMD_MAX_LIMIT", "64"))
+GRAPH_AIMD_DECREASE_FACTOR = float(os.getenv("GRAPH_AIMD_DECREASE_FACTOR", "0.5"))
+# Back off when recent latency exceeds the long-run average by this factor
+GRAPH_AIMD_LATENCY_TOLERANCE = float(os.getenv("GRAPH_AIMD_LATENCY_TOLERANCE", "2.0"))
+# Minimum seconds between two multiplicative decreases
+GRAPH_AIMD_COOLDOWN_SECONDS = float(os.getenv("GRAPH_AIMD_COOLDOWN_SECONDS", "1.0"))
+
+# Priority lanes share Graph capacity in proportion to their weights
+INTERACTIVE, BULK = "interactive", "bulk"
+SEND_LANE_WEIGHTS = {
+    name.strip(): int(weight)
+    for name, weight in (
+        item.split(":")
+        for item in os.getenv("SEND_LANE_WEIGHTS", "interactive:8,bulk:1").split(",")
+        if item.strip()
+    )
+}
+
+# Statuses that mean "you are sending too fast"
+_OVERLOAD_STATUSES = {429, 503}
+
+_LATENCY_SAMPLES = 512
+# Upper bounds (seconds) of the wait-time histogram buckets
+_WAIT_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0]
+
+# A queued request: an asyncio future for coroutines, a concurrent one for
+# threads blocked in blocking_slot()
+Waiter = Union[asyncio.Future, concurrent.futures.Future]
+
+# Lane of the send being processed; set by the tool or worker that starts it
+current_lane: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_lane", default=INTERACTIVE
+)
+
+
+class WeightedLanes:
+    """
+    Stride scheduler: picks among non-empty lanes so each gets a share of
+    turns proportional to its weight, and an idle lane can't bank credit.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None) -> None:
+        self.weights = dict(weights or SEND_LANE_WEIGHTS)
+        self._pass: Dict[str, float] = {lane: 0.0 for lane in self.weights}
+        # Pass value of the last lane served: the scheduler's "now"
+        self._virtual = 0.0
+
+    def weight(self, lane: str) -> int:
+        return self.weights.get(lane, 1)
+
+    def pick(self, ready: Iterable[str]) -> Optional[str]:
+        """Chooses the next lane among `ready` and charges it one turn."""
+        candidates = list(ready)
+        if not candidates:
+            return None
+        for lane in candidates:
+            self._pass[lane] = max(self._pass.get(lane, 0.0), self._virtual)
+        lane = min(candidates, key=lambda name: (self._pass[name], -self.weight(name)))
+        self._virtual = self._pass[lane]
+        self._pass[lane] += 1 / self.weight(lane)
+        return lane
+
+
+class LaneMetrics:
+    """Per-lane wait-time histograms."""
+
+    def __init__(self) -> None:
+        self._counts: Dict[str, List[int]] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record_wait(self, lane: str, seconds: float) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(lane, [0] * (len(_WAIT_BUCKETS) + 1))
+            counts[bisect.bisect_left(_WAIT_BUCKETS, seconds)] += 1
+            self._samples.setdefault(lane, deque(maxlen=_LATENCY_SAMPLES)).append(
+                seconds
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for lane, counts in self._counts.items():
+                labels = [f"<={int(b * 1000)}ms" for b in _WAIT_BUCKETS] + [
+                    f">{int(_WAIT_BUCKETS[-1] * 1000)}ms"
+                ]
+                ordered = sorted(self._samples[lane])
+                result[lane] = {
+                    "count": sum(counts),
+                    "histogram": dict(zip(labels, counts)),
+                    "p50_ms": _percentile_ms(ordered, 0.50),
+                    "p99_ms": _percentile_ms(ordered, 0.99),
+                }
+            return result
+
+
+class Slot:
+    """One admitted request. Lets callers flag overload the limiter can't see."""
+
+    def __init__(self) -> None:
+        self.overloaded = False
+
+    def mark_overloaded(self) -> None:
+        self.overloaded = True
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on in-flight Graph requests.
+
+    Each healthy response grows the limit by 1/limit (about +1 per round trip);
+    a 429/503 or a latency spike cuts it by GRAPH_AIMD_DECREASE_FACTOR, at most
+    once per cooldown so one burst of throttling is not punished repeatedly.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = GRAPH_AIMD_INITIAL_LIMIT,
+        min_limit: int = GRAPH_AIMD_MIN_LIMIT,
+        max_limit: int = GRAPH_AIMD_MAX_LIMIT,
+        decrease_factor: float = GRAPH_AIMD_DECREASE_FACTOR,
+        latency_tolerance: float = GRAPH_AIMD_LATENCY_TOLERANCE,
+        cooldown_seconds: float = GRAPH_AIMD_COOLDOWN_SECONDS,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_seconds = cooldown_seconds
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._short_ewma: Optional[float] = None
+        self._long_ewma: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: Dict[str, Deque[Waiter]] = {}
+        self._lanes = WeightedLanes()
+        self.waits = LaneMetrics()
+        # Waiters that were handed a slot but have not resumed yet
+        self._granted: set = set()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def _acquire(self, lane: str) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiting():
+                self.in_flight += 1
+                self.waits.record_wait(lane, 0.0)
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            queue = self._waiters.setdefault(lane, deque())
+            queue.append(waiter)
+        try:
+            # The releasing side hands its slot over before resolving us
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in queue:
+                    queue.remove(waiter)
+                elif waiter in self._granted:
+                    # Cancelled after the hand-over: give the slot back
+                    self._granted.discard(waiter)
+                    self.in_flight -= 1
+                    self._wake_waiters()
+            raise
+        with self._lock:
+            self._granted.discard(waiter)
+        self.waits.record_wait(lane, time.perf_counter() - start)
+
+    def _acquire_blocking(self, lane: str) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiting():
+                self.in_flight += 1
+                self.waits.record_wait(lane, 0.0)
+                return
+            waiter: concurrent.futures.Future = concurrent.futures.Future()
+            self._waiters.setdefault(lane, deque()).append(waiter)
+        waiter.result()
+        with self._lock:
+            self._granted.discard(waiter)
+        self.waits.record_wait(lane, time.perf_counter() - start)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # Caller holds the lock
+        while self.in_flight < self.limit:
+            lane = self._lanes.pick(
+                name for name, queue in self._waiters.items() if queue
+            )
+            if lane is None:
+                return
+            waiter = self._waiters[lane].popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            self._granted.add(waiter)
+            if isinstance(waiter, asyncio.Future):
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+            else:
+                waiter.set_result(None)
+
+    def record(self, latency: float, overloaded: bool) -> None:
+        """Feeds one response into the AIMD controller."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._short_ewma = _ewma(self._short_ewma, latency, 0.3)
+            self._long_ewma = _ewma(self._long_ewma, latency, 0.02)
+            slow = (
+                len(self._latencies) >= 20
+                and self._short_ewma > self.latency_tolerance * self._long_ewma
+            )
+
+            if overloaded or slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown_seconds:
+                    self._last_decrease = now
+                    self._limit = max(
+                        float(self.min_limit), self._limit * self.decrease_factor
+                    )
+                    self.decreases += 1
+            elif self._limit < self.max_limit:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+                self.increases += 1
+                self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self, lane: Optional[str] = None) -> AsyncIterator[Slot]:
+        """
+        Waits for an in-flight slot (weighted-fair across lanes),
+        then times and classifies the request.
+        """
+        await self._acquire(lane or current_lane.get())
+        slot = Slot()
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield slot
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._settle(slot, start, error)
+
+    @contextmanager
+    def blocking_slot(self, lane: Optional[str] = None) -> Iterator[Slot]:
+        """slot() for synchronous callers: blocks the calling thread instead."""
+        self._acquire_blocking(lane or current_lane.get())
+        slot = Slot()
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield slot
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._settle(slot, start, error)
+
+    def _settle(self, slot: Slot, start: float, error: Optional[BaseException]) -> None:
+        if error is not None and getattr(error, "status", None) in _OVERLOAD_STATUSES:
+            slot.mark_overloaded()
+        # Errors without a status (network, cancellation) say nothing about load
+        if error is None or getattr(error, "status", None) is not None:
+            self.record(time.perf_counter() - start, slot.overloaded)
+        self._release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            depth = {lane: len(queue) for lane, queue in self._waiters.items()}
+        waits = self.waits.snapshot()
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": sum(depth.values()),
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "latency_ms": {
+                "p50": _percentile_ms(ordered, 0.50),
+                "p90": _percentile_ms(ordered, 0.90),
+                "p99": _percentile_ms(ordered, 0.99),
+                "samples": len(ordered),
+            },
+            "lanes": {
+                lane: {
+                    "weight": self._lanes.weight(lane),
+                    "waiting": depth.get(lane, 0),
+                    "wait_ms": waits.get(lane),
+                }
+                for lane in dict.fromkeys([*self._lanes.weights, *depth, *waits])
+            },
+        }
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    if current is None:
+        return sample
+    return current + alpha * (sample - current)
+
+
+def _percentile_ms(ordered, fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(len(ordered) * fraction))
+    return round(ordered[index] * 1000, 2)
+
+
+# Global singleton instance
+limiter = AdaptiveLimiter()
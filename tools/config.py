@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Mapping, Optional
+
+from dotenv import dotenv_values
+
+from tools import domain_policy
+
+
+class ConfigError(ValueError):
+    """A configuration value is missing or malformed."""
+
+
+def _int(env: Mapping[str, str], name: str, default: int) -> int:
+    raw = env.get(name, "").strip() or str(default)
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ConfigError(f"{name} must be an integer, got {raw!r}") from None
+    if value <= 0:
+        raise ConfigError(f"{name} must be positive, got {value}")
+    return value
+
+
+class MailerConfig:
+    """
+    One immutable snapshot of the mailer policy settings.
+
+    Everything derived from the raw values (the parsed allowlist and its
+    compiled domain policy) is built here, once per load, so reading a
+    snapshot costs nothing per call.
+    """
+
+    __slots__ = (
+        "allowed_domains",
+        "max_recipients",
+        "max_body_chars",
+        "allowlist_policy",
+        "version",
+        "loaded_at",
+    )
+
+    def __init__(
+        self,
+        allowed_domains: FrozenSet[str] = frozenset(),
+        max_recipients: int = 10,
+        max_body_chars: int = 5000,
+        version: int = 0,
+    ) -> None:
+        self.allowed_domains = frozenset(allowed_domains)
+        self.max_recipients = max_recipients
+        self.max_body_chars = max_body_chars
+        self.allowlist_policy = domain_policy.DomainPolicy(
+            domain_policy.Rule(d, domain_policy.ALLOW)
+            for d in sorted(self.allowed_domains)
+        )
+        self.version = version
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_env(
+        cls, env: Optional[Mapping[str, str]] = None, version: int = 0
+    ) -> "MailerConfig":
+        env = os.environ if env is None else env
+        return cls(
+            allowed_domains=frozenset(
+                d.strip().lower()
+                for d in env.get("ALLOWED_RECIPIENT_DOMAINS", "").split(",")
+                if d.strip()
+            ),
+            max_recipients=_int(env, "MAX_RECIPIENTS", 10),
+            max_body_chars=_int(env, "MAX_BODY_CHARS", 5000),
+            version=version,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "allowed_domains": sorted(self.allowed_domains),
+            "max_recipients": self.max_recipients,
+            "max_body_chars": self.max_body_chars,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class RuntimeConfig:
+    """
+    Holds the current MailerConfig and swaps it on reload.
+
+    Readers take one snapshot with current() at the start of a call and use
+    it throughout, so a reload mid-call never mixes old and new values. The
+    swap is a single attribute assignment; a failed reload keeps the
+    previous snapshot.
+    """
+
+    def __init__(
+        self,
+        dotenv_path: Optional[str] = None,
+        environ: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self.dotenv_path = dotenv_path
+        # The real process environment, which wins over .env on every reload
+        # as it does at startup. server.py sets it to the environment from
+        # before load_dotenv, so values that came from .env can change.
+        self.environ: Dict[str, str] = dict(os.environ if environ is None else environ)
+        self._current = MailerConfig.from_env(version=1)
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def current(self) -> MailerConfig:
+        return self._current
+
+    def reload(self) -> MailerConfig:
+        """
+        Re-reads .env under `environ` (environment variables win, as at
+        startup; keys removed from .env fall back to their defaults) and swaps
+        in the new snapshot. os.environ is left alone. Raises ConfigError and
+        keeps the old snapshot if a value is invalid.
+        """
+        with self._lock:
+            dotenv = dotenv_values(self.dotenv_path)
+            env = {k: v for k, v in dotenv.items() if v is not None}
+            env.update(self.environ)
+            try:
+                new = MailerConfig.from_env(env, version=self._current.version + 1)
+            except ConfigError as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logging.error(
+                    f"Config reload failed, keeping version {self._current.version}: {e}"
+                )
+                raise
+            self._current = new
+            self.reloads += 1
+            self.last_error = None
+        logging.info(f"Config reloaded (version {new.version})")
+        return new
+
+    def swap(self, new: MailerConfig) -> MailerConfig:
+        """Installs `new` as the current snapshot and returns the previous one."""
+        with self._lock:
+            old, self._current = self._current, new
+        return old
+
+    def reload_from_signal(self) -> None:
+        """SIGHUP handler: reload, logging (not raising) on bad values."""
+        try:
+            self.reload()
+        except ConfigError:
+            pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self._current.as_dict(),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# Global singleton instance
+runtime = RuntimeConfig()
+
+
+def current() -> MailerConfig:
+    """The current config snapshot; take it once per call."""
+    return runtime._current
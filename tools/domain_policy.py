@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# --- config (leída al importar el módulo) ---
+# JSON policy file; when unset, ALLOWED_RECIPIENT_DOMAINS is the (exact) allowlist
+DOMAIN_POLICY_FILE = os.getenv("DOMAIN_POLICY_FILE", "")
+# How often (seconds) the file's mtime is checked for changes
+DOMAIN_POLICY_CHECK_SECONDS = float(os.getenv("DOMAIN_POLICY_CHECK_SECONDS", "1"))
+
+ALLOW, DENY = "allow", "deny"
+
+# Upper bound on the domain decision cache (one entry per distinct domain)
+_DOMAIN_CACHE_SIZE = 4096
+
+
+class PolicyError(ValueError):
+    """The policy file is malformed."""
+
+
+class Rule:
+    """
+    One allow/deny rule. Patterns:
+      "corp.com"    only corp.com
+      "*.corp.com"  any subdomain of corp.com, not corp.com itself
+      ".corp.com"   corp.com and any subdomain
+    `max_recipients` optionally caps how many recipients of one message
+    may match this rule.
+    """
+
+    __slots__ = ("pattern", "action", "max_recipients")
+
+    def __init__(
+        self, pattern: str, action: str, max_recipients: Optional[int] = None
+    ) -> None:
+        self.pattern = pattern
+        self.action = action
+        self.max_recipients = max_recipients
+
+
+class _Node:
+    __slots__ = ("children", "exact", "subdomains")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        # Rule for the domain ending at this node / for anything below it
+        self.exact: Optional[Rule] = None
+        self.subdomains: Optional[Rule] = None
+
+
+def _pick(current: Optional[Rule], new: Rule) -> Rule:
+    # Two rules for the same pattern: deny wins
+    if current is None or new.action == DENY:
+        return new
+    return current
+
+
+class DomainPolicy:
+    """
+    Allow/deny rules in a trie keyed by reversed domain labels
+    (com -> corp -> eu), so a lookup costs O(labels) whatever the rule count.
+    The most specific matching rule wins; with no match, `default` applies.
+    """
+
+    def __init__(self, rules: Iterable[Rule], default: Optional[str] = None) -> None:
+        self.rules: List[Rule] = list(rules)
+        self._root = _Node()
+        for rule in self.rules:
+            self._insert(rule)
+        # Like the old allowlist: allow everything unless allow rules exist
+        if default is None:
+            default = DENY if any(r.action == ALLOW for r in self.rules) else ALLOW
+        self.default = default
+        self.allowed: FrozenSet[str] = frozenset(
+            r.pattern for r in self.rules if r.action == ALLOW
+        )
+        self._cache: Dict[str, Optional[Rule]] = {}
+        self._cache_lock = threading.Lock()
+
+    def _insert(self, rule: Rule) -> None:
+        pattern = rule.pattern.strip().lower()
+        exact, subdomains = True, False
+        if pattern.startswith("*."):
+            pattern, exact, subdomains = pattern[2:], False, True
+        elif pattern.startswith("."):
+            pattern, subdomains = pattern[1:], True
+        if not pattern or "*" in pattern:
+            raise PolicyError(f"Invalid domain pattern: {rule.pattern!r}")
+        node = self._root
+        for label in reversed(pattern.split(".")):
+            node = node.children.setdefault(label, _Node())
+        if exact:
+            node.exact = _pick(node.exact, rule)
+        if subdomains:
+            node.subdomains = _pick(node.subdomains, rule)
+
+    def _lookup(self, domain: str) -> Optional[Rule]:
+        labels = domain.lower().split(".")
+        node = self._root
+        best: Optional[Rule] = None
+        for i in range(len(labels) - 1, -1, -1):
+            child = node.children.get(labels[i])
+            if child is None:
+                return best
+            node = child
+            if i > 0 and node.subdomains is not None:
+                best = node.subdomains
+        return node.exact or best
+
+    def match(self, domain: str) -> Optional[Rule]:
+        """The rule deciding `domain` (None: the default applies). Cached."""
+        try:
+            return self._cache[domain]
+        except KeyError:
+            pass
+        rule = self._lookup(domain)
+        with self._cache_lock:
+            if len(self._cache) >= _DOMAIN_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[domain] = rule
+        return rule
+
+    def allows(self, domain: str) -> bool:
+        rule = self.match(domain)
+        return (rule.action if rule else self.default) == ALLOW
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "default": self.default,
+            "rules": [
+                {
+                    "domain": r.pattern,
+                    "action": r.action,
+                    **(
+                        {"max_recipients": r.max_recipients}
+                        if r.max_recipients is not None
+                        else {}
+                    ),
+                }
+                for r in self.rules
+            ],
+        }
+
+
+def parse_policy(document: Dict[str, Any]) -> DomainPolicy:
+    """
+    Builds a policy from its JSON form:
+      {"default": "deny",
+       "allow": ["corp.com", ".partner.org"],
+       "deny": ["*.evil.partner.org"],
+       "rules": [{"domain": "*.corp.com", "action": "allow", "max_recipients": 50}]}
+    """
+    if not isinstance(document, dict):
+        raise PolicyError("Policy must be a JSON object")
+    rules: List[Rule] = []
+    for action in (ALLOW, DENY):
+        for pattern in document.get(action, []):
+            rules.append(Rule(str(pattern), action))
+    for item in document.get("rules", []):
+        action = item.get("action", ALLOW)
+        if action not in (ALLOW, DENY):
+            raise PolicyError(f"Invalid action: {action!r}")
+        limit = item.get("max_recipients")
+        rules.append(
+            Rule(str(item["domain"]), action, int(limit) if limit is not None else None)
+        )
+    default = document.get("default")
+    if default not in (None, ALLOW, DENY):
+        raise PolicyError(f"Invalid default: {default!r}")
+    return DomainPolicy(rules, default)
+
+
+class PolicyFile:
+    """
+    A policy loaded from a JSON file and reloaded when the file changes.
+
+    Readers call current(); at most every `check_seconds` it stats the file
+    and, if it changed, parses it and swaps the compiled policy in with one
+    assignment. A broken file is logged and the previous policy kept.
+    """
+
+    def __init__(
+        self, path: str, check_seconds: float = DOMAIN_POLICY_CHECK_SECONDS
+    ) -> None:
+        self.path = path
+        self.check_seconds = check_seconds
+        self._policy: Optional[DomainPolicy] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> DomainPolicy:
+        now = time.monotonic()
+        if self._policy is None or now >= self._next_check:
+            with self._lock:
+                if self._policy is None or now >= self._next_check:
+                    self._next_check = now + self.check_seconds
+                    self._reload_if_changed()
+        if self._policy is None:
+            # Never loaded successfully: fail closed
+            return DomainPolicy([], default=DENY)
+        return self._policy
+
+    def _reload_if_changed(self) -> None:
+        # Caller holds the lock
+        try:
+            st = os.stat(self.path)
+            version = (st.st_mtime_ns, st.st_size)
+            if version == self._version:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                policy = parse_policy(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logging.error(f"Domain policy {self.path} not loaded: {e}")
+            return
+        self._policy = policy
+        self._version = version
+        self.reloads += 1
+        self.last_error = None
+        logging.info(
+            f"Domain policy loaded from {self.path} ({len(policy.rules)} rules)"
+        )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# Global singleton instance
+policy_file: Optional[PolicyFile] = (
+    PolicyFile(DOMAIN_POLICY_FILE) if DOMAIN_POLICY_FILE else None
+)
+
+
+def current(fallback: DomainPolicy) -> DomainPolicy:
+    """The policy file's current policy, else `fallback` (the env allowlist)."""
+    if policy_file is not None:
+        return policy_file.current()
+    return fallback
@@ -1,47 +1,742 @@
+import abc
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
 import time
 import uuid
-from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
+from tools import bodies
 
-class DraftStore:
-    def __init__(self, expiry_seconds: int = 600) -> None:
-        # Dict[draft_id, (timestamp, data)]
-        self._store: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+# --- config (leída al importar el módulo) ---
+# "memory" (per process) or "sqlite" (shared by every process on the host)
+DRAFT_STORE_BACKEND = os.getenv("DRAFT_STORE_BACKEND", "memory")
+DRAFT_STORE_DB = os.getenv("DRAFT_STORE_DB", "drafts.sqlite3")
+DRAFT_REAPER_INTERVAL_SECONDS = float(os.getenv("DRAFT_REAPER_INTERVAL_SECONDS", "30"))
+# Whole-store caps: the oldest drafts are evicted to stay under them
+DRAFT_MAX_COUNT = int(os.getenv("DRAFT_MAX_COUNT", "1000"))
+DRAFT_MAX_BYTES = int(os.getenv("DRAFT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Per-session quotas: prepare_email is refused once a session reaches them
+DRAFT_SESSION_MAX_COUNT = int(os.getenv("DRAFT_SESSION_MAX_COUNT", "100"))
+DRAFT_SESSION_MAX_BYTES = int(
+    os.getenv("DRAFT_SESSION_MAX_BYTES", str(16 * 1024 * 1024))
+)
+
+# A claim not renewed, burned or released within this long (crashed sender) lapses
+DRAFT_CLAIM_SECONDS = float(os.getenv("DRAFT_CLAIM_SECONDS", "120"))
+
+# Session key for callers outside an MCP session (stdio, tests)
+LOCAL_SESSION = "local"
+
+# Outcomes of DraftBackend.claim()
+CLAIMED, IN_PROGRESS, ALREADY_SENT, NOT_FOUND = (
+    "claimed",
+    "in_progress",
+    "already_sent",
+    "not_found",
+)
+
+
+class DraftQuotaExceeded(Exception):
+    """The draft would exceed a per-session (or whole-store) quota."""
+
+
+def draft_size(value: Any) -> int:
+    """Approximate bytes held by a draft (UTF-8 text plus a small per-item overhead)."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "surrogatepass")) + 8
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + 8
+    if isinstance(value, dict):
+        return sum(draft_size(k) + draft_size(v) for k, v in value.items()) + 16
+    if isinstance(value, (list, tuple)):
+        return sum(draft_size(v) for v in value) + 16
+    return 16
+
+
+def _split_body(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Separates the body (stored content-addressed) from the rest of a draft."""
+    body = data.get("body")
+    if not isinstance(body, str):
+        return data, None
+    return {k: v for k, v in data.items() if k != "body"}, body
+
+
+class DraftBackend(abc.ABC):
+    """
+    Interface shared by draft store backends.
+
+    Every backend gives drafts the same uniform TTL (`expiry_seconds`, checked
+    on access and by sweeps), the same whole-store caps with oldest-first
+    eviction, and the same per-session quotas. Caps and quotas count each
+    draft's full (logical) size; bodies are stored once per distinct content.
+    """
+
+    backend = ""
+
+    def __init__(
+        self,
+        expiry_seconds: int = 600,
+        max_count: int = DRAFT_MAX_COUNT,
+        max_bytes: int = DRAFT_MAX_BYTES,
+        session_max_count: int = DRAFT_SESSION_MAX_COUNT,
+        session_max_bytes: int = DRAFT_SESSION_MAX_BYTES,
+        claim_seconds: float = DRAFT_CLAIM_SECONDS,
+    ) -> None:
         self.expiry_seconds = expiry_seconds
+        self.claim_seconds = claim_seconds
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.session_max_count = session_max_count
+        self.session_max_bytes = session_max_bytes
+        # Counters are per process, even when the drafts are shared
+        self.rejected = 0
+        self.created = 0
+        self.deleted = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.sweeps = 0
+        self.claims = 0
+        self.contended = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def create_draft(self, data: Dict[str, Any], session: Optional[str] = None) -> str:
+        """
+        Stores a draft and returns its id. Raises DraftQuotaExceeded if the
+        session is over its quota or the draft alone exceeds the store caps.
+        """
+
+    @abc.abstractmethod
+    def get_draft(self, draft_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abc.abstractmethod
+    def delete_draft(self, draft_id: str) -> None: ...
+
+    @abc.abstractmethod
+    def claim(self, draft_id: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Atomically takes a draft for sending. Returns (CLAIMED, data) to exactly
+        one caller; concurrent callers get (IN_PROGRESS, None), callers after a
+        successful send get (ALREADY_SENT, None).
+        """
+
+    @abc.abstractmethod
+    def renew_claim(self, draft_id: str) -> bool:
+        """Pushes a held claim's deadline claim_seconds ahead; False if it is gone."""
+
+    @abc.abstractmethod
+    def release(self, draft_id: str) -> None:
+        """Gives a claimed draft back (the send failed) so it can be retried."""
+
+    @abc.abstractmethod
+    def burn(self, draft_id: str) -> None:
+        """Deletes a claimed draft after a successful send and remembers it as sent."""
+
+    @abc.abstractmethod
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Removes expired drafts; returns how many."""
 
-    def create_draft(self, data: Dict[str, Any]) -> str:
+    @abc.abstractmethod
+    def clear(self) -> None: ...
+
+    @abc.abstractmethod
+    def session_usage(self, session: Optional[str] = None) -> Dict[str, int]: ...
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, Any]: ...
+
+    @abc.abstractmethod
+    def __len__(self) -> int: ...
+
+    def cleanup(self) -> int:
+        """Removes expired drafts and returns count of removed items."""
+        return self.sweep()
+
+    def _check_quota(self, size: int, count: int, held: int) -> None:
+        # Caller holds the lock; `count`/`held` are the session's current usage
+        largest = min(self.max_bytes, self.session_max_bytes)
+        if size > largest:
+            self.rejected += 1
+            raise DraftQuotaExceeded(f"Draft too large ({size} bytes, max {largest})")
+        if count + 1 > self.session_max_count:
+            self.rejected += 1
+            raise DraftQuotaExceeded(
+                f"Too many pending drafts in this session (max {self.session_max_count}). "
+                "Send or cancel some drafts first."
+            )
+        if held + size > self.session_max_bytes:
+            self.rejected += 1
+            raise DraftQuotaExceeded(
+                f"Pending drafts in this session exceed {self.session_max_bytes} bytes. "
+                "Send or cancel some drafts first."
+            )
+
+    def _stats(
+        self, size: int, held: int, sessions: int, oldest: Optional[float]
+    ) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "size": size,
+            "bytes": held,
+            "sessions": sessions,
+            "limits": {
+                "max_count": self.max_count,
+                "max_bytes": self.max_bytes,
+                "session_max_count": self.session_max_count,
+                "session_max_bytes": self.session_max_bytes,
+            },
+            "expiry_seconds": self.expiry_seconds,
+            "oldest_age_seconds": (
+                round(time.time() - oldest, 1) if oldest is not None else None
+            ),
+            "created": self.created,
+            "deleted": self.deleted,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "sweeps": self.sweeps,
+            "claims": self.claims,
+            "contended": self.contended,
+        }
+
+    @contextlib.asynccontextmanager
+    async def keep_claimed(self, draft_ids: Iterable[str]) -> AsyncIterator[None]:
+        """
+        Renews the claims on `draft_ids` every claim_seconds / 3 while the
+        block runs, so a long send keeps its drafts; only the claims of a
+        sender that died lapse.
+        """
+        ids = list(draft_ids)
+
+        async def heartbeat() -> None:
+            while ids:
+                await asyncio.sleep(self.claim_seconds / 3)
+                held = await asyncio.to_thread(
+                    lambda: [did for did in ids if self.renew_claim(did)]
+                )
+                for did in set(ids) - set(held):
+                    logging.warning(f"Claim on draft {did} lapsed while sending")
+                ids[:] = held
+
+        task = asyncio.create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def run_reaper(
+        self, interval_seconds: float = DRAFT_REAPER_INTERVAL_SECONDS
+    ) -> None:
+        """Background task: sweeps expired drafts every `interval_seconds`."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+            except Exception:
+                logging.exception("Draft reaper sweep failed")
+                continue
+            if removed:
+                logging.info(f"Draft reaper removed {removed} expired drafts")
+
+
+class DraftStore(DraftBackend):
+    """
+    In-memory drafts with a uniform TTL and bounded memory (one process).
+
+    Since every draft lives for the same `expiry_seconds`, insertion order is
+    expiry order: the oldest draft is always at the front of the OrderedDict,
+    so sweeping pops expired drafts in O(1) each and stops at the first live one.
+    The same order drives eviction when the store is over its count/byte caps.
+    """
+
+    backend = "memory"
+
+    def __init__(self, expiry_seconds: int = 600, **limits: int) -> None:
+        super().__init__(expiry_seconds, **limits)
+        # OrderedDict[draft_id, (timestamp, data without body, size, session,
+        # body key)], oldest first
+        self._store: "OrderedDict[str, Tuple[float, Dict[str, Any], int, str, Optional[str]]]" = OrderedDict()
+        self.bodies = bodies.BodyStore()
+        self.bytes = 0
+        # Dict[session, [count, bytes]]
+        self._sessions: Dict[str, List[int]] = {}
+        # Dict[draft_id, claim deadline] for drafts being sent
+        self._claims: Dict[str, float] = {}
+        # OrderedDict[draft_id, burned_at] of sent drafts, oldest first
+        self._sent: "OrderedDict[str, float]" = OrderedDict()
+
+    def create_draft(self, data: Dict[str, Any], session: Optional[str] = None) -> str:
+        session = session or LOCAL_SESSION
+        size = draft_size(data)
         draft_id = str(uuid.uuid4())
-        self._store[draft_id] = (time.time(), data)
+        with self._lock:
+            count, held = self._sessions.get(session, (0, 0))
+            self._check_quota(size, count, held)
+            # Oldest-first eviction keeps the whole store under its caps
+            while self._store and (
+                len(self._store) + 1 > self.max_count
+                or self.bytes + size > self.max_bytes
+            ):
+                self._remove(next(iter(self._store)))
+                self.evictions += 1
+            meta, body = _split_body(data)
+            key = self.bodies.put(body) if body is not None else None
+            self._store[draft_id] = (time.time(), meta, size, session, key)
+            self.bytes += size
+            usage = self._sessions.setdefault(session, [0, 0])
+            usage[0] += 1
+            usage[1] += size
+            self.created += 1
         return draft_id
 
+    def _remove(self, draft_id: str) -> bool:
+        # Caller holds the lock
+        entry = self._store.pop(draft_id, None)
+        if entry is None:
+            return False
+        self._claims.pop(draft_id, None)
+        _, _, size, session, key = entry
+        if key is not None:
+            self.bodies.release(key)
+        self.bytes -= size
+        usage = self._sessions[session]
+        usage[0] -= 1
+        usage[1] -= size
+        if usage[0] == 0:
+            del self._sessions[session]
+        return True
+
+    def _hydrate(self, entry: Tuple[Any, ...]) -> Dict[str, Any]:
+        # Caller holds the lock
+        meta, key = entry[1], entry[4]
+        if key is None:
+            return meta
+        return {**meta, "body": self.bodies.get(key)}
+
     def get_draft(self, draft_id: str) -> Optional[Dict[str, Any]]:
-        if draft_id not in self._store:
-            return None
+        with self._lock:
+            entry = self._store.get(draft_id)
+            if entry is None:
+                return None
 
-        timestamp, data = self._store[draft_id]
-        if time.time() - timestamp > self.expiry_seconds:
-            # Lazy cleanup on access
-            del self._store[draft_id]
-            return None
+            if time.time() - entry[0] > self.expiry_seconds:
+                # Lazy cleanup on access
+                self._remove(draft_id)
+                self.expirations += 1
+                return None
 
-        return data
+            return self._hydrate(entry)
 
     def delete_draft(self, draft_id: str) -> None:
-        if draft_id in self._store:
-            del self._store[draft_id]
+        with self._lock:
+            if self._remove(draft_id):
+                self.deleted += 1
 
-    def cleanup(self) -> int:
-        """Removes expired drafts and returns count of removed items."""
+    def claim(self, draft_id: str) -> Tuple[str, Optional[Dict[str, Any]]]:
         now = time.time()
-        to_remove = [
-            did
-            for did, (ts, _) in self._store.items()
-            if now - ts > self.expiry_seconds
-        ]
-        for did in to_remove:
-            del self._store[did]
-        return len(to_remove)
+        with self._lock:
+            if draft_id in self._sent:
+                self.contended += 1
+                return ALREADY_SENT, None
+            entry = self._store.get(draft_id)
+            if entry is None:
+                return NOT_FOUND, None
+            if now - entry[0] > self.expiry_seconds:
+                self._remove(draft_id)
+                self.expirations += 1
+                return NOT_FOUND, None
+            if self._claims.get(draft_id, 0.0) > now:
+                self.contended += 1
+                return IN_PROGRESS, None
+            self._claims[draft_id] = now + self.claim_seconds
+            self.claims += 1
+            return CLAIMED, self._hydrate(entry)
+
+    def renew_claim(self, draft_id: str) -> bool:
+        with self._lock:
+            if draft_id not in self._claims or draft_id not in self._store:
+                return False
+            self._claims[draft_id] = time.time() + self.claim_seconds
+            return True
+
+    def release(self, draft_id: str) -> None:
+        with self._lock:
+            self._claims.pop(draft_id, None)
+
+    def burn(self, draft_id: str) -> None:
+        with self._lock:
+            if self._remove(draft_id):
+                self.deleted += 1
+            self._sent[draft_id] = time.time()
+            while len(self._sent) > self.max_count:
+                self._sent.popitem(last=False)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Pops expired drafts from the front of the index; returns how many."""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            # Sent markers only need to outlive the drafts they stand for
+            while (
+                self._sent
+                and now - next(iter(self._sent.values())) > self.expiry_seconds
+            ):
+                self._sent.popitem(last=False)
+            while self._store:
+                draft_id, entry = next(iter(self._store.items()))
+                if now - entry[0] <= self.expiry_seconds:
+                    break
+                self._remove(draft_id)
+                removed += 1
+            self.expirations += removed
+            self.sweeps += 1
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._store.clear()
+            self._sessions.clear()
+            self._claims.clear()
+            self._sent.clear()
+            self.bodies.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def session_usage(self, session: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            count, held = self._sessions.get(session or LOCAL_SESSION, (0, 0))
+        return {"count": count, "bytes": held}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = next(iter(self._store.values()), None)
+            stats = self._stats(
+                len(self._store),
+                self.bytes,
+                len(self._sessions),
+                oldest[0] if oldest else None,
+            )
+            stats["bodies"] = self.bodies.stats()
+            return stats
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    session TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    claimed_until REAL,
+    body_key TEXT
+);
+CREATE INDEX IF NOT EXISTS drafts_created ON drafts (created_at);
+CREATE INDEX IF NOT EXISTS drafts_session ON drafts (session);
+CREATE TABLE IF NOT EXISTS bodies (
+    key TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    blob BLOB NOT NULL,
+    raw_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sent_drafts (
+    id TEXT PRIMARY KEY,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sent_drafts_at ON sent_drafts (sent_at);
+"""
+
+
+class SqliteDraftStore(DraftBackend):
+    """
+    Drafts in a SQLite file (WAL mode) shared by every server process on the
+    host, so confirm_send works whichever worker prepare_email ran on.
+
+    Quota checks, eviction and the insert run in one IMMEDIATE transaction,
+    so concurrent processes can't overshoot the caps between them. Bodies live
+    once per content hash in `bodies`; sweeps drop the ones no draft uses.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self, path: str = DRAFT_STORE_DB, expiry_seconds: int = 600, **limits: int
+    ) -> None:
+        super().__init__(expiry_seconds, **limits)
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never creates the database
+        if self._db is None:
+            db = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False, timeout=30
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            columns = [row[1] for row in db.execute("PRAGMA table_info(drafts)")]
+            if "claimed_until" not in columns:
+                db.execute("ALTER TABLE drafts ADD COLUMN claimed_until REAL")
+            if "body_key" not in columns:
+                db.execute("ALTER TABLE drafts ADD COLUMN body_key TEXT")
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS drafts_body_key ON drafts (body_key)"
+            )
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def create_draft(self, data: Dict[str, Any], session: Optional[str] = None) -> str:
+        session = session or LOCAL_SESSION
+        size = draft_size(data)
+        meta, body = _split_body(data)
+        payload = json.dumps(meta)
+        key = bodies.body_key(body) if body is not None else None
+        draft_id = str(uuid.uuid4())
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count, held = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM drafts"
+                    " WHERE session = ?",
+                    (session,),
+                ).fetchone()
+                self._check_quota(size, count, held)
+                total, total_bytes = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM drafts"
+                ).fetchone()
+                # Oldest-first eviction keeps the whole store under its caps
+                while total and (
+                    total + 1 > self.max_count or total_bytes + size > self.max_bytes
+                ):
+                    oldest_id, oldest_size = conn.execute(
+                        "SELECT id, size FROM drafts ORDER BY created_at LIMIT 1"
+                    ).fetchone()
+                    conn.execute("DELETE FROM drafts WHERE id = ?", (oldest_id,))
+                    total -= 1
+                    total_bytes -= oldest_size
+                    self.evictions += 1
+                # key is set exactly when there is a body
+                if (
+                    body is not None
+                    and not conn.execute(
+                        "SELECT 1 FROM bodies WHERE key = ?", (key,)
+                    ).fetchone()
+                ):
+                    codec, blob = bodies.encode(body)
+                    conn.execute(
+                        "INSERT INTO bodies (key, codec, blob, raw_size)"
+                        " VALUES (?, ?, ?, ?)",
+                        (key, codec, blob, len(body.encode("utf-8", "surrogatepass"))),
+                    )
+                conn.execute(
+                    "INSERT INTO drafts (id, created_at, session, size, payload,"
+                    " body_key) VALUES (?, ?, ?, ?, ?, ?)",
+                    (draft_id, time.time(), session, size, payload, key),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.created += 1
+        return draft_id
+
+    def get_draft(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT d.created_at, {_DRAFT_COLUMNS} FROM drafts d"
+                " LEFT JOIN bodies b ON b.key = d.body_key WHERE d.id = ?",
+                (draft_id,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            timestamp, payload = row[0], row[1:]
+            if time.time() - timestamp > self.expiry_seconds:
+                # Lazy cleanup on access
+                cursor = self._conn.execute(
+                    "DELETE FROM drafts WHERE id = ?", (draft_id,)
+                )
+                self.expirations += cursor.rowcount
+                return None
+
+        return _hydrate(*payload)
+
+    def delete_draft(self, draft_id: str) -> None:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+            self.deleted += cursor.rowcount
+
+    def claim(self, draft_id: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            # IMMEDIATE takes the write lock up front: one claimer across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                status, payload = self._claim_locked(conn, draft_id, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if status != CLAIMED or payload is None:
+            return status, None
+        return status, _hydrate(*payload)
+
+    def _claim_locked(
+        self, conn: sqlite3.Connection, draft_id: str, now: float
+    ) -> Tuple[str, Optional[Tuple[Any, ...]]]:
+        # Caller holds the lock and an open IMMEDIATE transaction
+        if conn.execute(
+            "SELECT 1 FROM sent_drafts WHERE id = ?", (draft_id,)
+        ).fetchone():
+            self.contended += 1
+            return ALREADY_SENT, None
+        row = conn.execute(
+            f"SELECT d.created_at, d.claimed_until, {_DRAFT_COLUMNS} FROM drafts d"
+            " LEFT JOIN bodies b ON b.key = d.body_key WHERE d.id = ?",
+            (draft_id,),
+        ).fetchone()
+        if row is None:
+            return NOT_FOUND, None
+        created_at, claimed_until, payload = row[0], row[1], row[2:]
+        if now - created_at > self.expiry_seconds:
+            conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+            self.expirations += 1
+            return NOT_FOUND, None
+        if claimed_until is not None and claimed_until > now:
+            self.contended += 1
+            return IN_PROGRESS, None
+        conn.execute(
+            "UPDATE drafts SET claimed_until = ? WHERE id = ?",
+            (now + self.claim_seconds, draft_id),
+        )
+        self.claims += 1
+        return CLAIMED, payload
+
+    def renew_claim(self, draft_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE drafts SET claimed_until = ?"
+                " WHERE id = ? AND claimed_until IS NOT NULL",
+                (time.time() + self.claim_seconds, draft_id),
+            )
+        return cursor.rowcount == 1
+
+    def release(self, draft_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE drafts SET claimed_until = NULL WHERE id = ?", (draft_id,)
+            )
+
+    def burn(self, draft_id: str) -> None:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO sent_drafts (id, sent_at) VALUES (?, ?)",
+                    (draft_id, time.time()),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.deleted += cursor.rowcount
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Deletes expired drafts using the created_at index; returns how many."""
+        now = time.time() if now is None else now
+        with self._lock:
+            # Sent markers only need to outlive the drafts they stand for
+            self._conn.execute(
+                "DELETE FROM sent_drafts WHERE sent_at < ?",
+                (now - self.expiry_seconds,),
+            )
+            cursor = self._conn.execute(
+                "DELETE FROM drafts WHERE created_at < ?", (now - self.expiry_seconds,)
+            )
+            # Bodies no draft references any more (sent, cancelled, expired)
+            self._conn.execute(
+                "DELETE FROM bodies WHERE NOT EXISTS"
+                " (SELECT 1 FROM drafts WHERE drafts.body_key = bodies.key)"
+            )
+            self.expirations += cursor.rowcount
+            self.sweeps += 1
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM drafts")
+            self._conn.execute("DELETE FROM bodies")
+            self._conn.execute("DELETE FROM sent_drafts")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+
+    def session_usage(self, session: Optional[str] = None) -> Dict[str, int]:
+        with self._lock:
+            count, held = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM drafts WHERE session = ?",
+                (session or LOCAL_SESSION,),
+            ).fetchone()
+        return {"count": count, "bytes": held}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size, held, sessions, oldest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT session),"
+                " MIN(created_at) FROM drafts"
+            ).fetchone()
+            distinct, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(blob)), 0) FROM bodies"
+            ).fetchone()
+            stats = self._stats(size, held, sessions, oldest)
+            stats["bodies"] = {"distinct": distinct, "stored_bytes": stored}
+            return stats
+
+
+# Columns _hydrate() needs, from `drafts d LEFT JOIN bodies b`
+_DRAFT_COLUMNS = "d.payload, d.body_key, b.codec, b.blob"
+
+
+def _hydrate(
+    payload: str, key: Optional[str], codec: Optional[str], blob: Optional[bytes]
+) -> Dict[str, Any]:
+    data = json.loads(payload)
+    # codec and blob come from a LEFT JOIN: None only if the body row is gone
+    if key is not None and codec is not None and blob is not None:
+        data["body"] = bodies.decode(codec, blob)
+    return data
+
+
+def make_store(backend: str = DRAFT_STORE_BACKEND) -> DraftBackend:
+    """Builds the draft store selected by DRAFT_STORE_BACKEND."""
+    if backend == "memory":
+        return DraftStore()
+    if backend == "sqlite":
+        return SqliteDraftStore()
+    raise ValueError(f"Unknown DRAFT_STORE_BACKEND: {backend!r}")
 
 
 # Global singleton instance
-store = DraftStore()
+store = make_store()
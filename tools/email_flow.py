@@ -1,24 +1,201 @@
-from typing import Any, Dict, List, Literal, Optional
+import asyncio
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from fastmcp import FastMCP
-# Reuse the logic from preview, but we will call it internally or just reimplement strict call
-# Actually, better to re-use the preview logic to valid and then save.
-# But preview logic is inside a closure in 'register'.
-# Refactoring 'mail_preview' to expose 'validate_and_preview' would be cleaner,
-# but for now let's just use the validation logic if possible or duplicate simple checks.
-# To avoid duplication, let's keep it simple: prepare_email does the same validates as preview.
+from fastmcp.server.dependencies import get_context
+from tools import config, drafts, mail_merge, mail_preview
+from tools import attachments, auth, concurrency, graph_client, outbox, rate_limit
 
-# WAIT: best approach is to refactor mail_preview.py to share validation logic.
-# For now, I will implement the tools and rely on the existing preview tool to be called by user BEFORE prepare,
-# OR prepare re-runs validations. Roadmap said: "prepare_email: devuelve preview + draft_id".
-# So it should generate the preview too.
 
-from tools import drafts
+# prepare_email errors for blocking issues; other issues (empty subject) pass
+_PREPARE_ERRORS = {
+    "missing_to": lambda issue: "Missing 'to' recipients",
+    "too_many_recipients": lambda issue: f"Too many recipients (max {issue['max']})",
+    "invalid_email": lambda issue: "Invalid email format detected",
+    "blocked_domain": lambda issue: "Domain not allowed by policy",
+    "domain_recipient_limit": lambda issue: (
+        f"Too many recipients for {issue['domain']} (max {issue['max']})"
+    ),
+    "body_too_large": lambda issue: f"Body too long (max {issue['max']})",
+}
 
-# We need to import the validator helper from mail_preview or move it to a shared lib.
-# Let's import the private helpers for now (Python allows it).
-from tools.mail_preview import _normalize_emails, _is_valid_email, _domain_allowed
-from tools.mail_preview import MAX_RECIPIENTS, MAX_BODY_CHARS
-from tools import auth, graph_client
+
+def _send_error_message(e: Exception) -> str:
+    """User-facing message for a failed Graph send."""
+    if isinstance(e, attachments.AttachmentError):
+        return f"Attachment error: {str(e)}"
+    if isinstance(e, graph_client.GraphAuthError):
+        return "Authentication failed. Token invalid or expired."
+    if isinstance(e, graph_client.GraphThrottlingError):
+        return "Rate limit exceeded. Try again later."
+    if isinstance(e, graph_client.GraphClientError):
+        return f"Invalid request: {str(e)}"
+    if isinstance(e, graph_client.GraphServerError):
+        return "Microsoft Graph Server Error. Try again."
+    return f"Error sending email: {str(e)}"
+
+
+def _recipient_count(data: Dict[str, Any]) -> int:
+    return len(data["to"]) + len(data.get("cc") or []) + len(data.get("bcc") or [])
+
+
+def _rate_limit_message(e: rate_limit.RateLimitExceeded) -> str:
+    return f"Mailbox sending limit reached. Available at {e.available_at_iso}."
+
+
+def _claim_error(status: str, draft_id: str) -> str:
+    """Message for a draft that could not be claimed for sending."""
+    if status == drafts.IN_PROGRESS:
+        return (
+            f"Draft '{draft_id}' is already being sent. Wait for that send to finish."
+        )
+    if status == drafts.ALREADY_SENT:
+        return f"Draft '{draft_id}' was already sent."
+    return f"Draft '{draft_id}' not found or expired."
+
+
+def _merge_draft_error(draft_id: str) -> str:
+    return f"Draft '{draft_id}' is a mail merge batch. Use confirm_mail_merge."
+
+
+def _merge_check(cfg: config.MailerConfig):
+    """Per-row validation for a mail merge: prepare_email's rules and messages."""
+
+    def check(to: str, subject: str, body: str) -> Optional[str]:
+        result = mail_preview.validate_message([to], subject, body, cfg=cfg)
+        for issue in result.issues:
+            if issue["type"] in _PREPARE_ERRORS:
+                return _PREPARE_ERRORS[issue["type"]](issue)
+        return None
+
+    return check
+
+
+# prepare_email's `attachments` argument shadows the module inside the tool
+def _describe_attachments(
+    paths: Optional[List[str]],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Draft metadata for attachment files, or an error message."""
+    if not paths:
+        return [], None
+    try:
+        return attachments.describe(paths), None
+    except attachments.AttachmentError as e:
+        return [], f"Invalid attachment: {e}"
+
+
+def _attachment_summary(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"name": a["name"], "size": a["size"], "mode": a["mode"]} for a in files]
+
+
+def _session_id() -> Optional[str]:
+    """MCP session of the current request, for per-session draft quotas."""
+    try:
+        return get_context().session_id
+    except RuntimeError:
+        # Called outside a request (tests, scripts)
+        return None
+
+
+async def _send_claimed(
+    draft_id: str, data: Dict[str, Any], priority: str
+) -> Tuple[bool, str]:
+    """Sends a claimed draft; returns (sent or queued, message to show)."""
+    # With the outbox on, the send is durable and happens in the background
+    if outbox.OUTBOX_ENABLED:
+        job_id = await asyncio.to_thread(
+            outbox.outbox.enqueue, draft_id, data, priority
+        )
+        return True, (
+            f"Email queued for sending. Job id: {job_id}. "
+            "Call get_send_status(job_id) to follow it."
+        )
+
+    # 3. Get Token (async: never blocks the event loop on MSAL or disk)
+    token_data = await auth.get_token_async()
+    if not token_data or "access_token" not in token_data:
+        return (
+            False,
+            "Error: Authentication required. Run auth_bootstrap.py or check auth status.",
+        )
+
+    token = token_data["access_token"]
+
+    # 4. Mailbox limits: wait briefly or fail fast instead of earning a 429
+    mailbox = rate_limit.mailbox_for(token_data)
+    recipients = _recipient_count(data)
+    try:
+        await rate_limit.limiter.acquire(mailbox, recipients)
+    except rate_limit.RateLimitExceeded as e:
+        return False, _rate_limit_message(e)
+
+    # 5. Send via Graph; capacity for a send that failed or was cancelled is
+    # given back, since the draft is released and may be confirmed again
+    sent = False
+    try:
+        await graph_client.send_mail_async(token, data)
+        sent = True
+    except Exception as e:
+        return False, _send_error_message(e)
+    finally:
+        if not sent:
+            rate_limit.limiter.refund(mailbox, recipients)
+    return True, f"Email sent successfully to {', '.join(data['to'])}"
+
+
+async def _send_many_claimed(
+    claimed: Dict[str, Dict[str, Any]], outcomes: Dict[str, Dict[str, Any]]
+) -> None:
+    """
+    Sends claimed messages in Graph $batch requests, recording each outcome.
+    Burning or releasing the drafts is left to the caller.
+    """
+    ready = dict(claimed)
+    if ready:
+        token_data = await auth.get_token_async()
+        if not token_data or "access_token" not in token_data:
+            for draft_id in ready:
+                outcomes[draft_id] = {
+                    "status": "error",
+                    "message": "Authentication required. Run auth_bootstrap.py or check auth status.",
+                }
+        else:
+            mailbox = rate_limit.mailbox_for(token_data)
+            wait = 0.0
+            reserved: Dict[str, int] = {}
+            try:
+                for draft_id, data in list(ready.items()):
+                    recipients = _recipient_count(data)
+                    try:
+                        wait = max(
+                            wait, rate_limit.limiter.reserve(mailbox, recipients)
+                        )
+                    except rate_limit.RateLimitExceeded as e:
+                        del ready[draft_id]
+                        outcomes[draft_id] = {
+                            "status": "error",
+                            "message": _rate_limit_message(e),
+                            "available_at": e.available_at_iso,
+                        }
+                        continue
+                    reserved[draft_id] = recipients
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                errors = await graph_client.send_mail_batch_async(
+                    token_data["access_token"], ready
+                )
+                for draft_id, error in errors.items():
+                    if error is None:
+                        outcomes[draft_id] = {"status": "sent"}
+                    else:
+                        outcomes[draft_id] = {
+                            "status": "error",
+                            "message": _send_error_message(error),
+                        }
+            finally:
+                # Failed, cancelled or never attempted: give the capacity back
+                for draft_id, recipients in reserved.items():
+                    if outcomes.get(draft_id, {}).get("status") != "sent":
+                        rate_limit.limiter.refund(mailbox, recipients)
 
 
 def register(mcp: FastMCP) -> None:
@@ -30,34 +207,31 @@ def register(mcp: FastMCP) -> None:
         content_type: Literal["Text", "HTML"] = "Text",
         cc: Optional[List[str]] = None,
         bcc: Optional[List[str]] = None,
+        attachments: Optional[List[str]] = None,
     ) -> Dict[str, Any]:
         """
         Guarda un borrador de email y devuelve un draft_id.
         Requiere llamar a confirm_send(draft_id) para enviarlo realmente.
+        attachments: rutas de ficheros locales bajo ATTACHMENT_DIR; los grandes
+            se suben por partes.
         """
-        # 1. Validation (Clean & Simple version)
-        to_n = _normalize_emails(to)
-        cc_n = _normalize_emails(cc)
-        bcc_n = _normalize_emails(bcc)
-        all_rcpts = to_n + cc_n + bcc_n
-
-        if not to_n:
-            return {"error": "Missing 'to' recipients"}
-
-        if len(all_rcpts) > MAX_RECIPIENTS:
-            return {"error": f"Too many recipients (max {MAX_RECIPIENTS})"}
+        # 1. Validation (same engine as preview_email)
+        result = mail_preview.validate_message(to, subject, body, cc, bcc)
+        blocking = [i for i in result.issues if i["type"] in _PREPARE_ERRORS]
+        if blocking:
+            return {
+                "error": _PREPARE_ERRORS[blocking[0]["type"]](blocking[0]),
+                "issues": blocking,
+            }
+        to_n, cc_n, bcc_n = result.to, result.cc, result.bcc
 
-        if any(not _is_valid_email(e) for e in all_rcpts):
-            return {"error": "Invalid email format detected"}
-
-        if any(not _domain_allowed(e) for e in all_rcpts):
-            return {"error": "Domain not allowed by policy"}
-
-        if len(body) > MAX_BODY_CHARS:
-            return {"error": f"Body too long (max {MAX_BODY_CHARS})"}
+        # Only file metadata goes into the draft; content is read at send time
+        files, error = _describe_attachments(attachments)
+        if error:
+            return {"error": error}
 
         # 2. Save Draft
-        email_data = {
+        email_data: Dict[str, Any] = {
             "to": to_n,
             "cc": cc_n,
             "bcc": bcc_n,
@@ -65,52 +239,233 @@ def register(mcp: FastMCP) -> None:
             "body": body,
             "content_type": content_type,
         }
+        if files:
+            email_data["attachments"] = files
 
-        draft_id = drafts.store.create_draft(email_data)
+        try:
+            draft_id = drafts.store.create_draft(email_data, session=_session_id())
+        except drafts.DraftQuotaExceeded as e:
+            return {"error": f"Draft quota exceeded: {e}"}
 
         return {
             "status": "Draft created. ACTION REQUIRED: Call confirm_send(draft_id) to send.",
             "draft_id": draft_id,
             "expires_in_seconds": drafts.store.expiry_seconds,
-            "preview": {"subject": subject, "recipients_count": len(all_rcpts)},
+            "preview": {
+                "subject": subject,
+                "recipients_count": result.count,
+                **({"attachments": _attachment_summary(files)} if files else {}),
+            },
         }
 
     @mcp.tool
-    def confirm_send(draft_id: str) -> str:
+    async def confirm_send(
+        draft_id: str, priority: Literal["interactive", "bulk"] = "interactive"
+    ) -> str:
         """
         Confirma y envía un borrador previamente creado con prepare_email.
+        priority="bulk" cede capacidad a los envíos interactivos.
+        """
+        # Exactly one concurrent confirmation gets the draft
+        status, data = await asyncio.to_thread(drafts.store.claim, draft_id)
+        if status != drafts.CLAIMED or data is None:
+            return f"Error: {_claim_error(status, draft_id)}"
+        if data.get("kind") == mail_merge.MERGE:
+            await asyncio.to_thread(drafts.store.release, draft_id)
+            return f"Error: {_merge_draft_error(draft_id)}"
+        concurrency.current_lane.set(priority)
+        try:
+            async with drafts.store.keep_claimed([draft_id]):
+                sent, message = await _send_claimed(draft_id, data, priority)
+        except BaseException:
+            await asyncio.to_thread(drafts.store.release, draft_id)
+            raise
+        # Burn the draft (only on success); otherwise give it back for a retry
+        if sent:
+            await asyncio.to_thread(drafts.store.burn, draft_id)
+        else:
+            await asyncio.to_thread(drafts.store.release, draft_id)
+        return message
+
+    @mcp.tool
+    async def confirm_send_many(
+        draft_ids: List[str], priority: Literal["interactive", "bulk"] = "bulk"
+    ) -> Dict[str, Any]:
+        """
+        Confirma y envía varios borradores a la vez (Graph JSON $batch).
+        Devuelve el resultado por draft_id; solo se eliminan los enviados.
+        Por defecto usa la prioridad "bulk".
         """
-        data = drafts.store.get_draft(draft_id)
-        if not data:
-            return f"Error: Draft '{draft_id}' not found or expired."
+        concurrency.current_lane.set(priority)
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        ready: Dict[str, Dict[str, Any]] = {}
+        claims = await asyncio.to_thread(
+            lambda: [
+                (did, *drafts.store.claim(did)) for did in dict.fromkeys(draft_ids)
+            ]
+        )
+        for draft_id, status, data in claims:
+            if status != drafts.CLAIMED or data is None:
+                outcomes[draft_id] = {
+                    "status": "error",
+                    "message": _claim_error(status, draft_id),
+                }
+            elif data.get("kind") == mail_merge.MERGE:
+                await asyncio.to_thread(drafts.store.release, draft_id)
+                outcomes[draft_id] = {
+                    "status": "error",
+                    "message": _merge_draft_error(draft_id),
+                }
+            else:
+                ready[draft_id] = data
 
-        # 3. Get Token
-        token_data = auth.get_token()
-        if not token_data or "access_token" not in token_data:
-            return "Error: Authentication required. Run auth_bootstrap.py or check auth status."
+        def settle() -> None:
+            # Burn only the drafts Graph accepted; the rest go back to the store
+            for draft_id in ready:
+                if outcomes.get(draft_id, {}).get("status") == "sent":
+                    drafts.store.burn(draft_id)
+                else:
+                    drafts.store.release(draft_id)
+
+        try:
+            async with drafts.store.keep_claimed(ready):
+                await _send_many_claimed(ready, outcomes)
+        finally:
+            await asyncio.to_thread(settle)
 
-        token = token_data["access_token"]
+        results = [
+            {"draft_id": did, **outcomes[did]} for did in dict.fromkeys(draft_ids)
+        ]
+        sent = sum(1 for r in results if r["status"] == "sent")
+        return {"sent": sent, "failed": len(results) - sent, "results": results}
 
-        # 4. Send via Graph
+    @mcp.tool
+    def prepare_mail_merge(
+        subject: str,
+        body: str,
+        content_type: Literal["Text", "HTML"] = "Text",
+        rows: Optional[List[Dict[str, Any]]] = None,
+        rows_file: Optional[str] = None,
+        recipient_field: str = "email",
+        attachments: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Prepara un envío combinado: una plantilla ({{ campo }} en subject y body)
+        que se renderiza por fila, desde rows o un fichero local CSV/JSONL
+        (UTF-8, bajo MAIL_MERGE_DIR).
+        Cada fila se valida como prepare_email; devuelve un único batch_id que
+        se envía entero con confirm_mail_merge(batch_id).
+        """
+        template = mail_merge.MergeTemplate(subject, body, content_type)
+        files, error = _describe_attachments(attachments)
+        if error:
+            return {"error": error}
+
+        # One config snapshot for every row of the batch
+        check = _merge_check(config.current())
         try:
-            graph_client.send_mail(token, data)
-        except graph_client.GraphAuthError:
-            return "Authentication failed. Token invalid or expired."
-        except graph_client.GraphThrottlingError:
-            return "Rate limit exceeded. Try again later."
-        except graph_client.GraphClientError as e:
-            return f"Invalid request: {str(e)}"
-        except graph_client.GraphServerError:
-            return "Microsoft Graph Server Error. Try again."
-        except Exception as e:
-            return f"Error sending email: {str(e)}"
-
-        recipients = ", ".join(data["to"])
-
-        # 5. Burn the draft (only on success)
-        drafts.store.delete_draft(draft_id)
+            batch = mail_merge.build_batch(
+                template,
+                mail_merge.iter_source(rows, rows_file),
+                recipient_field,
+                check,
+            )
+        except mail_merge.MergeError as e:
+            return {"error": str(e)}
+        summary = {
+            "accepted": len(batch["rows"]),
+            "rejected": batch["rejected_count"],
+            "rejects": batch["rejected"],
+        }
+        if not batch["rows"]:
+            return {"error": "No valid rows to send", **summary}
+
+        try:
+            batch_id = drafts.store.create_draft(
+                mail_merge.batch_data(template, batch["rows"], files),
+                session=_session_id(),
+            )
+        except drafts.DraftQuotaExceeded as e:
+            return {"error": f"Draft quota exceeded: {e}"}
 
-        return f"Email sent successfully to {recipients}"
+        return {
+            "status": "Batch created. ACTION REQUIRED: Call confirm_mail_merge(batch_id) to send.",
+            "batch_id": batch_id,
+            "expires_in_seconds": drafts.store.expiry_seconds,
+            **summary,
+            "preview": {
+                **batch["sample"],
+                **({"attachments": _attachment_summary(files)} if files else {}),
+            },
+        }
+
+    @mcp.tool
+    async def confirm_mail_merge(
+        batch_id: str, priority: Literal["interactive", "bulk"] = "bulk"
+    ) -> Dict[str, Any]:
+        """
+        Confirma y envía todas las filas de un batch de prepare_mail_merge.
+        Si algunas filas fallan, devuelve un retry_batch_id con solo esas filas.
+        """
+        status, data = await asyncio.to_thread(drafts.store.claim, batch_id)
+        # A CLAIMED draft always comes with its data
+        if status != drafts.CLAIMED or data is None:
+            return {"error": _claim_error(status, batch_id)}
+        if data.get("kind") != mail_merge.MERGE:
+            await asyncio.to_thread(drafts.store.release, batch_id)
+            return {
+                "error": f"Draft '{batch_id}' is not a mail merge batch. Use confirm_send."
+            }
+        concurrency.current_lane.set(priority)
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        try:
+            async with drafts.store.keep_claimed([batch_id]):
+                await _send_many_claimed(mail_merge.render_batch(data), outcomes)
+        except BaseException:
+            await asyncio.to_thread(drafts.store.release, batch_id)
+            raise
+
+        failed_rows = [
+            r for r in data["rows"] if outcomes[str(r[0])]["status"] != "sent"
+        ]
+        failures = [
+            {"row": line, "to": to, **outcomes[str(line)]}
+            for line, to, _ in failed_rows
+        ]
+        sent = len(data["rows"]) - len(failed_rows)
+        result: Dict[str, Any] = {
+            "sent": sent,
+            "failed": len(failed_rows),
+            "failures": failures,
+        }
+        if not sent:
+            # Nothing went out: the same batch can be confirmed again
+            await asyncio.to_thread(drafts.store.release, batch_id)
+            return result
+
+        # Burned even when partly sent, so no recipient gets the message twice
+        await asyncio.to_thread(drafts.store.burn, batch_id)
+        if failed_rows:
+            session = _session_id()
+            try:
+                result["retry_batch_id"] = await asyncio.to_thread(
+                    drafts.store.create_draft,
+                    {**data, "rows": failed_rows},
+                    session=session,
+                )
+            except drafts.DraftQuotaExceeded as e:
+                result["retry_error"] = f"Draft quota exceeded: {e}"
+        return result
+
+    @mcp.tool
+    async def get_send_status(job_id: str) -> Dict[str, Any]:
+        """Devuelve el estado de un envío encolado por confirm_send (outbox)."""
+        if not outbox.OUTBOX_ENABLED:
+            return {"error": "Outbox is disabled; confirm_send sends immediately."}
+        job = await asyncio.to_thread(outbox.outbox.get, job_id)
+        if not job:
+            return {"error": f"Job '{job_id}' not found."}
+        return job
 
     @mcp.tool
     def cancel_draft(draft_id: str) -> str:
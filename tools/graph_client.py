@@ -1,7 +1,41 @@
-import requests
-from typing import Dict, Any, List
+import asyncio
+import contextlib
+import email.utils
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
 
-GRAPH_API_URL = "https://graph.microsoft.com/v1.0"
+import httpx
+
+from tools import attachment_cache, attachments, concurrency, retry
+
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
+
+# --- HTTP transport (shared, keep-alive connection pool) ---
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "20"))
+GRAPH_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("GRAPH_MAX_KEEPALIVE_CONNECTIONS", "10")
+)
+GRAPH_KEEPALIVE_EXPIRY = float(os.getenv("GRAPH_KEEPALIVE_EXPIRY", "30"))
+GRAPH_HTTP2 = os.getenv("GRAPH_HTTP2") == "1"
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "10"))
+GRAPH_WRITE_TIMEOUT = float(os.getenv("GRAPH_WRITE_TIMEOUT", "10"))
+GRAPH_POOL_TIMEOUT = float(os.getenv("GRAPH_POOL_TIMEOUT", "5"))
+
+# --- JSON batching ($batch) ---
+GRAPH_BATCH_MAX_REQUESTS = 20  # hard limit enforced by Graph
+GRAPH_BATCH_CONCURRENCY = int(os.getenv("GRAPH_BATCH_CONCURRENCY", "4"))
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+# AsyncClient pools are bound to the event loop they were created on
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
 
 
 def _build_recipient_list(emails: List[str]) -> List[Dict[str, Any]]:
@@ -11,7 +45,18 @@ def _build_recipient_list(emails: List[str]) -> List[Dict[str, Any]]:
 class GraphError(Exception):
     """Base class for Graph API errors."""
 
-    pass
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        request_sent: bool = True,
+    ) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        # False only when the request certainly never reached Graph
+        self.request_sent = request_sent
 
 
 class GraphAuthError(GraphError):
@@ -38,14 +83,127 @@ class GraphServerError(GraphError):
     pass
 
 
-def send_mail(token: str, draft: Dict[str, Any]) -> None:
-    """
-    Sends an email using Microsoft Graph API.
-    Raises GraphError subclasses on failure.
-    """
-    url = f"{GRAPH_API_URL}/me/sendMail"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+def _http2_enabled() -> bool:
+    if not GRAPH_HTTP2:
+        return False
+    # httpx only speaks HTTP/2 when the optional 'h2' package is installed
+    if importlib.util.find_spec("h2") is None:
+        logging.warning("GRAPH_HTTP2=1 but 'h2' is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def _client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=GRAPH_MAX_CONNECTIONS,
+            max_keepalive_connections=GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GRAPH_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            connect=GRAPH_CONNECT_TIMEOUT,
+            read=GRAPH_READ_TIMEOUT,
+            write=GRAPH_WRITE_TIMEOUT,
+            pool=GRAPH_POOL_TIMEOUT,
+        ),
+        "http2": _http2_enabled(),
+    }
+
+
+def get_client() -> httpx.Client:
+    """Returns the process-wide Graph HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def close_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the Graph AsyncClient for the running event loop."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(**_client_options())
+        _async_client_loop = loop
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_client_loop = None
+
+
+def _parse_retry_after(value: Any) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
 
+def _error_for_status(
+    status: int, error_msg: str, retry_after: Optional[float] = None
+) -> GraphError:
+    """Builds the GraphError subclass matching an HTTP status."""
+    full_msg = f"Graph API Error ({status}): {error_msg}"
+    kwargs: Dict[str, Any] = {"status": status, "retry_after": retry_after}
+
+    if status == 401:
+        return GraphAuthError(full_msg, **kwargs)
+    elif status == 429:
+        return GraphThrottlingError(full_msg, **kwargs)
+    elif 400 <= status < 500:
+        return GraphClientError(full_msg, **kwargs)
+    elif status >= 500:
+        return GraphServerError(full_msg, **kwargs)
+    else:
+        return GraphError(full_msg, **kwargs)
+
+
+def _network_error(e: httpx.HTTPError) -> GraphError:
+    # Connect-phase failures happen before any byte of the request is sent
+    not_sent = isinstance(
+        e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    )
+    return GraphError(f"Network error: {str(e)}", request_sent=not not_sent)
+
+
+def _raise_for_status(response: httpx.Response) -> None:
+    """Maps a failed Graph response to the matching GraphError subclass."""
+    if response.is_success:
+        return
+
+    # Try to parse error details
+    try:
+        error_data = response.json()
+        error_msg = error_data.get("error", {}).get("message", response.text)
+    except Exception:
+        error_msg = response.text
+
+    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+    raise _error_for_status(response.status_code, error_msg, retry_after)
+
+
+def _build_message(draft: Dict[str, Any]) -> Dict[str, Any]:
     # Construct Message Resource
     # https://learn.microsoft.com/en-us/graph/api/resources/message
     message = {
@@ -58,32 +216,416 @@ def send_mail(token: str, draft: Dict[str, Any]) -> None:
         "ccRecipients": _build_recipient_list(draft.get("cc") or []),
         "bccRecipients": _build_recipient_list(draft.get("bcc") or []),
     }
+    return message
 
-    payload = {"message": message, "saveToSentItems": "true"}
 
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-    except requests.RequestException as e:
-        raise GraphError(f"Network error: {str(e)}")
-
-    if not response.ok:
-        # Try to parse error details
-        try:
-            error_data = response.json()
-            error_msg = error_data.get("error", {}).get("message", response.text)
-        except Exception:
-            error_msg = response.text
-
-        status = response.status_code
-        full_msg = f"Graph API Error ({status}): {error_msg}"
-
-        if status == 401:
-            raise GraphAuthError(full_msg)
-        elif status == 429:
-            raise GraphThrottlingError(full_msg)
-        elif 400 <= status < 500:
-            raise GraphClientError(full_msg)
-        elif status >= 500:
-            raise GraphServerError(full_msg)
+class StreamedJsonBody:
+    """
+    A JSON request body assembled from fixed fragments and file attachments
+    base64-encoded from disk while it is sent. Its length is known up front,
+    so it goes out with a Content-Length, and a send holds one encoded chunk
+    at a time instead of several full copies of every attachment. Content
+    already in the attachment cache is sent from there without re-encoding.
+
+    Each iteration starts over, so a retried request can send it again.
+    """
+
+    def __init__(self, parts: List[Any]) -> None:
+        # bytes fragments and attachment items (encoded when iterated)
+        self.parts = parts
+        self.length = sum(
+            len(p) if isinstance(p, bytes) else attachments.encoded_size(p["size"])
+            for p in parts
+        )
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from attachment_cache.cache.iter_encoded(part)
+
+    async def aiter(self) -> AsyncIterator[bytes]:
+        """Async iteration; file reads and encoding run off the event loop."""
+        chunks = iter(self)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        return {**headers, "Content-Length": str(self.length)}
+
+
+def _build_message_body(
+    draft: Dict[str, Any], inline: List[Dict[str, Any]], envelope: bool
+) -> StreamedJsonBody:
+    """
+    The message with its inline attachments as a StreamedJsonBody; wrapped in
+    the sendMail envelope when `envelope`, bare for POST /me/messages.
+    """
+    message = json.dumps(_build_message(draft)).encode()
+    # Re-open the message object to append the attachments array
+    parts: List[Any] = [message[:-1] + b', "attachments": [']
+    for i, item in enumerate(inline):
+        if i:
+            parts.append(b", ")
+        parts += [attachments.file_attachment_head(item), item, b'"}']
+    parts.append(b"]}")
+    if envelope:
+        parts.insert(0, b'{"message": ')
+        parts.append(b', "saveToSentItems": "true"}')
+    return StreamedJsonBody(parts)
+
+
+def _build_send_mail_request(token: str, draft: Dict[str, Any]):
+    url = f"{GRAPH_API_URL}/me/sendMail"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    payload = {"message": _build_message(draft), "saveToSentItems": "true"}
+    return url, headers, payload
+
+
+def send_mail(token: str, draft: Dict[str, Any]) -> None:
+    """
+    Sends an email using Microsoft Graph API.
+    Raises GraphError subclasses on failure.
+    Large attachments need an upload session: use send_mail_async().
+    """
+    url, headers, payload = _build_send_mail_request(token, draft)
+    inline, upload = attachments.split(draft.get("attachments"))
+    if upload:
+        raise attachments.AttachmentError(
+            "Attachments over the inline limit need send_mail_async()"
+        )
+    body = _build_message_body(draft, inline, envelope=True) if inline else None
+
+    def attempt() -> None:
+        # Shares the adaptive in-flight limit (and its feedback) with the async path
+        with concurrency.limiter.blocking_slot():
+            try:
+                if body is not None:
+                    response = get_client().post(
+                        url, headers=body.headers(headers), content=iter(body)
+                    )
+                else:
+                    response = get_client().post(url, headers=headers, json=payload)
+            except httpx.HTTPError as e:
+                raise _network_error(e)
+            _raise_for_status(response)
+
+    # sendMail is not idempotent: only retried when Graph surely did not send
+    retry.call(attempt, idempotent=False)
+
+
+async def send_mail_async(token: str, draft: Dict[str, Any]) -> None:
+    """
+    Async variant of send_mail(); same payload and error mapping.
+    Drafts with attachments over the inline limit go through upload sessions.
+    """
+    url, headers, payload = _build_send_mail_request(token, draft)
+    if draft.get("attachments"):
+        inline, upload = attachments.split(draft["attachments"])
+        if upload:
+            await _send_mail_with_uploads_async(token, draft)
         else:
-            raise GraphError(full_msg)
+            body = _build_message_body(draft, inline, envelope=True)
+            await _request_async("POST", url, headers, idempotent=False, body=body)
+        return
+
+    async def attempt() -> None:
+        async with concurrency.limiter.slot():
+            try:
+                response = await get_async_client().post(
+                    url, headers=headers, json=payload
+                )
+            except httpx.HTTPError as e:
+                raise _network_error(e)
+            _raise_for_status(response)
+
+    await retry.call_async(attempt, idempotent=False)
+
+
+async def _request_async(
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    idempotent: bool,
+    body: Optional[StreamedJsonBody] = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """One Graph call with the shared client, concurrency slot and retry rules."""
+
+    async def attempt() -> httpx.Response:
+        request_headers = headers
+        if body is not None:
+            # A fresh stream per attempt
+            request_headers = body.headers(headers)
+            kwargs["content"] = body.aiter()
+        async with concurrency.limiter.slot():
+            try:
+                response = await get_async_client().request(
+                    method, url, headers=request_headers, **kwargs
+                )
+            except httpx.HTTPError as e:
+                raise _network_error(e)
+            _raise_for_status(response)
+            return response
+
+    return await retry.call_async(attempt, idempotent=idempotent)
+
+
+def _next_expected_offset(response: httpx.Response, default: int) -> int:
+    """First byte Graph still expects, from nextExpectedRanges ("start-end")."""
+    try:
+        ranges = response.json().get("nextExpectedRanges") or []
+    except ValueError:
+        return default
+    if not ranges:
+        return default
+    return int(str(ranges[0]).split("-")[0])
+
+
+async def _acknowledged_offset(upload_url: str, default: int) -> int:
+    """Asks the upload session where to resume; `default` if it can't say."""
+    try:
+        response = await get_async_client().get(upload_url)
+    except httpx.HTTPError:
+        return default
+    if not response.is_success:
+        return default
+    return _next_expected_offset(response, default)
+
+
+async def _single_chunk(chunk: bytes):
+    # A bytes body would stay referenced from the request, which httpx keeps in
+    # a reference cycle with its response: every chunk would live until the
+    # next garbage collection. A drained generator drops it straight away.
+    yield chunk
+
+
+async def upload_attachment_async(
+    upload_url: str,
+    item: Dict[str, Any],
+    chunk_size: Optional[int] = None,
+    policy: Optional[retry.RetryPolicy] = None,
+) -> None:
+    """
+    Uploads one file to a Graph upload session in `chunk_size` pieces read
+    straight from disk, so memory stays at one chunk whatever the file size.
+    After a failed chunk it resumes from the range Graph last acknowledged.
+    """
+    chunk_size = chunk_size or attachments.ATTACHMENT_UPLOAD_CHUNK_BYTES
+    policy = policy or retry.default_policy
+    size = item["size"]
+    start = time.monotonic()
+    failures = 0
+    offset = 0
+    with open(item["path"], "rb") as f:
+        while offset < size:
+            chunk = await asyncio.to_thread(
+                attachments.read_chunk, f, offset, min(chunk_size, size - offset)
+            )
+            if not chunk:
+                raise attachments.AttachmentError(
+                    f"{item['name']} changed during upload"
+                )
+            headers = {
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(len(chunk)),
+                "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}",
+            }
+            try:
+                async with concurrency.limiter.slot():
+                    try:
+                        # The upload URL embeds its own credentials: no bearer token
+                        response = await get_async_client().put(
+                            upload_url, headers=headers, content=_single_chunk(chunk)
+                        )
+                    except httpx.HTTPError as e:
+                        raise _network_error(e)
+                    _raise_for_status(response)
+            except GraphError as e:
+                failures += 1
+                delay = policy.next_delay(
+                    e, failures, time.monotonic() - start, idempotent=True
+                )
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                offset = await _acknowledged_offset(upload_url, offset)
+                continue
+            if response.status_code == 201:
+                # Created: the last range landed and the attachment exists
+                return
+            offset = _next_expected_offset(response, offset + len(chunk))
+
+
+async def _send_mail_with_uploads_async(token: str, draft: Dict[str, Any]) -> None:
+    """
+    Draft-message flow for large attachments: create the message (with any
+    inline attachments), upload the rest through createUploadSession, then
+    send it. A failure deletes the half-built message from the mailbox.
+    """
+    inline, upload = attachments.split(draft.get("attachments"))
+    for item in upload:
+        attachments.check_unchanged(item)
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    # Creating a draft message is not idempotent: a resend would leave a copy
+    created = await _request_async(
+        "POST",
+        f"{GRAPH_API_URL}/me/messages",
+        headers,
+        idempotent=False,
+        body=_build_message_body(draft, inline, envelope=False),
+    )
+    message_url = f"{GRAPH_API_URL}/me/messages/{created.json()['id']}"
+    try:
+        for item in upload:
+            session = await _request_async(
+                "POST",
+                f"{message_url}/attachments/createUploadSession",
+                headers,
+                idempotent=True,
+                json=attachments.upload_item(item),
+            )
+            await upload_attachment_async(session.json()["uploadUrl"], item)
+        await _request_async("POST", f"{message_url}/send", headers, idempotent=False)
+    except Exception:
+        with contextlib.suppress(httpx.HTTPError):
+            await get_async_client().delete(message_url, headers=headers)
+        raise
+
+
+async def _send_batch_chunk(
+    token: str, chunk: List[Tuple[str, Dict[str, Any]]]
+) -> Dict[str, Optional[GraphError]]:
+    url = f"{GRAPH_API_URL}/$batch"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    # Sub-request ids are positions in the chunk, mapped back to draft keys below
+    sub_requests = []
+    for i, (_, draft) in enumerate(chunk):
+        _, _, payload = _build_send_mail_request(token, draft)
+        sub_requests.append(
+            {
+                "id": str(i),
+                "method": "POST",
+                "url": "/me/sendMail",
+                "headers": {"Content-Type": "application/json"},
+                "body": payload,
+            }
+        )
+
+    try:
+        async with concurrency.limiter.slot() as slot:
+            try:
+                response = await get_async_client().post(
+                    url, headers=headers, json={"requests": sub_requests}
+                )
+            except httpx.HTTPError as e:
+                raise _network_error(e)
+            _raise_for_status(response)
+            responses = response.json().get("responses", [])
+            # Throttled sub-requests count as overload even inside a 200 batch
+            if any(int(item.get("status", 0)) in (429, 503) for item in responses):
+                slot.mark_overloaded()
+    except GraphError as e:
+        return {key: e for key, _ in chunk}
+
+    outcomes: Dict[str, Optional[GraphError]] = {
+        key: GraphError("Missing response in batch") for key, _ in chunk
+    }
+    for item in responses:
+        key = chunk[int(item["id"])][0]
+        status = int(item.get("status", 0))
+        if 200 <= status < 300:
+            outcomes[key] = None
+            continue
+        body = item.get("body") or {}
+        error_msg = (
+            body.get("error", {}).get("message", str(body))
+            if isinstance(body, dict)
+            else str(body)
+        )
+        retry_after = _parse_retry_after((item.get("headers") or {}).get("Retry-After"))
+        outcomes[key] = _error_for_status(status, error_msg, retry_after)
+    return outcomes
+
+
+async def send_mail_batch_async(
+    token: str, drafts: Dict[str, Dict[str, Any]]
+) -> Dict[str, Optional[Exception]]:
+    """
+    Sends several drafts through the JSON $batch endpoint, 20 per request,
+    with a few batch requests in flight at once. Drafts with attachments
+    would overflow the batch size limit and are sent one by one instead.
+    Returns {key: None on success | GraphError describing the failure}.
+    """
+    gate = asyncio.Semaphore(GRAPH_BATCH_CONCURRENCY)
+
+    async def send_single(key: str, draft: Dict[str, Any]):
+        async with gate:
+            try:
+                await send_mail_async(token, draft)
+            except (GraphError, attachments.AttachmentError) as e:
+                return key, e
+            return key, None
+
+    singles = {key: d for key, d in drafts.items() if d.get("attachments")}
+    if singles:
+        drafts = {key: d for key, d in drafts.items() if key not in singles}
+
+    async def run(chunk):
+        async with gate:
+            return await _send_batch_chunk(token, chunk)
+
+    async def send_round(
+        pending: Dict[str, Dict[str, Any]],
+    ) -> Dict[str, Optional[GraphError]]:
+        items = list(pending.items())
+        chunks = [
+            items[i : i + GRAPH_BATCH_MAX_REQUESTS]
+            for i in range(0, len(items), GRAPH_BATCH_MAX_REQUESTS)
+        ]
+        result: Dict[str, Optional[GraphError]] = {}
+        for chunk_result in await asyncio.gather(*(run(c) for c in chunks)):
+            result.update(chunk_result)
+        return result
+
+    # Same retry rules as send_mail, applied to the sub-requests that failed
+    policy = retry.default_policy
+    retry.metrics.record_call()
+    start = time.monotonic()
+    outcomes: Dict[str, Optional[Exception]] = {}
+    pending = dict(drafts)
+    attempt = 0
+    while pending:
+        attempt += 1
+        retry.metrics.record_attempt()
+        outcomes.update(await send_round(pending))
+
+        delays = []
+        retryable: Dict[str, Dict[str, Any]] = {}
+        elapsed = time.monotonic() - start
+        for key in pending:
+            error = outcomes[key]
+            if error is None:
+                continue
+            delay = policy.next_delay(error, attempt, elapsed, idempotent=False)
+            if delay is not None:
+                retryable[key] = pending[key]
+                delays.append(delay)
+        if not retryable:
+            break
+        # A batch-wide Retry-After applies to everyone waiting on it
+        await asyncio.sleep(max(delays))
+        pending = retryable
+
+    for key, error in await asyncio.gather(
+        *(send_single(key, d) for key, d in singles.items())
+    ):
+        outcomes[key] = error
+    return outcomes
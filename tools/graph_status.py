@@ -0,0 +1,88 @@
+from typing import Any, Dict
+from fastmcp import FastMCP
+from tools import (
+    attachment_cache,
+    concurrency,
+    config,
+    domain_policy,
+    drafts,
+    outbox,
+    rate_limit,
+    retry,
+)
+
+
+def register(mcp: FastMCP) -> None:
+    @mcp.tool
+    def get_graph_metrics() -> Dict[str, Any]:
+        """
+        Devuelve métricas del cliente de Microsoft Graph
+        (reintentos, límite de concurrencia adaptativo, latencias y,
+        por carril de prioridad, profundidad de cola y tiempos de espera).
+        """
+        metrics = {
+            "retry": retry.metrics.snapshot(),
+            "concurrency": concurrency.limiter.snapshot(),
+        }
+        if outbox.OUTBOX_ENABLED:
+            metrics["outbox_lanes"] = outbox.outbox.lane_stats()
+        return metrics
+
+    @mcp.tool
+    def get_rate_limit_status() -> Dict[str, Any]:
+        """
+        Estado de los límites de envío por buzón (mensajes/minuto, destinatarios/día).
+        """
+        return rate_limit.limiter.status()
+
+    @mcp.tool
+    def get_draft_store_stats() -> Dict[str, Any]:
+        """
+        Estado del almacén de borradores (tamaño, expirados, desalojados).
+        """
+        return drafts.store.stats()
+
+    @mcp.tool
+    def get_attachment_cache_stats() -> Dict[str, Any]:
+        """
+        Estado de la caché de adjuntos codificados (aciertos, tasa de acierto,
+        bytes ahorrados, uso de memoria y disco).
+        """
+        return attachment_cache.cache.stats()
+
+    @mcp.tool
+    def get_domain_policy() -> Dict[str, Any]:
+        """
+        Política de dominios vigente (reglas allow/deny, límites por dominio)
+        y estado de recarga del fichero de política, si está configurado.
+        """
+        policy = domain_policy.current(config.current().allowlist_policy)
+        return {
+            **policy.describe(),
+            "file": (
+                domain_policy.policy_file.status()
+                if domain_policy.policy_file is not None
+                else None
+            ),
+        }
+
+    @mcp.tool
+    def get_mailer_config() -> Dict[str, Any]:
+        """
+        Configuración vigente del mailer (allowlist, límites) con su versión
+        y el estado de las recargas.
+        """
+        return config.runtime.status()
+
+    @mcp.tool
+    def reload_mailer_config() -> Dict[str, Any]:
+        """
+        Vuelve a leer .env y aplica la nueva configuración sin reiniciar; las
+        variables de entorno del proceso prevalecen sobre .env, como al
+        arrancar. Si algún valor es inválido se mantiene la anterior.
+        """
+        try:
+            cfg = config.runtime.reload()
+        except config.ConfigError as e:
+            return {"error": str(e), "current": config.runtime.status()}
+        return {"status": "reloaded", **cfg.as_dict()}
@@ -0,0 +1,50 @@
+import os
+from typing import Set, Tuple
+
+
+class LocalPathError(ValueError):
+    """A local path is outside its configured directory, or none is configured."""
+
+
+_SQLITE_SUFFIXES = ("", "-wal", "-shm", "-journal")
+
+
+def _protected() -> Tuple[Set[str], Set[str]]:
+    """(file names, resolved paths) that hold secrets or server state."""
+    # Imported late: these modules (indirectly) import the users of this one
+    from tools import auth, config, drafts, outbox
+
+    names = {".env", os.path.basename(auth.CACHE_FILE)}
+    paths = [auth.CACHE_FILE, config.runtime.dotenv_path or ".env"]
+    for db in (drafts.DRAFT_STORE_DB, outbox.OUTBOX_DB):
+        paths.extend(db + suffix for suffix in _SQLITE_SUFFIXES)
+    return names, {os.path.realpath(os.path.expanduser(p)) for p in paths}
+
+
+def is_protected(resolved: str) -> bool:
+    """
+    True for the token cache, .env and the draft/outbox databases, which are
+    refused even under a configured directory (a cache or .env is refused by
+    name anywhere).
+    """
+    names, paths = _protected()
+    return os.path.basename(resolved) in names or resolved in paths
+
+
+def confine(path: str, root: str, setting: str) -> str:
+    """
+    Resolves `path` (symlinks included; relative paths are taken from `root`)
+    and returns it if it lies under `root`. Tools only read or write local
+    files under a directory the operator configured, so an empty `root`
+    refuses every path, and protected files are refused wherever they are.
+    `setting` names the variable in error messages.
+    """
+    if not root:
+        raise LocalPathError(f"{setting} is not set; local files are disabled")
+    base = os.path.realpath(os.path.expanduser(root))
+    resolved = os.path.realpath(os.path.join(base, os.path.expanduser(path)))
+    if os.path.commonpath([base, resolved]) != base:
+        raise LocalPathError(f"{path} is outside {setting}")
+    if is_protected(resolved):
+        raise LocalPathError(f"{path} is a protected file")
+    return resolved
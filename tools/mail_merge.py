@@ -0,0 +1,167 @@
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tools import local_files, row_sources
+from tools.templates import Template, TemplateError
+
+# --- config (leída al importar el módulo) ---
+# Accepted rows per mail merge batch (one draft holds the whole batch)
+MAIL_MERGE_MAX_ROWS = int(os.getenv("MAIL_MERGE_MAX_ROWS", "5000"))
+# Rejected rows listed in the prepare_mail_merge reply; the rest are only counted
+MAIL_MERGE_REJECTS_SHOWN = int(os.getenv("MAIL_MERGE_REJECTS_SHOWN", "50"))
+# rows_file must be a file under this directory; only inline rows are accepted
+# while it is empty
+MAIL_MERGE_DIR = os.getenv("MAIL_MERGE_DIR", "")
+
+# Draft "kind" of a mail merge batch; plain drafts have none
+MERGE = "merge"
+
+Row = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+class MergeError(ValueError):
+    """The batch as a whole is unusable (bad arguments or file, too many rows)."""
+
+
+class MergeTemplate:
+    """Subject and body templates, compiled once for every row of a batch."""
+
+    __slots__ = ("subject", "body", "content_type", "fields")
+
+    def __init__(self, subject: str, body: str, content_type: str = "Text") -> None:
+        self.subject = Template(subject)
+        self.body = Template(body, escape_html=content_type == "HTML")
+        self.content_type = content_type
+        self.fields = list(dict.fromkeys(self.subject.fields + self.body.fields))
+
+    def render(self, values: Dict[str, Any]) -> Tuple[str, str]:
+        return self.subject.render(values), self.body.render(values)
+
+
+def iter_source(rows: Optional[List[Any]], rows_file: Optional[str]) -> Iterator[Row]:
+    """(line, row, error) from exactly one of an inline list or a CSV/JSONL file."""
+    if (rows is None) == (rows_file is None):
+        raise MergeError("Pass exactly one of 'rows' or 'rows_file'")
+    if rows_file is not None:
+        try:
+            path = local_files.confine(rows_file, MAIL_MERGE_DIR, "MAIL_MERGE_DIR")
+            yield from row_sources.iter_rows(path)
+        except (local_files.LocalPathError, row_sources.RowSourceError) as e:
+            # Missing, not UTF-8 (possibly halfway through) or not allowed
+            raise MergeError(str(e)) from None
+        return
+    for line, row in enumerate(rows or (), 1):
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, "Row is not an object"
+
+
+def build_batch(
+    template: MergeTemplate,
+    source: Iterable[Row],
+    recipient_field: str,
+    check: Callable[[str, str, str], Optional[str]],
+    max_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Renders and validates each row as it streams in. `check(to, subject, body)`
+    returns why a rendered message is rejected, or None. Accepted rows keep
+    only the recipient and the fields the template uses; rendering again at
+    send time is cheap because the templates are already compiled.
+    """
+    max_rows = MAIL_MERGE_MAX_ROWS if max_rows is None else max_rows
+    accepted: List[List[Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    rejected_count = 0
+    seen: set[str] = set()
+    sample: Optional[Dict[str, Any]] = None
+
+    for line, row, error in source:
+        to = ""
+        if row is not None and error is None:
+            to = str(row.get(recipient_field) or "").strip()
+            error = _row_error(template, row, to, recipient_field, seen, check)
+        # Sources pair a missing row with its error
+        if row is None or error is not None:
+            rejected_count += 1
+            if len(rejected) < MAIL_MERGE_REJECTS_SHOWN:
+                rejected.append({"row": line, "to": to, "error": error})
+            continue
+        if len(accepted) >= max_rows:
+            raise MergeError(f"Too many rows (max {max_rows})")
+        seen.add(to.lower())
+        values = {f: _text(row[f]) for f in template.fields}
+        accepted.append([line, to, values])
+        if sample is None:
+            subject, body = template.render(values)
+            sample = {"to": to, "subject": subject, "body": body[:500]}
+
+    return {
+        "rows": accepted,
+        "rejected": rejected,
+        "rejected_count": rejected_count,
+        "sample": sample,
+    }
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _row_error(
+    template: MergeTemplate,
+    row: Dict[str, Any],
+    to: str,
+    recipient_field: str,
+    seen: set[str],
+    check: Callable[[str, str, str], Optional[str]],
+) -> Optional[str]:
+    if not to:
+        return f"Missing recipient field '{recipient_field}'"
+    if to.lower() in seen:
+        return "Duplicate recipient"
+    try:
+        subject, body = template.render(row)
+    except TemplateError as e:
+        return str(e)
+    return check(to, subject, body)
+
+
+def batch_data(
+    template: MergeTemplate,
+    rows: List[List[Any]],
+    attachments: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """The draft stored for a batch; the body template is stored like any body."""
+    data: Dict[str, Any] = {
+        "kind": MERGE,
+        "subject": template.subject.source,
+        "body": template.body.source,
+        "content_type": template.content_type,
+        "rows": rows,
+    }
+    if attachments:
+        data["attachments"] = attachments
+    return data
+
+
+def render_batch(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """One send-ready message per row of a stored batch, keyed by row number."""
+    template = MergeTemplate(data["subject"], data["body"], data["content_type"])
+    files = data.get("attachments")
+    messages: Dict[str, Dict[str, Any]] = {}
+    for line, to, values in data["rows"]:
+        subject, body = template.render(values)
+        message = {
+            "to": [to],
+            "cc": [],
+            "bcc": [],
+            "subject": subject,
+            "body": body,
+            "content_type": template.content_type,
+        }
+        if files:
+            message["attachments"] = files
+        messages[str(line)] = message
+    return messages
@@ -1,19 +1,37 @@
-import os
-import re
 from typing import Any, Dict, List, Literal, Optional
 
 from fastmcp import FastMCP
 
-# --- config (leída al importar el módulo) ---
-_ALLOWED_DOMAINS = {
-    d.strip().lower()
-    for d in os.getenv("ALLOWED_RECIPIENT_DOMAINS", "").split(",")
-    if d.strip()
-}
-MAX_RECIPIENTS = int(os.getenv("MAX_RECIPIENTS", "10"))
-MAX_BODY_CHARS = int(os.getenv("MAX_BODY_CHARS", "5000"))
-
-_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+from tools import config, domain_policy, validation
+
+
+def validate_message(
+    to: Optional[List[str]],
+    subject: str,
+    body: str,
+    cc: Optional[List[str]] = None,
+    bcc: Optional[List[str]] = None,
+    cfg: Optional[config.MailerConfig] = None,
+) -> validation.ValidationResult:
+    """Runs the shared validation engine with the mailer config snapshot `cfg`."""
+    cfg = cfg or config.current()
+    return validation.validate_message(
+        to,
+        subject,
+        body,
+        cc,
+        bcc,
+        policy=domain_policy.current(cfg.allowlist_policy),
+        max_recipients=cfg.max_recipients,
+        max_body_chars=cfg.max_body_chars,
+    )
+
+
+def _normalize_email(value: Optional[str]) -> Optional[str]:
+    """Trimmed address, or None when there is nothing to keep."""
+    if not value:
+        return None
+    return value.strip() or None
 
 
 def _normalize_emails(values: Optional[List[str]]) -> List[str]:
@@ -23,10 +41,8 @@ def _normalize_emails(values: Optional[List[str]]) -> List[str]:
     seen: set[str] = set()
     out: List[str] = []
     for v in values:
-        if not v:
-            continue
-        e = v.strip()
-        if not e:
+        e = _normalize_email(v)
+        if e is None:
             continue
         key = e.lower()
         if key not in seen:
@@ -36,17 +52,21 @@ def _normalize_emails(values: Optional[List[str]]) -> List[str]:
 
 
 def _is_valid_email(e: str) -> bool:
-    return bool(_EMAIL_RE.match(e.strip()))
+    return validation.split_address(e.strip()) is not None
 
 
-def _domain_allowed(e: str) -> bool:
+def _domain_allowed(
+    e: str, policy: Optional[domain_policy.DomainPolicy] = None
+) -> bool:
     """Allow all if allowlist is empty, otherwise require domain to be in allowlist."""
-    if not _ALLOWED_DOMAINS:
+    if policy is None:
+        policy = domain_policy.current(config.current().allowlist_policy)
+    if not policy.rules and policy.default == domain_policy.ALLOW:
         return True
     parts = e.split("@")
     if len(parts) != 2:
         return False
-    return parts[1].lower() in _ALLOWED_DOMAINS
+    return policy.allows(parts[1])
 
 
 def register(mcp: FastMCP) -> None:
@@ -63,72 +83,10 @@ def register(mcp: FastMCP) -> None:
         Prepara un email (preview) sin enviarlo.
         Devuelve un JSON con validaciones, destinatarios normalizados y un resumen del body.
         """
-        to_n = _normalize_emails(to)
-        cc_n = _normalize_emails(cc)
-        bcc_n = _normalize_emails(bcc)
-
-        all_rcpts = to_n + cc_n + bcc_n
-
-        issues: List[Dict[str, Any]] = []
-
-        if not to_n:
-            issues.append(
-                {
-                    "type": "missing_to",
-                    "message": "Debe existir al menos un destinatario en 'to'.",
-                }
-            )
-
-        if len(all_rcpts) > MAX_RECIPIENTS:
-            issues.append(
-                {
-                    "type": "too_many_recipients",
-                    "message": f"Demasiados destinatarios ({len(all_rcpts)}). Máximo: {MAX_RECIPIENTS}.",
-                    "max": MAX_RECIPIENTS,
-                    "count": len(all_rcpts),
-                }
-            )
-
-        invalid = [e for e in all_rcpts if not _is_valid_email(e)]
-        if invalid:
-            issues.append(
-                {
-                    "type": "invalid_email",
-                    "message": "Emails con formato inválido.",
-                    "items": invalid,
-                }
-            )
-
-        blocked = [
-            e for e in all_rcpts if _is_valid_email(e) and not _domain_allowed(e)
-        ]
-        if blocked:
-            issues.append(
-                {
-                    "type": "blocked_domain",
-                    "message": "Destinatarios fuera de la allowlist de dominios.",
-                    "items": blocked,
-                    "allowed_domains": sorted(_ALLOWED_DOMAINS),
-                }
-            )
-
-        if len(body) > MAX_BODY_CHARS:
-            issues.append(
-                {
-                    "type": "body_too_large",
-                    "message": f"Body demasiado largo ({len(body)} chars). Máximo: {MAX_BODY_CHARS}.",
-                    "max": MAX_BODY_CHARS,
-                    "count": len(body),
-                }
-            )
-
-        if not subject.strip():
-            issues.append(
-                {
-                    "type": "empty_subject",
-                    "message": "Subject vacío (permitido, pero no recomendado).",
-                }
-            )
+        cfg = config.current()
+        result = validate_message(to, subject, body, cc, bcc, cfg)
+        issues = result.issues
+        to_n, cc_n, bcc_n = result.to, result.cc, result.bcc
 
         ok = len(issues) == 0
         body_preview = body[:200] + ("…" if len(body) > 200 else "")
@@ -144,9 +102,11 @@ def register(mcp: FastMCP) -> None:
                 "body_length": len(body),
             },
             "policy": {
-                "allowed_domains": sorted(_ALLOWED_DOMAINS),
-                "max_recipients": MAX_RECIPIENTS,
-                "max_body_chars": MAX_BODY_CHARS,
+                "allowed_domains": sorted(result.policy.allowed),
+                "domain_policy": result.policy.describe(),
+                "max_recipients": cfg.max_recipients,
+                "max_body_chars": cfg.max_body_chars,
+                "config_version": cfg.version,
             },
             "next_step": "If ok=true, call prepare_email (next milestone) or proceed to confirm/send flow later.",
         }
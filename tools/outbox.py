@@ -0,0 +1,377 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from tools import auth, concurrency, graph_client, rate_limit, retry
+
+# --- config (leída al importar el módulo) ---
+OUTBOX_ENABLED = os.getenv("ENABLE_OUTBOX") == "1"
+OUTBOX_DB = os.getenv("OUTBOX_DB", "outbox.sqlite3")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "0.5"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "5"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "300"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    draft_id TEXT NOT NULL,
+    lane TEXT NOT NULL DEFAULT 'interactive',
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    lease_token TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+# Added after the first release; ALTERed into older databases on open
+_ADDED_COLUMNS = {
+    "lane": f"TEXT NOT NULL DEFAULT '{concurrency.INTERACTIVE}'",
+    "lease_token": "TEXT",
+}
+_LANE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS jobs_lane_ready ON jobs (lane, status, available_at)"
+)
+
+# Job lifecycle: queued -> sending -> sent | queued (retry) | dead
+QUEUED, SENDING, SENT, DEAD = "queued", "sending", "sent", "dead"
+
+
+class Outbox:
+    """
+    Durable send queue in SQLite (WAL mode).
+
+    Jobs are leased to one worker at a time. The worker renews its lease
+    while the send runs; a lease that is neither renewed nor completed before
+    it expires (worker crash, restart) makes the job available again, so
+    delivery is at-least-once across crashes. Each lease carries a token that
+    renew/complete/fail must present, so a worker whose lease was taken over
+    cannot overwrite the new holder's outcome. Ready jobs are leased
+    weighted-fair across priority lanes, so bulk backlogs don't delay
+    interactive sends.
+    """
+
+    def __init__(
+        self,
+        path: str = OUTBOX_DB,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db: Optional[sqlite3.Connection] = None
+        self._lanes = concurrency.WeightedLanes()
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never creates the database
+        if self._db is None:
+            db = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False, timeout=30
+            )
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            columns = [row["name"] for row in db.execute("PRAGMA table_info(jobs)")]
+            for name, ddl in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {ddl}")
+            db.execute(_LANE_INDEX)
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def enqueue(
+        self, draft_id: str, data: Dict[str, Any], lane: str = concurrency.INTERACTIVE
+    ) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, draft_id, lane, payload, status, available_at,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, draft_id, lane, json.dumps(data), QUEUED, now, now, now),
+            )
+        return job_id
+
+    def lease(self) -> Optional[Dict[str, Any]]:
+        """Claims the next ready job (or one whose lease expired), if any."""
+        now = time.time()
+        token = uuid.uuid4().hex
+        ready = (
+            "((status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?))"
+        )
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                lanes = [
+                    r[0]
+                    for r in conn.execute(
+                        f"SELECT DISTINCT lane FROM jobs WHERE {ready}",
+                        (QUEUED, now, SENDING, now),
+                    )
+                ]
+                lane = self._lanes.pick(lanes)
+                if lane is None:
+                    conn.execute("COMMIT")
+                    return None
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE lane = ? AND {ready}"
+                    " ORDER BY available_at LIMIT 1",
+                    (lane, QUEUED, now, SENDING, now),
+                ).fetchone()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1,"
+                    " lease_until = ?, lease_token = ?, updated_at = ? WHERE id = ?",
+                    (SENDING, now + self.lease_seconds, token, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = dict(row)
+        if job["attempts"] == 0:
+            # Time spent queued before the first delivery attempt
+            queue_waits.record_wait(lane, now - job["created_at"])
+        job["attempts"] += 1
+        job["lease_until"] = now + self.lease_seconds
+        job["lease_token"] = token
+        job["data"] = json.loads(job.pop("payload"))
+        return job
+
+    def renew(self, job_id: str, lease: str) -> bool:
+        """Extends a held lease by lease_seconds; False if it was lost."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ?"
+                " WHERE id = ? AND status = ? AND lease_token = ?",
+                (now + self.lease_seconds, now, job_id, SENDING, lease),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, lease: Optional[str] = None) -> bool:
+        """Marks the job sent; False if `lease` no longer holds it."""
+        return self._finish(job_id, lease, SENT, None, None)
+
+    def fail(
+        self,
+        job_id: str,
+        error: str,
+        retry_in: Optional[float],
+        lease: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Records a failed attempt. The job is requeued after `retry_in` seconds
+        unless it is not retryable (None) or out of attempts, then dead-lettered.
+        Returns the new status, or None if `lease` no longer holds the job.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if retry_in is not None and row is not None and row[0] < self.max_attempts:
+            status, available_at = QUEUED, time.time() + retry_in
+        else:
+            status, available_at = DEAD, None
+        if not self._finish(job_id, lease, status, error, available_at):
+            return None
+        return status
+
+    def _finish(
+        self,
+        job_id: str,
+        lease: Optional[str],
+        status: str,
+        error: Optional[str],
+        available_at: Optional[float],
+    ) -> bool:
+        now = time.time()
+        # Without a lease token the outcome is recorded unconditionally
+        fence = "" if lease is None else " AND status = ? AND lease_token = ?"
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, lease_until = NULL,"
+                " lease_token = NULL, available_at = COALESCE(?, available_at),"
+                f" updated_at = ? WHERE id = ?{fence}",
+                (status, error, available_at, now, job_id)
+                + (() if lease is None else (SENDING, lease)),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, draft_id, lane, status, attempts, available_at, last_error,"
+                " created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+    def lane_stats(self) -> Dict[str, Any]:
+        """Queue depth (queued jobs) and wait-time histogram per lane."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lane, COUNT(*) FROM jobs WHERE status = ? GROUP BY lane",
+                (QUEUED,),
+            ).fetchall()
+        depth = {lane: count for lane, count in rows}
+        waits = queue_waits.snapshot()
+        return {
+            lane: {"queued": depth.get(lane, 0), "wait_ms": waits.get(lane)}
+            for lane in dict.fromkeys([*depth, *waits])
+        }
+
+
+def _retry_delay(error: Exception, attempts: int) -> Optional[float]:
+    """Seconds before retrying a failed job, or None to dead-letter it."""
+    if retry.retry_reason(error, idempotent=False) is None:
+        return None
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    cap = min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * (2 ** (attempts - 1)))
+    return random.uniform(0, cap)
+
+
+class OutboxWorkerPool:
+    """Async workers that drain the outbox through the Graph send path."""
+
+    def __init__(self, box: Outbox, workers: int = OUTBOX_WORKERS) -> None:
+        self.box = box
+        self.workers = workers
+
+    async def process(self, job: Dict[str, Any]) -> str:
+        """
+        Delivers one leased job and records the outcome. Returns its new status
+        (SENDING if the lease was lost to another worker meanwhile). The lease
+        is renewed in the background for as long as the delivery runs.
+        """
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            status = await self._deliver(job)
+        finally:
+            heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await heartbeat
+        if status is None:
+            logging.warning(
+                f"Outbox job {job['id']}: lease lost before the outcome was recorded"
+            )
+            return SENDING
+        return status
+
+    async def _heartbeat(self, job: Dict[str, Any]) -> None:
+        interval = self.box.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            held = await asyncio.to_thread(
+                self.box.renew, job["id"], job["lease_token"]
+            )
+            if not held:
+                logging.warning(f"Outbox job {job['id']}: lease lost while sending")
+                return
+
+    async def _finish(self, method: Any, job: Dict[str, Any], *args: Any) -> Any:
+        return await asyncio.to_thread(
+            method, job["id"], *args, lease=job["lease_token"]
+        )
+
+    async def _deliver(self, job: Dict[str, Any]) -> Optional[str]:
+        data = job["data"]
+        # Tags the Graph requests below with the job's lane
+        concurrency.current_lane.set(job["lane"])
+
+        token_data = await auth.get_token_async()
+        if not token_data or "access_token" not in token_data:
+            # The operator may re-authenticate: keep the job for later
+            return await self._finish(
+                self.box.fail, job, "Authentication required", OUTBOX_RETRY_MAX_DELAY
+            )
+
+        mailbox = rate_limit.mailbox_for(token_data)
+        recipients = (
+            len(data["to"]) + len(data.get("cc") or []) + len(data.get("bcc") or [])
+        )
+        try:
+            await rate_limit.limiter.acquire(mailbox, recipients)
+        except rate_limit.RateLimitExceeded as e:
+            retry_in: Optional[float] = max(e.available_at - time.time(), 0.0)
+            return await self._finish(self.box.fail, job, str(e), retry_in)
+
+        # A failed or cancelled send is tried again later and charged then
+        sent = False
+        try:
+            await graph_client.send_mail_async(token_data["access_token"], data)
+            sent = True
+        except Exception as e:
+            retry_in = _retry_delay(e, job["attempts"])
+            status = await self._finish(self.box.fail, job, str(e), retry_in)
+            logging.warning(f"Outbox job {job['id']} failed ({status}): {e}")
+            return status
+        finally:
+            if not sent:
+                rate_limit.limiter.refund(mailbox, recipients)
+
+        if not await self._finish(self.box.complete, job):
+            return None
+        return SENT
+
+    async def _worker(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self.box.lease)
+            if job is None:
+                await asyncio.sleep(OUTBOX_POLL_SECONDS)
+                continue
+            try:
+                await self.process(job)
+            except Exception:
+                # Leave the lease to expire so the job is picked up again
+                logging.exception(f"Outbox worker crashed on job {job['id']}")
+
+    async def run(self) -> None:
+        tasks: List[asyncio.Task] = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+# Global singleton instances
+queue_waits = concurrency.LaneMetrics()
+outbox = Outbox()
+workers = OutboxWorkerPool(outbox)
@@ -0,0 +1,200 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Tuple
+
+# --- config (leída al importar el módulo) ---
+# Exchange Online defaults: 30 messages/minute, 10,000 recipients/day per mailbox
+MAIL_RATE_MESSAGES_PER_MINUTE = int(os.getenv("MAIL_RATE_MESSAGES_PER_MINUTE", "30"))
+MAIL_RATE_RECIPIENTS_PER_DAY = int(os.getenv("MAIL_RATE_RECIPIENTS_PER_DAY", "10000"))
+# Sends that would have to wait longer than this are rejected instead of queued
+MAIL_RATE_MAX_WAIT_SECONDS = float(os.getenv("MAIL_RATE_MAX_WAIT_SECONDS", "10"))
+
+
+class RateLimitExceeded(Exception):
+    """The send would exceed a mailbox limit; retry at `available_at`."""
+
+    def __init__(self, message: str, available_at: float) -> None:
+        super().__init__(message)
+        self.available_at = available_at
+
+    @property
+    def available_at_iso(self) -> str:
+        if math.isinf(self.available_at):
+            return "never"
+        return datetime.fromtimestamp(self.available_at, timezone.utc).isoformat()
+
+
+class TokenBucket:
+    """
+    Classic token bucket. Reservations may drive the level negative,
+    so later callers queue behind earlier ones.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._clock = clock
+        self._level = float(capacity)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._level = min(self.capacity, self._level + elapsed * self.refill_per_second)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (inf if it never fits)."""
+        if amount > self.capacity:
+            return math.inf
+        self._refill()
+        missing = amount - self._level
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_per_second
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self._level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Returns tokens taken for work that did not happen (never above capacity)."""
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "capacity": self.capacity,
+            "available": round(max(self._level, 0.0), 2),
+            "queued": round(max(-self._level, 0.0), 2),
+        }
+
+
+class MailboxRateLimiter:
+    """Per-mailbox limits on messages per minute and recipients per day."""
+
+    def __init__(
+        self,
+        messages_per_minute: int = MAIL_RATE_MESSAGES_PER_MINUTE,
+        recipients_per_day: int = MAIL_RATE_RECIPIENTS_PER_DAY,
+        max_wait_seconds: float = MAIL_RATE_MAX_WAIT_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.messages_per_minute = messages_per_minute
+        self.recipients_per_day = recipients_per_day
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self.accepted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.refunded = 0
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, mailbox: str) -> Tuple[TokenBucket, TokenBucket]:
+        if mailbox not in self._buckets:
+            self._buckets[mailbox] = (
+                TokenBucket(
+                    self.messages_per_minute, self.messages_per_minute / 60, self._clock
+                ),
+                TokenBucket(
+                    self.recipients_per_day,
+                    self.recipients_per_day / 86400,
+                    self._clock,
+                ),
+            )
+        return self._buckets[mailbox]
+
+    def reserve(self, mailbox: str, recipients: int, messages: int = 1) -> float:
+        """
+        Reserves capacity for a send and returns how long the caller must wait.
+        Raises RateLimitExceeded if that wait is longer than max_wait_seconds.
+        """
+        with self._lock:
+            message_bucket, recipient_bucket = self._buckets_for(mailbox)
+            wait = max(
+                message_bucket.wait_time(messages),
+                recipient_bucket.wait_time(recipients),
+            )
+            if wait > self.max_wait_seconds:
+                self.rejected += 1
+                raise RateLimitExceeded(
+                    f"Mailbox sending limit reached for {mailbox}.",
+                    available_at=time.time() + wait,
+                )
+            message_bucket.take(messages)
+            recipient_bucket.take(recipients)
+            if wait > 0:
+                self.delayed += 1
+            else:
+                self.accepted += 1
+            return wait
+
+    def refund(self, mailbox: str, recipients: int, messages: int = 1) -> None:
+        """
+        Returns capacity reserved for sends that did not go out (failed or
+        cancelled), so a retry is not charged twice.
+        """
+        with self._lock:
+            buckets = self._buckets.get(mailbox)
+            if buckets is None:
+                return
+            message_bucket, recipient_bucket = buckets
+            message_bucket.give_back(messages)
+            recipient_bucket.give_back(recipients)
+            self.refunded += 1
+
+    async def acquire(self, mailbox: str, recipients: int, messages: int = 1) -> None:
+        """
+        Reserves capacity, waiting (without blocking the loop) if needed. If
+        the wait is cancelled the reservation is refunded.
+        """
+        wait = self.reserve(mailbox, recipients, messages)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                self.refund(mailbox, recipients, messages)
+                raise
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            mailboxes = {
+                mailbox: {
+                    "messages_per_minute": messages.snapshot(),
+                    "recipients_per_day": recipients.snapshot(),
+                }
+                for mailbox, (messages, recipients) in self._buckets.items()
+            }
+            return {
+                "limits": {
+                    "messages_per_minute": self.messages_per_minute,
+                    "recipients_per_day": self.recipients_per_day,
+                    "max_wait_seconds": self.max_wait_seconds,
+                },
+                "accepted": self.accepted,
+                "delayed": self.delayed,
+                "rejected": self.rejected,
+                "refunded": self.refunded,
+                "mailboxes": mailboxes,
+            }
+
+
+# Global singleton instance
+limiter = MailboxRateLimiter()
+
+
+def mailbox_for(token_data: Dict[str, Any]) -> str:
+    """Mailbox key for a token: the signed-in user, or 'me' if unknown."""
+    claims = token_data.get("id_token_claims") or {}
+    return (claims.get("preferred_username") or "me").lower()
@@ -0,0 +1,293 @@
+import array
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from fastmcp import FastMCP
+
+from tools import config, domain_policy, local_files, mail_preview, row_sources
+
+# --- config (leída al importar el módulo) ---
+# Rejected rows listed in the import_recipients reply; the rest are only counted
+RECIPIENT_IMPORT_REJECTS_SHOWN = int(os.getenv("RECIPIENT_IMPORT_REJECTS_SHOWN", "50"))
+# Recipient lists are read from, and send plans written to, this directory only;
+# import_recipients is disabled while it is empty
+RECIPIENT_IMPORT_DIR = os.getenv("RECIPIENT_IMPORT_DIR", "")
+
+# Reject reasons, in the order rows are checked
+UNREADABLE = "unreadable"
+MISSING = "missing"
+INVALID = "invalid_email"
+BLOCKED = "blocked_domain"
+REASONS = (UNREADABLE, MISSING, INVALID, BLOCKED)
+
+# Distinct domains whose policy verdict is kept while importing one file
+_DOMAIN_CACHE_SIZE = 10_000
+
+
+class CompactHashSet:
+    """
+    Set of 64-bit key hashes in a single open-addressing array (8 bytes per
+    slot, at most half full), for de-duplicating millions of keys without
+    keeping the keys themselves. Two keys with the same 64-bit hash count as
+    one; for a million keys the odds of that are about 1 in 30 million.
+    """
+
+    __slots__ = ("_table", "_mask", "_len")
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        size = 1 << max(4, (2 * capacity - 1).bit_length())
+        self._table = array.array("q", bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+
+    def add(self, key: str) -> bool:
+        """Adds `key`; False when it was already present."""
+        # 0 marks an empty slot
+        h = hash(key) or 1
+        table = self._table
+        mask = self._mask
+        i = h & mask
+        slot = table[i]
+        while slot:
+            if slot == h:
+                return False
+            i = (i + 1) & mask
+            slot = table[i]
+        table[i] = h
+        self._len += 1
+        if 2 * self._len > mask:
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old = self._table
+        size = 2 * len(old)
+        table = array.array("q", bytes(8 * size))
+        mask = size - 1
+        for h in old:
+            if h:
+                i = h & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = h
+        self._table = table
+        self._mask = mask
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        return self._table.itemsize * len(self._table)
+
+
+class SendPlanWriter:
+    """
+    Packs recipients into chunks of at most `chunk_size` and writes each full
+    chunk to the plan file as one JSON line. Recipients under a domain rule
+    with a lower max_recipients fill chunks of their own sized to that cap,
+    so every chunk passes the same checks as prepare_email. At most one open
+    chunk per such rule (plus the general one) is held in memory.
+    """
+
+    def __init__(self, out: IO[str], chunk_size: int) -> None:
+        self._out = out
+        self.chunk_size = chunk_size
+        self._open: Dict[Optional[str], List[str]] = {}
+        self.chunks = 0
+
+    def add(self, address: str, rule: Optional[domain_policy.Rule] = None) -> None:
+        limit = self.chunk_size
+        key = None
+        if rule is not None and rule.max_recipients is not None:
+            if rule.max_recipients < limit:
+                limit = rule.max_recipients
+                key = rule.pattern
+        chunk = self._open.get(key)
+        if chunk is None:
+            chunk = self._open[key] = []
+        chunk.append(address)
+        if len(chunk) >= limit:
+            self._write(chunk)
+            del self._open[key]
+
+    def _write(self, recipients: List[str]) -> None:
+        self.chunks += 1
+        line = {
+            "chunk": self.chunks,
+            "count": len(recipients),
+            "recipients": recipients,
+        }
+        self._out.write(json.dumps(line) + "\n")
+
+    def close(self) -> None:
+        for chunk in self._open.values():
+            self._write(chunk)
+        self._open.clear()
+
+
+def default_plan_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.plan.jsonl"
+
+
+_PLAN_KEYS = {"chunk", "count", "recipients"}
+
+
+def _is_plan(path: str) -> bool:
+    """True when `path` is empty or starts with a send plan chunk line."""
+    with open(path, "rb") as f:
+        first = f.readline(1024 * 1024)
+    if not first:
+        return True
+    try:
+        line = json.loads(first)
+    except ValueError:
+        return False
+    return isinstance(line, dict) and line.keys() == _PLAN_KEYS
+
+
+def build_send_plan(
+    path: str,
+    plan_path: Optional[str] = None,
+    field: str = "email",
+    chunk_size: Optional[int] = None,
+    cfg: Optional[config.MailerConfig] = None,
+) -> Dict[str, Any]:
+    """
+    Streams a CSV/JSONL recipient list into a chunked send plan (JSONL, one
+    chunk per line) and returns a summary. Addresses are trimmed, validated
+    and domain-checked with the mail_preview rules and de-duplicated
+    case-insensitively, first occurrence kept. Memory does not grow with the
+    file except for 16-32 bytes per distinct address in the hash set.
+    """
+    started = time.perf_counter()
+    cfg = cfg or config.current()
+    policy = domain_policy.current(cfg.allowlist_policy)
+    # Same shortcut as _domain_allowed: no rules and allow by default
+    open_policy = not policy.rules and policy.default == domain_policy.ALLOW
+    capped = any(r.max_recipients is not None for r in policy.rules)
+    size = min(chunk_size or cfg.max_recipients, cfg.max_recipients)
+    if size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    path = local_files.confine(path, RECIPIENT_IMPORT_DIR, "RECIPIENT_IMPORT_DIR")
+    plan_path = local_files.confine(
+        plan_path or default_plan_path(path),
+        RECIPIENT_IMPORT_DIR,
+        "RECIPIENT_IMPORT_DIR",
+    )
+    if os.path.exists(plan_path) and not (
+        os.path.isfile(plan_path) and _is_plan(plan_path)
+    ):
+        raise ValueError(f"{plan_path} exists and is not a send plan; not replacing it")
+
+    normalize = mail_preview._normalize_email
+    is_valid = mail_preview._is_valid_email
+    domain_allowed = mail_preview._domain_allowed
+    seen = CompactHashSet()
+    domains: Dict[str, Tuple[bool, Optional[domain_policy.Rule]]] = {}
+    rejected = dict.fromkeys(REASONS, 0)
+    rejects: List[Dict[str, Any]] = []
+    rows = duplicates = 0
+
+    values = row_sources.iter_values(path, field)
+    # A fresh name, so an unrelated file next to the plan is never clobbered
+    fd, tmp = tempfile.mkstemp(
+        prefix=f"{os.path.basename(plan_path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(plan_path),
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            plan = SendPlanWriter(out, size)
+            for line, value, error in values:
+                rows += 1
+                address = normalize(value)
+                if error is not None:
+                    reason = UNREADABLE
+                elif address is None:
+                    reason = MISSING
+                elif not is_valid(address):
+                    reason = INVALID
+                elif not seen.add(address.lower()):
+                    duplicates += 1
+                    continue
+                elif open_policy:
+                    plan.add(address)
+                    continue
+                else:
+                    # Lists repeat a few domains, so each is looked up once
+                    domain = address.rpartition("@")[2].lower()
+                    verdict = domains.get(domain)
+                    if verdict is None:
+                        if len(domains) >= _DOMAIN_CACHE_SIZE:
+                            domains.clear()
+                        verdict = domains[domain] = (
+                            domain_allowed(address, policy),
+                            policy.match(domain) if capped else None,
+                        )
+                    if verdict[0]:
+                        plan.add(address, verdict[1])
+                        continue
+                    reason = BLOCKED
+                rejected[reason] += 1
+                if len(rejects) < RECIPIENT_IMPORT_REJECTS_SHOWN:
+                    entry = {"row": line, "value": value, "reason": reason}
+                    if error is not None:
+                        entry["error"] = error
+                    rejects.append(entry)
+            plan.close()
+        os.replace(tmp, plan_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+    total_rejected = sum(rejected.values())
+    return {
+        "plan_path": plan_path,
+        "rows": rows,
+        "accepted": rows - duplicates - total_rejected,
+        "duplicates": duplicates,
+        "rejected": total_rejected,
+        "rejected_by_reason": rejected,
+        "rejects": rejects,
+        "chunks": plan.chunks,
+        "chunk_size": size,
+        "dedup_bytes": seen.nbytes,
+        "config_version": cfg.version,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def register(mcp: FastMCP) -> None:
+    @mcp.tool
+    async def import_recipients(
+        path: str,
+        email_field: str = "email",
+        plan_path: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Importa una lista de destinatarios desde un fichero local CSV/JSONL
+        bajo RECIPIENT_IMPORT_DIR (leído en streaming), la normaliza, quita duplicados y la valida con
+        las reglas de preview_email. Escribe un plan de envío (JSONL, un chunk
+        de como máximo MAX_RECIPIENTS destinatarios por línea) y devuelve un
+        resumen con los rechazos. El plan se escribe en el mismo directorio
+        y solo sustituye a un plan anterior, nunca a otro fichero.
+        """
+        try:
+            return await asyncio.to_thread(
+                build_send_plan, path, plan_path, email_field, chunk_size
+            )
+        except ValueError as e:
+            # RowSourceError (unreadable file, no such column), a path outside
+            # RECIPIENT_IMPORT_DIR, a non-plan file in the way or bad chunk_size
+            return {"error": str(e)}
+        except OSError as e:
+            return {"error": f"Cannot write send plan: {e.strerror or e}"}
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# --- config (leída al importar el módulo) ---
+GRAPH_RETRY_MAX_ATTEMPTS = int(os.getenv("GRAPH_RETRY_MAX_ATTEMPTS", "4"))
+GRAPH_RETRY_BASE_DELAY = float(os.getenv("GRAPH_RETRY_BASE_DELAY", "0.5"))
+GRAPH_RETRY_MAX_DELAY = float(os.getenv("GRAPH_RETRY_MAX_DELAY", "30"))
+GRAPH_RETRY_DEADLINE_SECONDS = float(os.getenv("GRAPH_RETRY_DEADLINE_SECONDS", "60"))
+
+# Statuses where Graph did not process the request: always safe to resend
+_REJECTED_STATUSES = {429, 503}
+# Statuses where the request may or may not have been processed
+_AMBIGUOUS_STATUSES = {500, 502, 504}
+
+
+def retry_reason(error: Exception, idempotent: bool) -> Optional[str]:
+    """
+    Returns why `error` may be retried, or None if it must not be.
+
+    Non-idempotent calls (sendMail) are only retried when Graph certainly did
+    not act on the request, so an ambiguous failure never causes a double send.
+    """
+    status = getattr(error, "status", None)
+    if status in _REJECTED_STATUSES:
+        return str(status)
+    if status in _AMBIGUOUS_STATUSES:
+        return str(status) if idempotent else None
+    if status is None and hasattr(error, "request_sent"):
+        # Network error: safe if the request never left this process
+        if not error.request_sent or idempotent:
+            return "network"
+    return None
+
+
+class RetryMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.retry_after_honoured = 0
+        self.retries_by_reason: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def record_gave_up(self) -> None:
+        with self._lock:
+            self.gave_up += 1
+
+    def record_attempt(self) -> None:
+        with self._lock:
+            self.attempts += 1
+
+    def record_retry(self, reason: str, used_retry_after: bool) -> None:
+        with self._lock:
+            self.retries += 1
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+            if used_retry_after:
+                self.retry_after_honoured += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "gave_up": self.gave_up,
+                "retry_after_honoured": self.retry_after_honoured,
+                "retries_by_reason": dict(self.retries_by_reason),
+            }
+
+
+class RetryPolicy:
+    """Retry-After aware exponential backoff (full jitter) with a deadline budget."""
+
+    def __init__(
+        self,
+        max_attempts: int = GRAPH_RETRY_MAX_ATTEMPTS,
+        base_delay: float = GRAPH_RETRY_BASE_DELAY,
+        max_delay: float = GRAPH_RETRY_MAX_DELAY,
+        deadline_seconds: float = GRAPH_RETRY_DEADLINE_SECONDS,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+
+    def next_delay(
+        self, error: Exception, attempt: int, elapsed: float, idempotent: bool
+    ) -> Optional[float]:
+        """
+        Seconds to wait before attempt number `attempt + 1`,
+        or None when the call should give up and surface `error`.
+        """
+        reason = retry_reason(error, idempotent)
+        if reason is None:
+            return None
+        if attempt >= self.max_attempts:
+            metrics.record_gave_up()
+            return None
+
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = float(retry_after)
+        else:
+            cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+            delay = random.uniform(0, cap)
+
+        if elapsed + delay > self.deadline_seconds:
+            metrics.record_gave_up()
+            return None
+        metrics.record_retry(reason, retry_after is not None)
+        return delay
+
+
+# Global singleton instances
+metrics = RetryMetrics()
+default_policy = RetryPolicy()
+
+
+def call(
+    fn: Callable[[], T], idempotent: bool, policy: Optional[RetryPolicy] = None
+) -> T:
+    """Runs `fn` until it succeeds or the policy gives up (blocking sleeps)."""
+    policy = policy or default_policy
+    metrics.record_call()
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        metrics.record_attempt()
+        try:
+            return fn()
+        except Exception as e:
+            delay = policy.next_delay(e, attempt, time.monotonic() - start, idempotent)
+            if delay is None:
+                raise
+        time.sleep(delay)
+
+
+async def call_async(
+    fn: Callable[[], Awaitable[T]],
+    idempotent: bool,
+    policy: Optional[RetryPolicy] = None,
+) -> T:
+    """Async variant of call(); waits without blocking the event loop."""
+    policy = policy or default_policy
+    metrics.record_call()
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        metrics.record_attempt()
+        try:
+            return await fn()
+        except Exception as e:
+            delay = policy.next_delay(e, attempt, time.monotonic() - start, idempotent)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+CSV, JSONL = "csv", "jsonl"
+
+_EXTENSIONS = {".csv": CSV, ".jsonl": JSONL, ".ndjson": JSONL}
+
+
+class RowSourceError(ValueError):
+    """The row file cannot be read at all (missing, unknown format, not UTF-8)."""
+
+
+def detect_format(path: str) -> str:
+    fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise RowSourceError(
+            f"Unknown row file format for {path} (use .csv, .jsonl or .ndjson)"
+        )
+    return fmt
+
+
+def _not_utf8(path: str, e: UnicodeDecodeError) -> RowSourceError:
+    # Text is decoded a buffer at a time, so the bad byte cannot be pinned to
+    # a row and nothing after it can be read
+    return RowSourceError(f"{path} is not UTF-8 text ({e.reason}); save it as UTF-8")
+
+
+def iter_rows(
+    path: str,
+) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Streams a CSV (header row first) or JSONL file as (line, row, error),
+    one row at a time, so memory does not grow with the file. A row that
+    cannot be parsed comes back as (line, None, reason) instead of stopping
+    the whole file; a file that is not UTF-8 raises RowSourceError.
+    """
+    fmt = detect_format(path)
+    try:
+        f = open(path, "r", encoding="utf-8-sig", newline="")
+    except OSError as e:
+        raise RowSourceError(f"{path}: {e.strerror or e}") from None
+    with f:
+        try:
+            if fmt == CSV:
+                reader = csv.DictReader(f)
+                try:
+                    for row in reader:
+                        if None in row:
+                            yield reader.line_num, None, "More values than columns"
+                            continue
+                        yield reader.line_num, row, None
+                except csv.Error as e:
+                    yield reader.line_num, None, f"Invalid CSV: {e}"
+                return
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_num, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_num, None, "Row is not a JSON object"
+                    continue
+                yield line_num, row, None
+        except UnicodeDecodeError as e:
+            raise _not_utf8(path, e) from None
+
+
+def iter_values(
+    path: str, field: str
+) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Streams one column as (line, value, error): the fast path for files where
+    only one field matters (recipient lists). CSV rows are read as lists and
+    indexed by the header position instead of building a dict per row.
+    """
+    fmt = detect_format(path)
+    if fmt == JSONL:
+        for line_num, row, error in iter_rows(path):
+            if row is not None:
+                value = row.get(field)
+                if value is not None and not isinstance(value, str):
+                    value = str(value)
+                yield line_num, value, None
+            else:
+                yield line_num, None, error
+        return
+    try:
+        f = open(path, "r", encoding="utf-8-sig", newline="")
+    except OSError as e:
+        raise RowSourceError(f"{path}: {e.strerror or e}") from None
+    with f:
+        try:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            try:
+                index = header.index(field)
+            except ValueError:
+                raise RowSourceError(f"{path}: no '{field}' column") from None
+            try:
+                for fields in reader:
+                    if not fields:
+                        continue
+                    if index < len(fields):
+                        yield reader.line_num, fields[index], None
+                    else:
+                        yield reader.line_num, None, None
+            except csv.Error as e:
+                yield reader.line_num, None, f"Invalid CSV: {e}"
+        except UnicodeDecodeError as e:
+            raise _not_utf8(path, e) from None
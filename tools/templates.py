@@ -0,0 +1,49 @@
+import html
+import re
+from typing import Any, List, Mapping
+
+# "{{ field }}"; anything but braces may name a field (CSV headers have spaces)
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+
+class TemplateError(ValueError):
+    """A row lacks a field the template uses."""
+
+
+class Template:
+    """
+    A "{{ field }}" template compiled once into literal and field segments,
+    so rendering a row is a single join with no re-parsing. Values are
+    HTML-escaped when `escape_html` (HTML bodies); None renders as "".
+    """
+
+    __slots__ = ("source", "fields", "_literals", "_names", "_escape_html")
+
+    def __init__(self, source: str, escape_html: bool = False) -> None:
+        self.source = source
+        self._escape_html = escape_html
+        # literals[i] precedes names[i]; the last literal ends the text
+        self._literals: List[str] = []
+        self._names: List[str] = []
+        pos = 0
+        for match in _PLACEHOLDER_RE.finditer(source):
+            self._literals.append(source[pos : match.start()])
+            self._names.append(match.group(1))
+            pos = match.end()
+        self._literals.append(source[pos:])
+        self.fields: List[str] = list(dict.fromkeys(self._names))
+
+    def render(self, row: Mapping[str, Any]) -> str:
+        literals = self._literals
+        out = [literals[0]]
+        for i, name in enumerate(self._names, 1):
+            try:
+                value = row[name]
+            except KeyError:
+                raise TemplateError(f"Missing field '{name}'") from None
+            value = "" if value is None else str(value)
+            if self._escape_html:
+                value = html.escape(value)
+            out.append(value)
+            out.append(literals[i])
+        return "".join(out)
@@ -0,0 +1,177 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import domain_policy
+
+# One match both validates an address and splits it into (local, domain)
+_ADDRESS_RE = re.compile(r"^([^@\s]+)@([^@\s]+\.[^@\s]+)$")
+
+FIELDS = ("to", "cc", "bcc")
+
+
+def split_address(address: str) -> Optional[Tuple[str, str]]:
+    """(local, domain) of a well-formed address, or None."""
+    match = _ADDRESS_RE.match(address)
+    return (match.group(1), match.group(2)) if match else None
+
+
+class ValidationResult:
+    """Outcome of validating one message: normalized recipients and issues."""
+
+    def __init__(self, policy: domain_policy.DomainPolicy) -> None:
+        self.recipients: Dict[str, List[str]] = {field: [] for field in FIELDS}
+        self.invalid: List[str] = []
+        self.blocked: List[str] = []
+        self.issues: List[Dict[str, Any]] = []
+        # The domain policy the recipients were checked against
+        self.policy = policy
+
+    @property
+    def to(self) -> List[str]:
+        return self.recipients["to"]
+
+    @property
+    def cc(self) -> List[str]:
+        return self.recipients["cc"]
+
+    @property
+    def bcc(self) -> List[str]:
+        return self.recipients["bcc"]
+
+    @property
+    def count(self) -> int:
+        return sum(len(values) for values in self.recipients.values())
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+    def issue(self, issue_type: str) -> Optional[Dict[str, Any]]:
+        return next((i for i in self.issues if i["type"] == issue_type), None)
+
+
+def validate_message(
+    to: Optional[List[str]],
+    subject: str,
+    body: str,
+    cc: Optional[List[str]] = None,
+    bcc: Optional[List[str]] = None,
+    *,
+    policy: domain_policy.DomainPolicy,
+    max_recipients: int,
+    max_body_chars: int,
+) -> ValidationResult:
+    """
+    Validates a message in one pass over its recipients.
+
+    Each address is trimmed, de-duplicated (case-insensitive, per field,
+    first spelling kept), matched and split once, and its domain checked
+    against `policy`, which caches its decisions. Issues come back in a
+    fixed order.
+    """
+    result = ValidationResult(policy)
+    # (pattern, max_recipients, addresses) per rule that carries its own cap
+    per_rule: Dict[int, Tuple[str, int, List[str]]] = {}
+
+    for field, values in zip(FIELDS, (to, cc, bcc)):
+        out = result.recipients[field]
+        seen: set = set()
+        for value in values or ():
+            if not value:
+                continue
+            address = value.strip()
+            if not address:
+                continue
+            key = address.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append(address)
+
+            parts = _ADDRESS_RE.match(address)
+            if parts is None:
+                result.invalid.append(address)
+                continue
+            rule = policy.match(parts.group(2))
+            if (rule.action if rule else policy.default) != domain_policy.ALLOW:
+                result.blocked.append(address)
+            elif rule is not None and rule.max_recipients is not None:
+                capped = per_rule.get(id(rule))
+                if capped is None:
+                    capped = per_rule[id(rule)] = (
+                        rule.pattern,
+                        rule.max_recipients,
+                        [],
+                    )
+                capped[2].append(address)
+
+    issues = result.issues
+    if not result.to:
+        issues.append(
+            {
+                "type": "missing_to",
+                "message": "Debe existir al menos un destinatario en 'to'.",
+            }
+        )
+
+    count = result.count
+    if count > max_recipients:
+        issues.append(
+            {
+                "type": "too_many_recipients",
+                "message": f"Demasiados destinatarios ({count}). Máximo: {max_recipients}.",
+                "max": max_recipients,
+                "count": count,
+            }
+        )
+
+    if result.invalid:
+        issues.append(
+            {
+                "type": "invalid_email",
+                "message": "Emails con formato inválido.",
+                "items": result.invalid,
+            }
+        )
+
+    if result.blocked:
+        issues.append(
+            {
+                "type": "blocked_domain",
+                "message": "Destinatarios fuera de la allowlist de dominios.",
+                "items": result.blocked,
+                "allowed_domains": sorted(policy.allowed),
+            }
+        )
+
+    for pattern, limit, matched in per_rule.values():
+        if len(matched) > limit:
+            issues.append(
+                {
+                    "type": "domain_recipient_limit",
+                    "message": f"Demasiados destinatarios para {pattern} ({len(matched)}). Máximo: {limit}.",
+                    "domain": pattern,
+                    "max": limit,
+                    "count": len(matched),
+                }
+            )
+
+    if len(body) > max_body_chars:
+        issues.append(
+            {
+                "type": "body_too_large",
+                "message": f"Body demasiado largo ({len(body)} chars). Máximo: {max_body_chars}.",
+                "max": max_body_chars,
+                "count": len(body),
+            }
+        )
+
+    if not subject.strip():
+        issues.append(
+            {
+                "type": "empty_subject",
+                "message": "Subject vacío (permitido, pero no recomendado).",
+            }
+        )
+
+    return result